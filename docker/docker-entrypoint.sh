@@ -34,7 +34,11 @@ if [ "$1" == "run" ]; then
     wait_solr
     install_crontab
     init
-    exec gunicorn --bind=0.0.0.0:$EDW_RUN_WEB_PORT --access-logfile=- --error-logfile=- ecolex.wsgi:application
+    # metrics of the previous run would be summed with the new ones
+    rm -rf ${PROMETHEUS_MULTIPROC_DIR:-logs/metrics}
+    # pages rendered by the previous release
+    rm -rf ${EDW_RUN_WEB_CACHE_DIR:-cache/shared}
+    exec gunicorn --config=ecolex/gunicorn_conf.py --bind=0.0.0.0:$EDW_RUN_WEB_PORT --access-logfile=- --error-logfile=- ecolex.wsgi:application
 elif [ "$1" == "init_dev" ]; then
     wait_sql
     wait_solr
@@ -19,3 +19,7 @@ echo `/bin/date` ": Finished Decision importer"
 echo `/bin/date` ": Started Court decision importer"
 $PYTHONPATH/python $ECOLEX_HOME/ecolex/manage.py import court_decision
 echo `/bin/date` ": Finished Court decision importer"
+
+echo `/bin/date` ": Started cache warming"
+$PYTHONPATH/python $ECOLEX_HOME/ecolex/manage.py warm_caches
+echo `/bin/date` ": Finished cache warming"
@@ -1,6 +1,7 @@
 
 def global_config(request):
     from django.conf import settings
+    from ecolex import resilience
     expose_settings = [
         'STATIC_URL',
         'GA_CODE',
@@ -21,4 +22,5 @@ def global_config(request):
 
     return {
         'settings': exposed_settings,
+        'solr_stale': resilience.is_stale(),
     }
@@ -54,7 +54,6 @@ class BaseFacetViewSet(ApiViewMixin,
                 return []
 
         searcher = Searcher(data, language=language)
-        response = searcher.search()
 
         facet = {
             'field': field,
@@ -0,0 +1,299 @@
+"""
+Caches shared by the web workers and the importers.
+
+`TwoTierCache` is a Django cache backend keeping a small, bounded LRU in each
+process in front of a shared backend (the cache alias given as LOCATION, e.g.
+a `FileCache`). Workers read what the others stored, while hot entries
+are served from memory. Local copies live at most LOCAL_TIMEOUT seconds, so
+changes made through other processes (e.g. invalidations by the importers)
+are seen after that delay at the latest.
+
+`FileCache` is Django's file based cache without the culling on every write,
+which lists the whole directory and then drops a random third of the entries.
+The `cull_cache` command, run from cron, removes the expired entries and then
+the least recently written ones, mostly those orphaned by invalidations.
+
+`Namespace` groups related entries under a version stamp: `invalidate()`
+replaces the stamp, which orphans all the entries of the namespace at once.
+
+Stamps only reach the processes sharing the cache backend. The keys also
+include the index generation (`ecolex.models.IndexGeneration`), bumped by
+the importers in the database and polled by every process at most each
+`generation_poll` seconds, so changes are seen on all the hosts too. An
+import run is wrapped in `index_changes()`, so the generation is bumped once
+when it ends rather than for every document.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import DatabaseError
+from django.utils.functional import cached_property
+
+from ecolex import metrics, resilience
+from ecolex.models import IndexGeneration
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalLRU(object):
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ The pickled value of `key`, or `None`. """
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return None
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires):
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TwoTierCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._shared_alias = location
+        options = params.get('OPTIONS', {})
+        self._local_timeout = int(options.get('LOCAL_TIMEOUT', 30))
+        self._local = LocalLRU(self._max_entries)
+
+    @cached_property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _shared_timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def _remember(self, key, value, timeout=DEFAULT_TIMEOUT):
+        expires = time.time() + self._local_timeout
+        backend_expires = self.get_backend_timeout(timeout)
+        if backend_expires is not None:
+            expires = min(expires, backend_expires)
+        self._local.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        expires)
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version)
+        pickled = self._local.get(local_key)
+        if pickled is not None:
+            return pickle.loads(pickled)
+        value = self.shared.get(local_key)
+        if value is None:
+            return default
+        self._remember(local_key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_key(key, version)
+        self.shared.set(local_key, value, self._shared_timeout(timeout))
+        self._remember(local_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_key(key, version)
+        added = self.shared.add(local_key, value,
+                                self._shared_timeout(timeout))
+        if added:
+            self._remember(local_key, value, timeout)
+        return added
+
+    def delete(self, key, version=None):
+        local_key = self.make_key(key, version)
+        self._local.delete(local_key)
+        self.shared.delete(local_key)
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+
+class FileCache(FileBasedCache):
+
+    def _cull(self):
+        pass
+
+    def cull(self):
+        """ Remove the expired entries, then the oldest ones above
+            MAX_ENTRIES. Returns the number of entries removed.
+        """
+        removed = 0
+        entries = []
+        for fname in self._list_cache_files():
+            try:
+                with open(fname, 'rb') as f:
+                    if self._is_expired(f):
+                        removed += 1
+                        continue
+                entries.append((os.path.getmtime(fname), fname))
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+        entries.sort()
+        for mtime, fname in entries[:max(len(entries) - self._max_entries, 0)]:
+            self._delete(fname)
+            removed += 1
+        return removed
+
+
+def get_search_cache_settings():
+    defaults = {
+        'enabled': True,
+        'cache': 'search',
+        'generation_poll': 5,
+    }
+    defaults.update(getattr(settings, 'SEARCH_CACHE', {}))
+    return defaults
+
+
+class Generation(object):
+    """ The index generation, as last read from the database. """
+
+    def __init__(self):
+        self._value = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        interval = get_search_cache_settings()['generation_poll']
+        with self._lock:
+            now = time.monotonic()
+            if self._value is None or now - self._checked >= interval:
+                self._checked = now
+                try:
+                    self._value = IndexGeneration.current()
+                except DatabaseError:
+                    logger.exception('Error reading the index generation')
+                    if self._value is None:
+                        self._value = 0
+            return self._value
+
+    def bump(self):
+        try:
+            IndexGeneration.bump()
+        except DatabaseError:
+            logger.exception('Error bumping the index generation')
+        with self._lock:
+            self._value = None
+
+
+GENERATION = Generation()
+
+
+class Namespace(object):
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[get_search_cache_settings()['cache']]
+
+    @property
+    def enabled(self):
+        return get_search_cache_settings()['enabled']
+
+    def stamp(self):
+        key = 'namespace:{}'.format(self.name)
+        stamp = self.cache.get(key)
+        if stamp is None:
+            self.cache.add(key, uuid.uuid4().hex, None)
+            stamp = self.cache.get(key)
+        return stamp
+
+    def key(self, *parts):
+        digest = hashlib.md5('\n'.join(map(str, parts)).encode('utf-8'))
+        return '{}:{}:{}:{}'.format(self.name, GENERATION.get(), self.stamp(),
+                                    digest.hexdigest())
+
+    def get_or_compute(self, parts, compute):
+        """ The cached value for `parts`, else the result of `compute()`,
+            which is stored unless it is `None` or built from stale data.
+        """
+        if not self.enabled:
+            return compute()
+        key = self.key(*parts)
+        value = self.cache.get(key)
+        metrics.cache_lookup(self.name, value is not None)
+        if value is None:
+            value = compute()
+            if value is not None and not resilience.is_stale():
+                self.cache.set(key, value, self.timeout)
+        return value
+
+    def invalidate(self):
+        self.cache.delete('namespace:{}'.format(self.name))
+
+
+FACETS = Namespace('facets', 6 * 3600)
+COUNTS = Namespace('counts', 6 * 3600)
+DETAILS = Namespace('details', 7 * 24 * 3600)
+REDIRECTS = Namespace('redirects', 7 * 24 * 3600)
+
+
+_changes = threading.local()
+
+
+def invalidate_search():
+    """ After the index changed: facets, counts and redirects are stale here
+        at once, everything else elsewhere once the new generation is seen.
+        Within `index_changes()`, this is deferred to the end of the block.
+    """
+    if getattr(_changes, 'depth', 0):
+        _changes.pending = True
+        return
+    GENERATION.bump()
+    for namespace in (FACETS, COUNTS, REDIRECTS):
+        namespace.invalidate()
+
+
+@contextmanager
+def index_changes():
+    """ Group the changes of an import run: the search caches are
+        invalidated once, when the outermost block ends.
+    """
+    depth = getattr(_changes, 'depth', 0)
+    if not depth:
+        _changes.pending = False
+    _changes.depth = depth + 1
+    try:
+        yield
+    finally:
+        _changes.depth = depth
+        if not depth and _changes.pending:
+            _changes.pending = False
+            invalidate_search()
@@ -0,0 +1,874 @@
+"""
+An in-memory Solr stand-in, for tests and benchmarks without a Solr server.
+
+It implements the part of the Solr HTTP API used by scorched (xsearch), pysolr
+(search, EcolexSolr) and the importers:
+
+- select: q / fq in a Lucene query subset (fields, phrases, ranges, groups,
+  AND / OR / NOT, wildcards), {!tag} / {!ex} local params, facet fields,
+  stats, highlighting of the query terms, spellcheck stubs, grouping by
+  field, sorting, fl, start / rows and cursorMark;
+- update and update/json: adds and deletes in the XML and JSON formats,
+  commits are no-ops;
+- update/extract: returns the uploaded file decoded as text;
+- schema, admin/ping and admin/cores STATUS.
+
+Documents are normalized with the repository's solr/schema.xml, when found:
+multi-valued fields hold lists, numbers and booleans are typed, copyFields
+are applied and fields that are not stored are left out of the results.
+Relevance is not emulated: documents are returned in insertion order unless a
+sort is given. Every path below the server root holds its own index, so
+`http://host:port/solr/ecolex/` and `.../solr/ecolex_build/` are separate.
+
+    server = start_server(documents=load_fixtures('docs.json'))
+    settings.SOLR_URI = server.url + 'solr/ecolex/'
+    ...
+    server.stop()
+"""
+
+import base64
+import cgi
+import fnmatch
+import json
+import os
+import re
+import socketserver
+import threading
+from collections import Counter, OrderedDict
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import lxml.etree as ET
+
+
+class QueryError(ValueError):
+    pass
+
+
+# Query parsing
+
+LOCAL_PARAMS = re.compile(r'^\{!([^}]*)\}')
+TOKENS = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<lparen>\()
+  | (?P<rparen>\))
+  | (?P<phrase>"(?:[^"\\]|\\.)*")
+  | (?P<range>[\[{](?:[^\]}\\]|\\.)*[\]}])
+  | (?P<word>(?:[^\s()"\\:]|\\.)+)
+  | (?P<colon>:)
+''', re.VERBOSE)
+ESCAPE = re.compile(r'\\(.)')
+WORD = re.compile(r'\w+')
+
+
+def parse_local_params(text):
+    """ '{!tag=a ex=b,c}rest' -> ({'tag': 'a', 'ex': 'b,c'}, 'rest') """
+    match = LOCAL_PARAMS.match(text or '')
+    if not match:
+        return {}, text or ''
+    params = dict(
+        item.split('=', 1) if '=' in item else (item, '')
+        for item in match.group(1).split()
+    )
+    return params, text[match.end():]
+
+
+def tokenize(text):
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = TOKENS.match(text, position)
+        if not match:
+            raise QueryError('Cannot parse query: {}'.format(text))
+        kind = match.lastgroup
+        if kind != 'space':
+            tokens.append((kind, match.group()))
+        position = match.end()
+    return tokens
+
+
+def unescape(text):
+    return ESCAPE.sub(r'\1', text)
+
+
+def as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def to_text(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def compare_key(value):
+    """ Numbers compare as numbers, anything else (e.g. dates) as text. """
+    try:
+        return (0, float(value), '')
+    except (TypeError, ValueError):
+        return (1, 0, to_text(value))
+
+
+def compare_keys(value, other):
+    try:
+        return float(value), float(other)
+    except (TypeError, ValueError):
+        return to_text(value), to_text(other)
+
+
+class Term(object):
+
+    def __init__(self, field, kind, value):
+        self.field = field
+        self.kind = kind
+        self.value = value
+
+    def words(self):
+        if self.kind in ('word', 'phrase'):
+            return WORD.findall(self.value.lower())
+        return []
+
+    def match_value(self, value):
+        text = to_text(value)
+        if self.kind == 'range':
+            low, high, include_low, include_high = self.value
+            if low != '*':
+                key, low_key = compare_keys(value, low)
+                if key < low_key or (key == low_key and not include_low):
+                    return False
+            if high != '*':
+                key, high_key = compare_keys(value, high)
+                if key > high_key or (key == high_key and not include_high):
+                    return False
+            return True
+        if self.kind == 'word' and ('*' in self.value or '?' in self.value):
+            return fnmatch.fnmatchcase(text.lower(), self.value.lower())
+        if text.lower() == self.value.lower():
+            return True
+        # a text field matches if it holds the words of the term, in order
+        # for phrases
+        words = self.words()
+        if not words:
+            return False
+        value_words = WORD.findall(text.lower())
+        if self.kind == 'phrase':
+            size = len(words)
+            return any(value_words[i:i + size] == words
+                       for i in range(len(value_words) - size + 1))
+        return all(word in value_words for word in words)
+
+    def __call__(self, doc):
+        if self.field == '*' and self.kind == 'word' and self.value == '*':
+            return True
+        if self.field is None:
+            values = [value for field_values in doc.values()
+                      for value in as_list(field_values)]
+        elif '*' in self.field:
+            values = [value for name, field_values in doc.items()
+                      if fnmatch.fnmatchcase(name, self.field)
+                      for value in as_list(field_values)]
+        else:
+            values = as_list(doc.get(self.field))
+        if self.kind == 'word' and self.value == '*':
+            return bool(values)
+        return any(self.match_value(value) for value in values)
+
+
+class Parser(object):
+    """ Recursive descent parser for the Lucene syntax used by the site.
+
+        query   := clause+   (joined by AND / OR, or by the default op)
+        clause  := [NOT | - | +] (group | field ':' value | value)
+        value   := group | phrase | range | word
+    """
+
+    def __init__(self, text, default_op='OR'):
+        self.tokens = tokenize(text)
+        self.position = 0
+        self.default_op = default_op.upper()
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            return lambda doc: True
+        predicate = self.expression(None)
+        if self.peek()[0] is not None:
+            raise QueryError('Unexpected {}'.format(self.peek()[1]))
+        return predicate
+
+    def expression(self, field):
+        # AND binds tighter than OR, as in Solr's standard parser: the
+        # clauses are split into OR-ed groups of AND-ed clauses
+        groups = [[]]
+        operator = None
+        while True:
+            kind, value = self.peek()
+            if kind is None or kind == 'rparen':
+                break
+            if kind == 'word' and value in ('AND', '&&', 'OR', '||'):
+                self.take()
+                operator = 'OR' if value in ('OR', '||') else 'AND'
+                continue
+
+            negate = required = False
+            if kind == 'word' and value in ('NOT', '!'):
+                self.take()
+                negate = True
+            elif kind == 'word' and len(value) > 1 and value[0] in '+-':
+                # split the prefix off the term
+                self.tokens[self.position] = (kind, value[1:])
+                negate, required = value[0] == '-', value[0] == '+'
+            clause = self.clause(field)
+            if negate:
+                clause = negated(clause)
+
+            if (operator or self.default_op) == 'OR' and groups[-1] and \
+                    not negate and not required:
+                groups.append([])
+            groups[-1].append(clause)
+            operator = None
+
+        groups = [group for group in groups if group]
+
+        def predicate(doc):
+            return any(all(clause(doc) for clause in group)
+                       for group in groups)
+        return predicate
+
+    def clause(self, field):
+        kind, value = self.take()
+        if kind == 'lparen':
+            predicate = self.expression(field)
+            self.expect('rparen')
+            return predicate
+        if kind == 'word' and self.peek()[0] == 'colon':
+            self.take()
+            return self.value(unescape(value))
+        return self.term(field, kind, value)
+
+    def value(self, field):
+        kind, value = self.peek()
+        if kind == 'lparen':
+            self.take()
+            predicate = self.expression(field)
+            self.expect('rparen')
+            return predicate
+        self.take()
+        return self.term(field, kind, value)
+
+    def term(self, field, kind, value):
+        if kind == 'phrase':
+            return Term(field, 'phrase', unescape(value[1:-1]))
+        if kind == 'range':
+            include_low = value[0] == '['
+            include_high = value[-1] == ']'
+            parts = re.split(r'\s+TO\s+', value[1:-1].strip())
+            if len(parts) != 2:
+                raise QueryError('Bad range {}'.format(value))
+            low, high = (unescape(part.strip('"')) for part in parts)
+            return Term(field, 'range',
+                        (low, high, include_low, include_high))
+        if kind == 'word':
+            return Term(field, 'word', unescape(value))
+        raise QueryError('Unexpected {}'.format(value))
+
+    def expect(self, kind):
+        if self.take()[0] != kind:
+            raise QueryError('Expected {}'.format(kind))
+
+
+def negated(predicate):
+    return lambda doc: not predicate(doc)
+
+
+def parse_query(text, default_op='OR'):
+    text = (text or '').strip()
+    if text in ('', '*', '*:*'):
+        return lambda doc: True
+    return Parser(text, default_op).parse()
+
+
+# Schema
+
+DEFAULT_SCHEMA = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'solr', 'schema.xml')
+
+CONVERTERS = {
+    'IntPointField': int, 'TrieIntField': int,
+    'LongPointField': int, 'TrieLongField': int,
+    'FloatPointField': float, 'TrieFloatField': float,
+    'DoublePointField': float, 'TrieDoubleField': float,
+    'BoolField': lambda value: to_text(value).lower() == 'true',
+}
+
+
+class Schema(object):
+
+    def __init__(self, path):
+        root = ET.parse(path).getroot()
+        self.types = {
+            elem.get('name'): elem for elem in root.iter('fieldType')
+        }
+        self.fields = {elem.get('name'): elem for elem in root.iter('field')}
+        self.dynamic_fields = [elem for elem in root.iter('dynamicField')]
+        self.copy_fields = [
+            (elem.get('source'), elem.get('dest'))
+            for elem in root.iter('copyField')
+        ]
+        self._cache = {}
+
+    def field(self, name):
+        """ (multi-valued, stored, converter) of a field. """
+        if name not in self._cache:
+            elem = self.fields.get(name)
+            if elem is None:
+                elem = next((dynamic for dynamic in self.dynamic_fields
+                             if fnmatch.fnmatchcase(name, dynamic.get('name'))),
+                            None)
+            if elem is None:
+                self._cache[name] = (None, True, None)
+            else:
+                field_type = self.types.get(elem.get('type'))
+                attrs = dict(field_type.attrib if field_type is not None
+                             else {})
+                attrs.update(elem.attrib)
+                type_class = attrs.get('class', '').rsplit('.', 1)[-1]
+                self._cache[name] = (attrs.get('multiValued') == 'true',
+                                     attrs.get('stored', 'true') == 'true',
+                                     CONVERTERS.get(type_class))
+        return self._cache[name]
+
+    def prepare(self, doc):
+        prepared = OrderedDict()
+
+        def add(name, values):
+            multi, _, convert = self.field(name)
+            values = [convert(value) if convert else value
+                      for value in values if value is not None]
+            if not values:
+                return
+            if multi or (multi is None and name in prepared):
+                prepared[name] = as_list(prepared.get(name)) + values
+            elif multi is None and len(values) > 1:
+                prepared[name] = values
+            else:
+                prepared[name] = values[0]
+
+        for name, value in doc.items():
+            add(name, as_list(value))
+        for source, dest in self.copy_fields:
+            for name, value in doc.items():
+                if fnmatch.fnmatchcase(name, source):
+                    add(dest, as_list(value))
+        return prepared
+
+    def stored(self, name):
+        return self.field(name)[1]
+
+
+# Index
+
+class Params(object):
+    """ Request parameters, with Solr's per-field overrides (f.x.facet.y). """
+
+    def __init__(self, items):
+        self.items = items
+
+    def get(self, name, default=None):
+        for key, value in self.items:
+            if key == name:
+                return value
+        return default
+
+    def getlist(self, name):
+        return [value for key, value in self.items if key == name]
+
+    def field(self, field, name, default=None):
+        return self.get('f.{}.{}'.format(field, name),
+                        self.get(name, default))
+
+    def bool(self, name):
+        return (self.get(name) or '').lower() in ('true', 'on', '1')
+
+
+class Index(object):
+
+    def __init__(self, name, schema=None):
+        self.name = name
+        self.schema = schema
+        self.docs = OrderedDict()
+        self.lock = threading.RLock()
+
+    def add(self, docs):
+        with self.lock:
+            for doc in docs:
+                if self.schema:
+                    doc = self.schema.prepare(doc)
+                self.docs[to_text(doc['id'])] = doc
+
+    def delete(self, ids=(), queries=()):
+        with self.lock:
+            for doc_id in ids:
+                self.docs.pop(to_text(doc_id), None)
+            for query in queries:
+                predicate = parse_query(query)
+                for doc_id in [doc_id for doc_id, doc in self.docs.items()
+                               if predicate(doc)]:
+                    del self.docs[doc_id]
+
+    def schema_info(self):
+        if self.schema:
+            fields = [dict(elem.attrib) for elem in self.schema.fields.values()]
+            dynamic = [dict(elem.attrib) for elem in self.schema.dynamic_fields]
+        else:
+            names = sorted({name for doc in self.docs.values() for name in doc})
+            fields = [{'name': name, 'type': 'string'} for name in names]
+            dynamic = []
+        return {
+            'name': self.name,
+            'fields': fields,
+            'dynamicFields': dynamic,
+            'fieldTypes': [],
+        }
+
+    def select(self, params):
+        with self.lock:
+            docs = list(self.docs.values())
+
+        default_op = params.get('q.op', 'OR')
+        query = parse_query(params.get('q'), default_op)
+        filters = []
+        for fq in params.getlist('fq'):
+            local, text = parse_local_params(fq)
+            tags = set(filter(None, local.get('tag', '').split(',')))
+            filters.append((tags, parse_query(text)))
+
+        def matching(excluded=()):
+            return [
+                doc for doc in docs
+                if query(doc) and all(predicate(doc)
+                                      for tags, predicate in filters
+                                      if not tags & set(excluded))
+            ]
+
+        found = matching()
+        found = self.sort(found, params.get('sort'))
+        start = int(params.get('start') or 0)
+        rows = int(params.get('rows') or 10)
+
+        response = OrderedDict()
+        response['responseHeader'] = {
+            'status': 0, 'QTime': 0, 'params': dict(params.items),
+        }
+
+        cursor = params.get('cursorMark')
+        if cursor is not None:
+            start = 0 if cursor == '*' else decode_cursor(cursor)
+            page = found[start:start + rows]
+            next_start = start + len(page)
+            response['nextCursorMark'] = (encode_cursor(next_start)
+                                          if page else cursor)
+        else:
+            page = found[start:start + rows]
+
+        if params.bool('group'):
+            response['grouped'] = self.group(found, params)
+        else:
+            response['response'] = {
+                'numFound': len(found),
+                'start': start,
+                'docs': [self.fields(doc, params.get('fl')) for doc in page],
+            }
+
+        if params.bool('facet'):
+            response['facet_counts'] = self.facets(matching, params)
+        if params.bool('stats'):
+            response['stats'] = self.stats(matching, params)
+        if params.bool('hl'):
+            response['highlighting'] = self.highlight(page, params)
+        if params.bool('spellcheck'):
+            response['spellcheck'] = {'suggestions': [], 'collations': []}
+        return response
+
+    @staticmethod
+    def sort(docs, sort):
+        if not sort:
+            return docs
+        # stable sorts, applied from the last criterion to the first
+        for criterion in reversed([c.strip() for c in sort.split(',')]):
+            field, _, direction = criterion.partition(' ')
+            if field == 'score':
+                continue
+            reverse = direction.strip().lower() == 'desc'
+            present = [doc for doc in docs if doc.get(field) is not None]
+            missing = [doc for doc in docs if doc.get(field) is None]
+            present.sort(key=lambda doc: compare_key(as_list(doc[field])[0]),
+                         reverse=reverse)
+            docs = present + missing
+        return docs
+
+    def fields(self, doc, fl):
+        names = [name for name in re.split(r'[\s,]+', fl or '') if name]
+        return {
+            key: value for key, value in doc.items()
+            if (not self.schema or self.schema.stored(key)) and
+            (not names or '*' in names or
+             any(fnmatch.fnmatchcase(key, name) for name in names))
+        }
+
+    def facets(self, matching, params):
+        facet_fields = OrderedDict()
+        for spec in params.getlist('facet.field'):
+            local, field = parse_local_params(spec)
+            key = local.get('key', field)
+            excluded = local.get('ex', '').split(',')
+            counts = Counter(
+                to_text(value)
+                for doc in matching(excluded)
+                for value in set(map(to_text, as_list(doc.get(field))))
+            )
+
+            prefix = params.field(field, 'facet.prefix', '')
+            mincount = int(params.field(field, 'facet.mincount', 0))
+            limit = int(params.field(field, 'facet.limit', 100))
+            offset = int(params.field(field, 'facet.offset', 0))
+            sort = params.field(field, 'facet.sort',
+                                'count' if limit > 0 else 'index')
+
+            items = [(value, count) for value, count in counts.items()
+                     if value.startswith(prefix) and count >= mincount]
+            if sort == 'index':
+                items.sort(key=lambda item: item[0])
+            else:
+                items.sort(key=lambda item: (-item[1], item[0]))
+            items = items[offset:]
+            if limit >= 0:
+                items = items[:limit]
+            facet_fields[key] = [x for item in items for x in item]
+
+        return {
+            'facet_queries': {},
+            'facet_fields': facet_fields,
+            'facet_ranges': {},
+            'facet_intervals': {},
+            'facet_heatmaps': {},
+        }
+
+    def stats(self, matching, params):
+        stats_fields = OrderedDict()
+        for spec in params.getlist('stats.field'):
+            local, field = parse_local_params(spec)
+            key = local.get('key', field)
+            docs = matching(local.get('ex', '').split(','))
+            values = [value for doc in docs
+                      for value in as_list(doc.get(field))]
+            missing = sum(1 for doc in docs if doc.get(field) is None)
+            result = {
+                'min': min(values, key=compare_key) if values else None,
+                'max': max(values, key=compare_key) if values else None,
+                'count': len(values),
+                'missing': missing,
+            }
+            # {!min=true max=true} asks for these statistics only
+            wanted = [name for name in STATISTICS if local.get(name) == 'true']
+            stats_fields[key] = {name: value for name, value in result.items()
+                                 if not wanted or name in wanted}
+        return {'stats_fields': stats_fields}
+
+    def highlight(self, docs, params):
+        pre = params.get('hl.simple.pre', '<em>')
+        post = params.get('hl.simple.post', '</em>')
+        query = params.get('hl.q') or params.get('q') or ''
+        words = set(WORD.findall(query.lower()))
+        words -= {'and', 'or', 'not'}
+        fields = [name for name in re.split(r'[\s,]+', params.get('hl.fl', ''))
+                  if name]
+
+        highlighting = {}
+        for doc in docs:
+            snippets = {}
+            for field in fields:
+                values = []
+                for value in as_list(doc.get(field)):
+                    text = to_text(value)
+                    marked = WORD.sub(
+                        lambda m: (pre + m.group() + post
+                                   if m.group().lower() in words
+                                   else m.group()), text)
+                    if marked != text:
+                        values.append(marked)
+                if values:
+                    snippets[field] = values
+            highlighting[to_text(doc['id'])] = snippets
+        return highlighting
+
+    def group(self, found, params):
+        grouped = OrderedDict()
+        limit = int(params.get('group.limit') or 1)
+        start = int(params.get('start') or 0)
+        rows = int(params.get('rows') or 10)
+        for field in params.getlist('group.field'):
+            groups = OrderedDict()
+            for doc in found:
+                value = as_list(doc.get(field))
+                groups.setdefault(to_text(value[0]) if value else None,
+                                  []).append(doc)
+            grouped[field] = {
+                'matches': len(found),
+                'groups': [
+                    {
+                        'groupValue': value,
+                        'doclist': {
+                            'numFound': len(docs),
+                            'start': 0,
+                            'docs': [self.fields(doc, params.get('fl'))
+                                     for doc in docs[:limit]],
+                        },
+                    }
+                    for value, docs in list(groups.items())[start:start + rows]
+                ],
+            }
+        return grouped
+
+
+STATISTICS = ('min', 'max', 'count', 'missing')
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(str(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        raise QueryError('Unable to parse cursorMark: {}'.format(cursor))
+
+
+# Update messages
+
+def parse_xml_update(body):
+    """ Returns (docs, ids, queries) for an XML update message. """
+    root = ET.fromstring(body)
+    messages = [root] if root.tag != 'update' else list(root)
+    docs, ids, queries = [], [], []
+    for message in messages:
+        if message.tag == 'add':
+            for doc_elem in message.iter('doc'):
+                doc = OrderedDict()
+                for field in doc_elem.iter('field'):
+                    name = field.get('name')
+                    value = field.text or ''
+                    if name in doc:
+                        doc[name] = as_list(doc[name]) + [value]
+                    else:
+                        doc[name] = value
+                docs.append(doc)
+        elif message.tag == 'delete':
+            ids += [elem.text for elem in message.iter('id')]
+            queries += [elem.text for elem in message.iter('query')]
+    return docs, ids, queries
+
+
+def parse_json_update(body):
+    data = json.loads(body or 'null')
+    if data is None:
+        return [], [], []
+    if isinstance(data, list):
+        return data, [], []
+    docs, ids, queries = [], [], []
+    # a JSON object may repeat keys ("add": ..., "add": ...)
+    for key, value in json.loads(body, object_pairs_hook=list):
+        if key == 'add':
+            value = dict(value)
+            docs.append(dict(value['doc']))
+        elif key == 'delete':
+            for item in (value if isinstance(value, list) else [value]):
+                if isinstance(item, list):
+                    item = dict(item)
+                if isinstance(item, dict):
+                    if 'id' in item:
+                        ids.append(item['id'])
+                    if 'query' in item:
+                        queries.append(item['query'])
+                else:
+                    ids.append(item)
+    return docs, ids, queries
+
+
+# HTTP server
+
+class Handler(BaseHTTPRequestHandler):
+
+    server_version = 'FakeSolr/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch(b'')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.dispatch(self.rfile.read(length))
+
+    def dispatch(self, body):
+        url = urlsplit(self.path)
+        params = parse_qsl(url.query, keep_blank_values=True)
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            params += parse_qsl(body.decode('utf-8'), keep_blank_values=True)
+            body = b''
+
+        path = url.path.strip('/')
+        try:
+            data = self.route(path, Params(params), body, content_type)
+        except QueryError as e:
+            return self.send_json(400, {'error': {'msg': str(e), 'code': 400}})
+        except LookupError:
+            return self.send_json(404, {'error': {
+                'msg': 'Unknown handler {}'.format(path), 'code': 404}})
+        self.send_json(200, data)
+
+    def route(self, path, params, body, content_type):
+        fake = self.server.fake
+        if path.endswith('admin/cores'):
+            return {'responseHeader': {'status': 0},
+                    'status': fake.core_status(params.get('core'))}
+
+        core, _, handler = path.rpartition('/')
+        if handler in ('update', 'json') and core.endswith('/update'):
+            core, handler = core[:-len('/update')], 'update'
+        elif handler == 'extract' and core.endswith('/update'):
+            core, handler = core[:-len('/update')], 'extract'
+        elif handler == 'ping' and core.endswith('/admin'):
+            core, handler = core[:-len('/admin')], 'ping'
+        index = fake.index(core)
+
+        if handler == 'select':
+            return index.select(params)
+        if handler == 'update':
+            self.update(index, body, content_type)
+            return {'responseHeader': {'status': 0, 'QTime': 0}}
+        if handler == 'extract':
+            return self.extract(content_type, body)
+        if handler == 'schema':
+            return {'responseHeader': {'status': 0},
+                    'schema': index.schema_info()}
+        if handler == 'ping':
+            return {'responseHeader': {'status': 0}, 'status': 'OK'}
+        raise LookupError(handler)
+
+    def update(self, index, body, content_type):
+        body = body.decode('utf-8').strip()
+        if not body:
+            return
+        if body.startswith('<'):
+            docs, ids, queries = parse_xml_update(body)
+        else:
+            docs, ids, queries = parse_json_update(body)
+        index.delete(ids, queries)
+        index.add(docs)
+
+    def extract(self, content_type, body):
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)),
+        }
+        form = cgi.FieldStorage(fp=BytesIO(body), environ=environ)
+        upload = form['file']
+        text = upload.value.decode('utf-8', 'replace')
+        # pysolr expects the contents under the name of the file
+        return {
+            'responseHeader': {'status': 0},
+            upload.filename: text,
+            '{}_metadata'.format(upload.filename): [],
+        }
+
+    def send_json(self, status, data):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeSolr(object):
+
+    def __init__(self, schema_path=DEFAULT_SCHEMA):
+        self.schema = (Schema(schema_path)
+                       if schema_path and os.path.exists(schema_path)
+                       else None)
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def index(self, path):
+        with self.lock:
+            if path not in self.indexes:
+                self.indexes[path] = Index(path.rsplit('/', 1)[-1],
+                                           self.schema)
+            return self.indexes[path]
+
+    def core_status(self, name=None):
+        return {
+            index.name: {'name': index.name,
+                         'index': {'numDocs': len(index.docs)}}
+            for index in self.indexes.values()
+            if name is None or index.name == name
+        }
+
+
+class FakeSolrServer(socketserver.ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, fake):
+        super().__init__(address, Handler)
+        self.fake = fake
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def load_fixtures(path):
+    """ Documents from a JSON file: a list of documents, or a saved Solr
+        select response.
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('response', data).get('docs', [])
+    return data
+
+
+def start_server(host='127.0.0.1', port=0, documents=None, core='solr/ecolex',
+                 schema_path=DEFAULT_SCHEMA):
+    """ Serve in a background thread; port 0 picks a free port. """
+    fake = FakeSolr(schema_path)
+    if documents:
+        fake.index(core).add(documents)
+    server = FakeSolrServer((host, port), fake)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,7 @@
+# gunicorn settings, see docker-entrypoint.sh
+
+
+def child_exit(server, worker):
+    # drop the live gauges of the exited worker from the shared metrics
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,258 @@
+"""
+Per-request timings of the Solr calls made while serving a page.
+
+Every query sent through `xsearch.Queryer`, `search._search` or `EcolexSolr`
+runs inside `solr_call()`, which records the call site (the first caller
+outside the Solr access layer), the network time and size of the HTTP
+response, the time spent decoding it and the Solr QTime. Other expensive
+sections (e.g. schema loading) are measured with `timed()`.
+
+`ServerTimingMiddleware` collects the records of a request, logs them as one
+JSON line to the `ecolex.instrumentation` logger and, if SERVER_TIMING is
+set, sends them back in a `Server-Timing` header.
+"""
+
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import requests
+
+from ecolex import metrics, resilience
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+# modules making up the Solr access layer, skipped when looking for the
+# code that asked for the query
+LAYER_MODULES = (
+    'ecolex.instrumentation',
+    'ecolex.xsearch',
+    'ecolex.search',
+    'ecolex.management.utils',
+    'scorched.',
+    'pysolr',
+    'requests.',
+    'contextlib',
+)
+
+TOKEN_UNSAFE = re.compile(r"[^\w!#$%&'*+.^`|~-]")
+
+# seconds, the shortest timeout given to a request on a budget; a timeout
+# of 0 is rejected by requests
+MIN_TIMEOUT = .1
+
+
+class SolrCall(object):
+
+    def __init__(self, site):
+        self.site = site
+        self.duration = 0
+        self.network = 0
+        self.size = 0
+        self.qtime = None
+
+    @property
+    def decoding(self):
+        return max(self.duration - self.network, 0)
+
+    def as_dict(self):
+        return OrderedDict([
+            ('site', self.site),
+            ('ms', round(self.duration * 1000, 1)),
+            ('network', round(self.network * 1000, 1)),
+            ('decoding', round(self.decoding * 1000, 1)),
+            ('qtime', self.qtime),
+            ('bytes', self.size),
+        ])
+
+
+class RequestTimings(object):
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.calls = []
+        self.sections = OrderedDict()
+        self.current_call = None
+
+    def add_section(self, name, duration):
+        self.sections[name] = self.sections.get(name, 0) + duration
+
+    def by_site(self):
+        sites = OrderedDict()
+        for call in self.calls:
+            totals = sites.setdefault(call.site, {
+                'count': 0, 'duration': 0, 'qtime': 0,
+            })
+            totals['count'] += 1
+            totals['duration'] += call.duration
+            totals['qtime'] += call.qtime or 0
+        return sites
+
+
+def start_request():
+    _local.timings = RequestTimings()
+    return _local.timings
+
+
+def end_request():
+    timings = getattr(_local, 'timings', None)
+    _local.timings = None
+    return timings
+
+
+def current():
+    return getattr(_local, 'timings', None)
+
+
+def frame_name(frame):
+    code = frame.f_code
+    name = code.co_name
+    if code.co_argcount and code.co_varnames[0] in ('self', 'cls'):
+        owner = frame.f_locals.get(code.co_varnames[0])
+        if owner is not None:
+            owner = owner if isinstance(owner, type) else type(owner)
+            name = '{}.{}'.format(owner.__name__, name)
+    return name
+
+
+def call_site():
+    """ `Caller.function>Layer.function`: the caller outside the Solr
+        access layer, then the entry point of the layer it used.
+    """
+    frame = sys._getframe(1)
+    entry = None
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if not module.startswith(LAYER_MODULES):
+            name = frame_name(frame)
+            return '{}>{}'.format(name, entry) if entry else name
+        if module.startswith('ecolex.') and module != __name__:
+            entry = frame_name(frame)
+        frame = frame.f_back
+    return entry or 'unknown'
+
+
+@contextmanager
+def solr_call():
+    """ Wraps the execution of one Solr query; set `qtime` on the yielded
+        call once the response is known.
+    """
+    timings = current()
+    if timings is None or timings.current_call is not None:
+        # not serving a request, or already inside an instrumented call
+        yield SolrCall(None)
+        return
+
+    call = SolrCall(call_site())
+    timings.current_call = call
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        metrics.SOLR_ERRORS.labels('web').inc()
+        raise
+    finally:
+        call.duration = time.perf_counter() - start
+        timings.current_call = None
+        timings.calls.append(call)
+
+
+@contextmanager
+def timed(name):
+    timings = current()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.add_section(name, time.perf_counter() - start)
+
+
+class InstrumentedSession(requests.Session):
+    """ Adds the network time and response size of each HTTP request to the
+        Solr call in progress. With `budget`, also keeps its timeout within
+        the time left to the request (see `ecolex.resilience`).
+    """
+
+    def __init__(self, budget=False):
+        super().__init__()
+        self.budget = budget
+
+    def request(self, *args, **kwargs):
+        budget = resilience.remaining() if self.budget else None
+        if budget is not None:
+            timeout = min(kwargs.get('timeout') or budget, budget)
+            kwargs['timeout'] = max(timeout, MIN_TIMEOUT)
+
+        timings = current()
+        call = timings and timings.current_call
+        if call is None:
+            return super().request(*args, **kwargs)
+
+        start = time.perf_counter()
+        response = super().request(*args, **kwargs)
+        call.network += time.perf_counter() - start
+        call.size += len(response.content)
+        return response
+
+
+def instrument_pysolr(solr):
+    solr.session = InstrumentedSession()
+    return solr
+
+
+def instrument_scorched(interface):
+    # the page queries, see xsearch; the importers and exports use pysolr
+    interface.conn.http_connection = InstrumentedSession(budget=True)
+    return interface
+
+
+def server_timing(timings, total):
+    """ The Server-Timing header value for a finished request. """
+    def metric(name, duration, desc=None):
+        value = '{};dur={:.1f}'.format(TOKEN_UNSAFE.sub('_', name),
+                                       duration * 1000)
+        if desc:
+            value += ';desc="{}"'.format(desc.replace('"', "'"))
+        return value
+
+    solr_time = sum(call.duration for call in timings.calls)
+    metrics = [
+        metric('total', total),
+        metric('solr', solr_time, '{} calls'.format(len(timings.calls))),
+    ]
+    for idx, (site, totals) in enumerate(timings.by_site().items(), 1):
+        metrics.append(metric(
+            'solr{}'.format(idx), totals['duration'],
+            '{} x{} qtime={}'.format(site, totals['count'], totals['qtime'])))
+    for name, duration in timings.sections.items():
+        metrics.append(metric(name, duration))
+    return ', '.join(metrics)
+
+
+def log_request(request, response, timings, total):
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info(json.dumps(OrderedDict([
+        ('ts', round(time.time(), 3)),
+        ('method', request.method),
+        ('path', request.path),
+        ('status', response.status_code),
+        ('ms', round(total * 1000, 1)),
+        ('solr_calls', len(timings.calls)),
+        ('solr_ms', round(sum(c.duration for c in timings.calls) * 1000, 1)),
+        ('qtime', sum(c.qtime or 0 for c in timings.calls)),
+        ('bytes', sum(c.size for c in timings.calls)),
+        ('sections', OrderedDict(
+            (name, round(duration * 1000, 1))
+            for name, duration in timings.sections.items())),
+        ('calls', [call.as_dict() for call in timings.calls]),
+    ])))
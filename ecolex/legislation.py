@@ -13,8 +13,10 @@ from pysolr import SolrError
 from django.conf import settings
 from django.template.defaultfilters import slugify
 
+from ecolex import caching
 from ecolex.management.commands.logging import LOG_DICT
 from ecolex.management.definitions import LEGISLATION
+from ecolex.management.snapshots import get_snapshot_store
 from ecolex.management.utils import EcolexSolr, clean_text_date
 from ecolex.models import DocumentText
 
@@ -92,12 +94,25 @@ def get_content(values):
     return values
 
 
+@caching.index_changes()
 def harvest_file(upfile):
     logger.info(f"[Legislation] Harvest file started.")
-    documents = ET.fromstring(upfile, parser=ET.XMLParser(recover=True))
-    legislations = []
-    count_ignored = 0
+    snapshots = get_snapshot_store()
+    if snapshots:
+        try:
+            snapshots.put_xml_documents(LEGISLATION, upfile, "FaolexId", "id")
+        except Exception:
+            logger.exception("Error storing snapshots")
+    legislations, count_ignored = parse_file(upfile)
+    logger.info(f"[Legislation] Harvest file finished.")
+    add_legislations(legislations, count_ignored)
 
+
+def load_dictionaries():
+    """
+    Subjects, keywords, regions, countries and languages used when parsing
+    FAO files, see parse_file.
+    """
     with open(settings.SOLR_IMPORT["common"]["fao_subjects_xml"], encoding="utf-8") as f:
         bs = BeautifulSoup(f.read(), "xml")
         subjects = {subject.Classification_Sec_Area.string: subject
@@ -124,6 +139,23 @@ def harvest_file(upfile):
             key = v["en2"].lower()
             all_languages[key] = v
 
+    return subjects, keywords, json_regions, json_countries, all_languages
+
+
+def parse_file(upfile, dictionaries=None):
+    """
+    Parse an uploaded FAO XML file into Solr documents, without indexing them.
+    Returns the documents and the number of ignored records.
+
+    Pass the result of load_dictionaries when parsing many files.
+    """
+    documents = ET.fromstring(upfile, parser=ET.XMLParser(recover=True))
+    legislations = []
+    count_ignored = 0
+
+    (subjects, keywords, json_regions, json_countries,
+     all_languages) = dictionaries or load_dictionaries()
+
     for document in documents.iter("document"):
         legislation = {
             "type": LEGISLATION,
@@ -248,7 +280,6 @@ def harvest_file(upfile):
         if (REPEALED.upper() in
                 get_content(document.findall(REPEALED))):
             legislation["legStatus"] = REPEALED
-            import ipdb; ipdb.set_trace()
         else:
             legislation["legStatus"] = IN_FORCE
 
@@ -271,8 +302,7 @@ def harvest_file(upfile):
             if not key.startswith("_")
         })
 
-    logger.info(f"[Legislation] Harvest file finished.")
-    add_legislations(legislations, count_ignored)
+    return legislations, count_ignored
 
 
 def add_legislations(legislations, count_ignored):
@@ -280,13 +310,20 @@ def add_legislations(legislations, count_ignored):
     count_updated = 0
     count_new = 0
 
+    existing_docs = DocumentText.objects.lookup_many([
+        (legislation.get("legId"), legislation.get("legLinkToFullText"))
+        for legislation in legislations
+    ])
+    indexed_docs = {}
+
     for legislation in legislations:
         leg_id = legislation.get("legId")
+        url = legislation.get("legLinkToFullText")
         logger.info(f"[Legislation] Adding {leg_id}")
-        doc, _ = DocumentText.objects.get_or_create(
-            doc_id=leg_id,
-            url=legislation.get("legLinkToFullText")
-        )
+        doc = existing_docs.get((leg_id, url))
+        if doc is None:
+            doc = existing_docs[(leg_id, url)] = DocumentText(
+                doc_id=leg_id, url=url)
         doc.doc_type = LEGISLATION
         doc.status = DocumentText.INDEXED
         legislation["updatedDate"] = (datetime.now()
@@ -298,7 +335,7 @@ def add_legislations(legislations, count_ignored):
             solr.add(legislation)
             # full-text extraction is done separately
             # see LegislationImporter.update_full_text
-            doc.save()
+            indexed_docs[(leg_id, url)] = doc
             if leg_existing:
                 count_updated += 1
             else:
@@ -310,6 +347,9 @@ def add_legislations(legislations, count_ignored):
             if settings.DEBUG:
                 logger.exception(e)
 
+    DocumentText.objects.bulk_upsert(list(indexed_docs.values()),
+                                     ["doc_type", "status"])
+
     logger.info(f"Total {len(legislations) + count_ignored}. "
                 f"Added {count_new}. Updated {count_updated}. "
                 f"Failed {len(legislations) - count_new - count_updated}. "
@@ -0,0 +1,161 @@
+"""
+Compressed storage for large, rarely read text columns.
+
+Values are stored as bytes, prefixed by a two byte header telling how they
+were written:
+
+    \\x00z  zlib compressed utf-8 text
+    \\x00s  zstd compressed utf-8 text (needs the `zstandard` package)
+    \\x00r  reference to a content-addressed file, holding a compressed value
+
+Anything else is a legacy, uncompressed value and is decoded as utf-8, so rows
+written before the column was converted can still be read.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+ZLIB = b'\x00z'
+ZSTD = b'\x00s'
+REF = b'\x00r'
+
+
+def get_storage_settings():
+    defaults = {
+        'codec': 'zlib',
+        'level': 6,
+        'external_dir': None,
+        'external_threshold': 256 * 1024,
+    }
+    defaults.update(getattr(settings, 'DOCUMENT_TEXT_STORAGE', {}))
+    return defaults
+
+
+class BlobStore(object):
+    """
+    Content-addressed files on local disk. Identical payloads are written
+    only once.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest):
+        with open(self._path(digest), 'rb') as f:
+            return f.read()
+
+
+def compress(text, options=None):
+    options = options or get_storage_settings()
+    data = text.encode('utf-8')
+    codec = options['codec']
+
+    if codec == 'zstd' and zstandard is None:
+        logger.warning('zstandard is not installed, falling back to zlib')
+        codec = 'zlib'
+
+    if codec == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=options['level'])
+        return ZSTD + compressor.compress(data)
+    return ZLIB + zlib.compress(data, options['level'])
+
+
+def decompress(value):
+    header, data = value[:2], value[2:]
+    if header == ZLIB:
+        return zlib.decompress(data).decode('utf-8')
+    if header == ZSTD:
+        if zstandard is None:
+            raise ImproperlyConfigured(
+                'zstandard is needed to read zstd compressed values')
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    # legacy, uncompressed value
+    return value.decode('utf-8')
+
+
+def encode(text):
+    if text is None:
+        return None
+    if text == '':
+        return b''
+
+    options = get_storage_settings()
+    value = compress(text, options)
+
+    external_dir = options['external_dir']
+    if external_dir and len(value) > options['external_threshold']:
+        digest = BlobStore(external_dir).put(value)
+        return REF + digest.encode('ascii')
+    return value
+
+
+def decode(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        # legacy value, e.g. from a TEXT column in sqlite
+        return value
+
+    value = bytes(value)
+    if value[:2] == REF:
+        external_dir = get_storage_settings()['external_dir']
+        if not external_dir:
+            raise ImproperlyConfigured(
+                'DOCUMENT_TEXT_STORAGE["external_dir"] is needed to read '
+                'externally stored values')
+        value = BlobStore(external_dir).get(value[2:].decode('ascii'))
+    return decompress(value)
+
+
+class CompressedTextField(models.BinaryField):
+    """
+    Text field that is compressed transparently and optionally moved to
+    content-addressed files when large. Python code only sees `str` values.
+    """
+
+    def from_db_value(self, value, expression, connection, context):
+        return decode(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return decode(value)
+
+    def get_prep_value(self, value):
+        if isinstance(value, str):
+            value = encode(value)
+        return super().get_prep_value(value)
+
+    def value_to_string(self, obj):
+        # keep serialized data (e.g. dumpdata) readable and portable
+        return self.value_from_object(obj)
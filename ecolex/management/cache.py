@@ -0,0 +1,58 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+class NodeCache(object):
+    """ Persistent cache for remote JSON nodes, stored as one file per key.
+
+        Entries older than `ttl` seconds are stale, but are kept on disk
+        together with the ETag returned by the server, so callers can
+        revalidate them with a conditional request instead of downloading
+        the node again.
+    """
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file_path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest[:2], digest + '.json')
+
+    def get(self, key):
+        try:
+            with open(self._file_path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, data, etag=None):
+        entry = {
+            'key': key,
+            'etag': etag,
+            'fetched': time.time(),
+            'data': data,
+        }
+        file_path = self._file_path(key)
+        directory = os.path.dirname(file_path)
+        os.makedirs(directory, exist_ok=True)
+        # write to a temporary file first, so that concurrent importers
+        # never read a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, file_path)
+        return entry
+
+    def touch(self, key):
+        """ Mark an entry as fresh, e.g. after a 304 Not Modified. """
+        entry = self.get(key)
+        if entry:
+            return self.set(key, entry['data'], entry.get('etag'))
+
+    def is_fresh(self, entry):
+        return bool(entry) and time.time() - entry['fetched'] < self.ttl
@@ -6,10 +6,17 @@ from django.conf import settings
 from pysolr import SolrError
 
 from ecolex.management.utils import EcolexSolr, cleanup_copyfields
+from ecolex.management.snapshots import get_snapshot_store
 from ecolex.management.utils import get_dict_from_json
 from ecolex.models import DocumentText
 
 
+def get_importer_config(obj_type):
+    """ Importer configuration for `obj_type`, merged with the common one. """
+    config = settings.SOLR_IMPORT
+    return dict(config['common'], **config[obj_type])
+
+
 class BaseImporter(object):
 
     def __init__(self, config, logger, doc_type):
@@ -28,8 +35,26 @@ class BaseImporter(object):
         self.subjects = self._get_subjects()
         self.treaties = get_dict_from_json(config.get('treaties_json'))
         self.solr = EcolexSolr(self.solr_timeout)
+        self.snapshots = get_snapshot_store()
         self.logger = logger
 
+    def snapshot_pages(self, pages, *id_tags):
+        """ Archive raw XML export pages, one payload per document. """
+        if not self.snapshots:
+            return
+        for page in pages:
+            try:
+                self.snapshots.put_xml_documents(self.doc_type, page, *id_tags)
+            except Exception:
+                self.logger.exception('Error storing snapshots')
+
+    def snapshot_json(self, doc_id, data):
+        if not self.snapshots:
+            return
+        try:
+            self.snapshots.put_json(self.doc_type, doc_id, data)
+        except Exception:
+            self.logger.exception('Error storing snapshot of %s', doc_id)
 
     def _get_regions(self):
         with open(self.regions_json, encoding='utf-8') as f:
@@ -0,0 +1,197 @@
+import json
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+
+from ecolex import legislation
+from ecolex.management.definitions import (
+    COP_DECISION, COURT_DECISION, LEGISLATION, LITERATURE, TREATY,
+)
+from ecolex.management.commands import (
+    cop_decision2, court_decision, literature, treaty,
+)
+from ecolex.management.commands.base import get_importer_config
+
+
+class StubSolr(object):
+    """ Stands in for EcolexSolr: nothing is indexed yet and files have no
+        text, so every document goes through the full parsing path.
+    """
+
+    def search(self, obj_type, id_value):
+        return None
+
+    def search_all(self, key, value='*', **kwargs):
+        return []
+
+    def extract(self, file_obj):
+        return ''
+
+    def add(self, document):
+        return True
+
+    def add_bulk(self, documents):
+        return True
+
+
+@contextmanager
+def offline():
+    """ Downloads find nothing while benchmarking. """
+    with mock.patch.object(court_decision, 'get_file_from_url',
+                           return_value=None):
+        yield
+
+
+def load_records(path):
+    """ Recorded payloads are stored as a JSON list, one item per document. """
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_xml(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def setup_importer(importer_class, obj_type):
+    importer = importer_class(get_importer_config(obj_type))
+    importer.solr = StubSolr()
+    return importer
+
+
+def setup_decisions(path):
+    records = load_records(path)
+    # the importer sets the lookup tables at Decision class level
+    cop_decision2.CopDecisionImporter(get_importer_config(COP_DECISION))
+    payloads = [cop_decision2.split_record(record) for record in records]
+
+    def run():
+        for dec, meeting, treaty_data in payloads:
+            cop_decision2.Decision(dec, meeting, treaty_data, None).fields()
+        return len(payloads)
+
+    return run
+
+
+def setup_treaties(path):
+    """ `path` is an ELIS export page, as returned by the treaties_url. """
+    page = load_xml(path)
+    importer = setup_importer(treaty.TreatyImporter, TREATY)
+
+    def run():
+        treaties = importer._parse([page])
+        importer._clean_referred_treaties(treaties)
+        docs = [importer._get_solr_treaty(data) for data in treaties.values()]
+        return len(docs)
+
+    return run
+
+
+def setup_literature(path):
+    """ `path` is an ELIS export page, as returned by the literature_url. """
+    page = load_xml(path)
+    importer = setup_importer(literature.LiteratureImporter, LITERATURE)
+
+    def run():
+        docs = [importer._get_solr_lit(data)
+                for data in importer._parse([page])]
+        return len(docs)
+
+    return run
+
+
+def setup_court_decisions(path):
+    """ `path` holds a JSON list of InforMEA decision nodes. """
+    records = [record[0] if isinstance(record, list) else record
+               for record in load_records(path)]
+    importer = setup_importer(court_decision.CourtDecisionImporter,
+                              COURT_DECISION)
+
+    def run():
+        for record in records:
+            court_decision.CourtDecision(
+                record,
+                importer.countries, importer.languages,
+                importer.regions, importer.subdivisions,
+                importer.keywords, importer.informea_keywords,
+                importer.subjects, importer.solr,
+            ).get_solr_format(record.get('uuid'), None)
+        return len(records)
+
+    return run
+
+
+def setup_legislation(path):
+    """ `path` is a FAOLEX XML dump, as given to import_xml. """
+    upfile = load_xml(path)
+    dictionaries = legislation.load_dictionaries()
+
+    def run():
+        legislations, ignored = legislation.parse_file(upfile, dictionaries)
+        return len(legislations) + ignored
+
+    return run
+
+
+BENCHMARKS = {
+    COP_DECISION: setup_decisions,
+    TREATY: setup_treaties,
+    LITERATURE: setup_literature,
+    COURT_DECISION: setup_court_decisions,
+    LEGISLATION: setup_legislation,
+}
+
+
+def peak_memory(run):
+    """ Peak Python allocations during one run, in bytes. """
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class Command(BaseCommand):
+    help = "Benchmark the importers' parsing on recorded payloads"
+    # the URL checks load the search schema from Solr, which is not needed
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('obj_type', choices=sorted(BENCHMARKS))
+        parser.add_argument('--input', required=True,
+                            help='Recorded payloads: a JSON list of nodes '
+                                 'for decisions, an XML export otherwise')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with offline():
+            run = BENCHMARKS[options['obj_type']](options['input'])
+
+            timings = []
+            count = 0
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                count = run()
+                timings.append(time.perf_counter() - start)
+            peak = peak_memory(run)
+
+        if not count:
+            self.stderr.write('No records found in {}'.format(options['input']))
+            return
+
+        best = min(timings)
+        mean = sum(timings) / len(timings)
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write(
+            '{}: {} records x {} runs. best {:.3f}s, mean {:.3f}s, '
+            '{:.1f} us/record, {:.0f} records/s'.format(
+                options['obj_type'], count, len(timings), best, mean,
+                best / count * 1e6, count / best))
+        self.stdout.write(
+            'peak allocations {:.1f} MiB, max RSS {:.1f} MiB'.format(
+                peak / 2 ** 20, max_rss / 2 ** 10))
@@ -0,0 +1,232 @@
+import json
+import os
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from django.test import RequestFactory
+from django.utils import translation
+from scorched import SolrInterface
+
+from ecolex import instrumentation, querylog
+from ecolex.management.commands.warm_caches import top_entries, to_querydict
+from ecolex.xviews import SearchResults, run_search, search_form
+
+
+STAGES = ('prepare', 'solr', 'facets', 'stats', 'highlight', 'schema',
+          'render', 'total')
+
+
+class RecordingInterface(SolrInterface):
+    """ Keeps the raw JSON of the last response. """
+
+    def __init__(self, url):
+        super().__init__(url)
+        select = self.conn.select
+
+        def recording_select(params):
+            self.last_response = select(params)
+            return self.last_response
+
+        self.conn.select = recording_select
+
+
+class ReplayConnection(object):
+
+    def __init__(self, response):
+        self.response = response
+
+    def select(self, params):
+        return self.response
+
+
+class ReplayInterface(SolrInterface):
+    """ Answers every query with a recorded response, without a server. """
+
+    def __init__(self, response):
+        self.conn = ReplayConnection(response)
+        self.schema = {'fields': [], 'dynamicFields': []}
+        self._datefields = ()
+
+
+def load_recordings(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'median': round(statistics.median(samples) * 1000, 3),
+        'p95': round(samples[int(len(samples) * 0.95) - 1
+                             if len(samples) > 1 else 0] * 1000, 3),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Record Solr responses of real searches, or replay them to time '
+            'the Python side of the search page')
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=('record', 'run'))
+        parser.add_argument('--recordings', required=True,
+                            help='JSON lines file of recorded responses')
+        parser.add_argument('--query', action='append', default=[],
+                            help='Query string to record (repeatable)')
+        parser.add_argument('--from-log', type=int, default=0,
+                            help='Record the N most frequent logged searches')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--history', default=None,
+                            help='JSON file the results are appended to')
+        parser.add_argument('--label', default='',
+                            help='Name of this run in the history')
+        parser.add_argument('--threshold', type=float, default=10,
+                            help='Report stages slower by more than this '
+                                 'percentage than the previous run')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'record':
+            self.record(options)
+        else:
+            self.run(options)
+
+    def record(self, options):
+        searches = [(QueryDict(query), settings.LANGUAGE_CODE)
+                    for query in options['query']]
+        if options['from_log']:
+            entries, _ = top_entries(querylog.read_entries(),
+                                     options['from_log'], 0)
+            searches += [
+                (to_querydict(entry['params'], entry.get('page')),
+                 entry.get('language') or settings.LANGUAGE_CODE)
+                for entry in entries
+            ]
+        if not searches:
+            raise CommandError('Nothing to record, use --query or --from-log')
+
+        interface = RecordingInterface(settings.SOLR_URI)
+        count = 0
+        with open(options['recordings'], 'a', encoding='utf-8') as f:
+            for querydict, language in searches:
+                form = search_form(querydict)
+                if not form.is_valid():
+                    self.stderr.write('Invalid search: {}'.format(
+                        querydict.urlencode()))
+                    continue
+                interface.last_response = None
+                with translation.override(language):
+                    run_search(form, language, interface)
+                if interface.last_response is None:
+                    continue
+                f.write(json.dumps({
+                    'query': querydict.urlencode(),
+                    'language': language,
+                    'response': interface.last_response,
+                }) + '\n')
+                count += 1
+        self.stdout.write('Recorded {} searches to {}.'.format(
+            count, options['recordings']))
+
+    def replay(self, recording):
+        """ Serve the search page once, returns the timings by stage. """
+        view = SearchResults.as_view(
+            interface=ReplayInterface(recording['response']))
+        language = recording['language']
+        request = RequestFactory().get('/result/?' + recording['query'])
+        request.LANGUAGE_CODE = language
+
+        with translation.override(language):
+            timings = instrumentation.start_request()
+            try:
+                response = view(request)
+                with instrumentation.timed('render'):
+                    response.render()
+            finally:
+                instrumentation.end_request()
+        total = time.perf_counter() - timings.start
+
+        stages = dict(timings.sections)
+        stages['solr'] = sum(call.duration for call in timings.calls)
+        stages['total'] = total
+        return stages
+
+    def run(self, options):
+        recordings = load_recordings(options['recordings'])
+        if not recordings:
+            raise CommandError('No recordings in {}'.format(
+                options['recordings']))
+
+        samples = {stage: [] for stage in STAGES}
+        per_query = {}
+        # replayed searches are not real traffic
+        querylog.logger.disabled = True
+        for recording in recordings:
+            # the first run fills template and translation caches
+            self.replay(recording)
+            totals = []
+            for _ in range(options['repeat']):
+                stages = self.replay(recording)
+                for stage in STAGES:
+                    samples[stage].append(stages.get(stage, 0))
+                totals.append(stages['total'])
+            per_query[recording['query']] = summarize(totals)
+
+        result = {
+            'ts': round(time.time()),
+            'label': options['label'],
+            'revision': git_revision(),
+            'searches': len(recordings),
+            'repeat': options['repeat'],
+            'stages': {stage: summarize(values)
+                       for stage, values in samples.items()},
+            'queries': per_query,
+        }
+        history = self.load_history(options['history'])
+        self.report(result, history[-1] if history else None,
+                    options['threshold'])
+        if options['history']:
+            history.append(result)
+            with open(options['history'], 'w', encoding='utf-8') as f:
+                json.dump(history, f, indent=2)
+
+    @staticmethod
+    def load_history(path):
+        if not path or not os.path.exists(path):
+            return []
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def report(self, result, previous, threshold):
+        self.stdout.write('{} searches x {} runs (ms per search)'.format(
+            result['searches'], result['repeat']))
+        self.stdout.write('{:<10} {:>9} {:>9} {:>9}'.format(
+            'stage', 'median', 'p95', 'change'))
+        regressions = []
+        for stage in STAGES:
+            current = result['stages'][stage]
+            change = ''
+            before = previous and previous['stages'].get(stage)
+            if before and before['median']:
+                delta = (current['median'] - before['median']) * 100 / \
+                    before['median']
+                change = '{:+.1f}%'.format(delta)
+                if delta > threshold:
+                    regressions.append(stage)
+            self.stdout.write('{:<10} {:>9.3f} {:>9.3f} {:>9}'.format(
+                stage, current['median'], current['p95'], change))
+        if regressions:
+            self.stdout.write('Slower than the previous run ({}): {}'.format(
+                previous.get('label') or previous.get('revision'),
+                ', '.join(regressions)))
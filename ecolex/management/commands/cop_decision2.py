@@ -13,8 +13,7 @@ from django.conf import settings
 
 from django.db import IntegrityError
 from django.db import OperationalError
-from django.core.exceptions import ObjectDoesNotExist
-from django.core.exceptions import MultipleObjectsReturned
+from django.db import transaction
 
 import logging
 import logging.config
@@ -24,9 +23,13 @@ import django.db
 from requests.adapters import HTTPAdapter
 
 from django.template.defaultfilters import slugify
+from django.utils.functional import cached_property
 
+from ecolex import metrics
+from ecolex.management.cache import NodeCache
 from ecolex.management.commands.base import BaseImporter
 from ecolex.management.definitions import COP_DECISION, TREATY
+from ecolex.management.fulltext import build_full_text
 from ecolex.management.utils import get_file_from_url
 from ecolex.management.utils import keywords_informea_to_ecolex
 from ecolex.management.utils import keywords_ecolex
@@ -70,6 +73,7 @@ class Decision(object):
     # set in CopDecisionImporter.__init__
     languages = None # languages.json
     treaties = None # treaties.json
+    treaties_by_uuid = None # treaties.json, indexed by uuid
 
     def __init__(self, dec, meeting, treaty, solr_id):
         self.dec = dec
@@ -77,10 +81,18 @@ class Decision(object):
         self.treaty = treaty
         self.solr_id = solr_id
 
+    @classmethod
+    def field_names(cls):
+        # the set of fields never changes, resolve it once per class
+        names = cls.__dict__.get('_field_names')
+        if names is None:
+            is_field = lambda member: isinstance(member, Field)
+            names = tuple(name for name, _ in inspect.getmembers(cls, is_field))
+            cls._field_names = names
+        return names
+
     def fields(self):
-        is_field = lambda member: isinstance(member, Field)
-        properties = inspect.getmembers(Decision, is_field)
-        fvalues = ((name, getattr(self, name)) for name, _ in properties)
+        fvalues = ((name, getattr(self, name)) for name in self.field_names())
         return { name: value for name, value in fvalues if value }
 
     @Field
@@ -117,7 +129,8 @@ class Decision(object):
     @Field
     def decBody_zh(self): return self._decBody('zh')
 
-    def _file_data(self, name):
+    @cached_property
+    def _unique_files(self):
         files = self.dec.get('field_files')
 
         if files:
@@ -125,8 +138,11 @@ class Decision(object):
             values = [
                 f for flist in files.values() for f in flist
             ]
-            unique_files = functools.reduce(uniq_on_url, values, [])
-            return [f[name] for f in unique_files]
+            return functools.reduce(uniq_on_url, values, [])
+
+    def _file_data(self, name):
+        if self._unique_files:
+            return [f[name] for f in self._unique_files]
 
     @Field
     def decFileNames(self): return self._file_data('filename')
@@ -139,13 +155,17 @@ class Decision(object):
         node_update = datetime.fromtimestamp(int(self.dec['changed']))
         return node_update.strftime(DATE_FORMAT)
 
-    def _decKeyword(self, lang):
-        to_ecolex = keywords_informea_to_ecolex(
+    @cached_property
+    def _ecolex_keywords(self):
+        # shared by all languages, materialized since it's an iterator
+        return list(keywords_informea_to_ecolex(
             self.informea_keywords,
             self.keywords,
             self.dec.get('field_informea_tags', [])
-        )
-        return keywords_ecolex(to_ecolex, lang)
+        ))
+
+    def _decKeyword(self, lang):
+        return keywords_ecolex(self._ecolex_keywords, lang)
 
     @Field
     def decKeyword_en(self):
@@ -159,11 +179,15 @@ class Decision(object):
     def decKeyword_fr(self):
         return self._decKeyword('fr')
 
-    def _decLanguage(self, lang):
+    @cached_property
+    def _language_codes(self):
         fields = ('title_field', 'body', 'field_files')
         fvalues = filter(bool, map(self.dec.get, fields))
-        langs = set(itertools.chain(*map(methodcaller('keys'), fvalues)))
-        return [self.languages[code][lang] for code in langs if code in self.languages]
+        return set(itertools.chain(*map(methodcaller('keys'), fvalues)))
+
+    def _decLanguage(self, lang):
+        return [self.languages[code][lang]
+                for code in self._language_codes if code in self.languages]
 
     @Field
     def decLanguage_en(self): return self._decLanguage('en')
@@ -268,10 +292,7 @@ class Decision(object):
             uuid = field[0].get('uuid')
             identifier = field[0].get('odata_identifier')
             if not identifier:
-                identifier = next(
-                    (key for key,item in self.treaties.items() if item["uuid"] == uuid),
-                    None
-                )
+                identifier, _ = self.treaties_by_uuid.get(uuid, (None, None))
             return identifier
 
     @Field
@@ -330,16 +351,26 @@ class Decision(object):
         return slugify(slug)
 
 
-def request_json(url, *args, **kwargs):
+def request_response(url, *args, **kwargs):
     # needed to for retry
     s = requests.Session()
     s.mount(url, HTTPAdapter(max_retries=3))
 
     try:
-        return s.get(url, *args, **kwargs).json()
+        response = s.get(url, *args, **kwargs)
     except Exception:
         logger.exception('Error fetching url: %s.', url)
         raise
+    metrics.IMPORT_DOWNLOAD_BYTES.inc(len(response.content))
+    return response
+
+
+def request_json(url, *args, **kwargs):
+    try:
+        return request_response(url, *args, **kwargs).json()
+    except ValueError:
+        logger.exception('Error decoding json from url: %s.', url)
+        raise
 
 
 def request_page(url, per_page, page_num=0, max_pages=False, treaty_uuid=None):
@@ -361,23 +392,70 @@ def request_uuid(base_url, uuid):
     return request_json(url)
 
 
+def request_cached_uuid(base_url, cache, uuid):
+    """ Fetch a node through the persistent cache.
+
+        Fresh entries are returned without contacting the server. Stale ones
+        are revalidated using their ETag, so unchanged nodes cost a 304.
+        Without a cache, the node is always downloaded.
+    """
+    url = '{}/{}/json'.format(base_url, uuid)
+    if not cache:
+        logger.info('Fetching uuid: %s from %s!', uuid, url)
+        return request_response(url).json()
+
+    entry = cache.get(uuid)
+    fresh = cache.is_fresh(entry)
+    metrics.cache_lookup('informea_nodes', fresh)
+    if fresh:
+        logger.info('Node from cache: %s', uuid)
+        return entry['data']
+
+    headers = {}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+
+    logger.info('Fetching uuid: %s from %s!', uuid, url)
+    resp = request_response(url, headers=headers)
+
+    if resp.status_code == 304 and entry:
+        logger.info('Node not modified: %s', uuid)
+        cache.touch(uuid)
+        return entry['data']
+
+    try:
+        data = resp.json()
+    except ValueError:
+        logger.exception('Error decoding json from url: %s.', url)
+        raise
+    if resp.status_code != 200 or not data:
+        # error pages and empty results are not worth keeping for a week
+        logger.warning('Not caching node %s (status %s).', uuid,
+                       resp.status_code)
+        return data
+    cache.set(uuid, data, resp.headers.get('ETag'))
+    logger.info('Cached node: %s', uuid)
+    return data
+
+
 def request_meeting(base_url, cache, json_decision):
     meeting = json_decision.get('field_meeting')
     uuid = meeting[0]['uuid'] if meeting else None
     if uuid:
-        cached = cache.get(uuid)
-        if cached:
-            logger.info('Meeting from cache: %s', uuid)
-            return cached
-        else:
-            logger.info('Requesting meeting: %s', uuid)
-            resp = request_uuid(base_url, uuid)
-            cache[uuid] = resp
-            logger.info('Cached meeting: %s', uuid)
-            return cache[uuid]
+        logger.info('Requesting meeting: %s', uuid)
+        return request_cached_uuid(base_url, cache, uuid)
+
 
+def index_treaties(treaties):
+    """ Index treaties.json by uuid, mapping to (identifier, treaty). """
+    return {
+        treaty['uuid']: (key, treaty)
+        for key, treaty in treaties.items()
+        if treaty.get('uuid')
+    }
 
-def request_treaty(solr, treaties, cache, json_decision):
+
+def request_treaty(solr, treaties_by_uuid, cache, json_decision):
     treaty_uuid = json_decision.get(
         'field_treaty',
         [{"uuid": None}]
@@ -391,10 +469,7 @@ def request_treaty(solr, treaties, cache, json_decision):
         logger.info('Treaty from cache: %s', treaty_uuid)
         return cached
 
-    json_treaty = next(
-        (x for x in treaties.values() if x["uuid"] == treaty_uuid),
-        None
-    )
+    _, json_treaty = treaties_by_uuid.get(treaty_uuid, (None, None))
     if not json_treaty:
         logger.warn('Unknown treaty %s', treaty_uuid)
         return None, None
@@ -420,46 +495,59 @@ def request_treaty(solr, treaties, cache, json_decision):
     return treaty, treaty_uuid
 
 
-def create_document(dec_id, url, text, size, retry=True):
-    create = functools.partial(
-        DocumentText.objects.create,
-        doc_id=dec_id,
-        doc_type=COP_DECISION,
-        status=DocumentText.FULL_INDEXED,
-    )
+def create_documents(dec_id, texts, retry=True):
+    docs = [
+        DocumentText(
+            doc_id=dec_id,
+            doc_type=COP_DECISION,
+            status=DocumentText.FULL_INDEXED,
+            url=url,
+            text=text,
+            doc_size=size,
+        )
+        for url, text, size in texts
+    ]
     try:
-        create(url=url, text=text, doc_size=size)
-        logger.info('Created DocumentText for: %s.', url)
+        DocumentText.objects.bulk_upsert(docs, [])
+        logger.info('Created %s DocumentText for: %s.', len(docs), dec_id)
     except IntegrityError:
-        logger.exception('Error creating DocumentText for: %s!', url)
+        # the batch was rolled back, keep the rows that can be saved
+        logger.warning('Error creating DocumentText for: %s, creating them '
+                       'one by one.', dec_id)
+        for doc in docs:
+            doc.pk = None
+            try:
+                with transaction.atomic():
+                    doc.save()
+            except IntegrityError:
+                logger.exception('Error creating DocumentText for: %s!',
+                                 doc.url)
     except OperationalError:
         if retry:
             # retry once, resetting the db connection beforehand
             logger.warning(
-                'Error creating DocumentText for: %s, retrying!', url)
+                'Error creating DocumentText for: %s, retrying!', dec_id)
             reset_db_connection()
-            create_document(dec_id, url, text, size, retry=False)
+            create_documents(dec_id, texts, retry=False)
         else:
             logger.exception(
-                'Error creating DocumentText for: %s! No more retries!', url)
+                'Error creating DocumentText for: %s! No more retries!', dec_id)
 
 
-def has_document(dec_id, url, retry=True):
+def find_documents(dec_id, urls, retry=True):
+    """ Existing DocumentText for all urls of a decision, keyed by url. """
     try:
-        return DocumentText.objects.get(
-            doc_id=dec_id, doc_type=COP_DECISION, url=url)
-        logger.info('DocumentText exists for: %s.', url)
-    except ObjectDoesNotExist:
-        logger.info('DocumentText missing for: %s.', url)
-    except MultipleObjectsReturned:
-        logger.warning('DocumentText multiple values for: %s!', url)
+        docs = DocumentText.objects.lookup_many(
+            [(dec_id, url) for url in urls], doc_type=COP_DECISION)
+        return {url: doc for (_, url), doc in docs.items()}
     except OperationalError as err:
         if retry:
             logger.warning('Database error: %s! Retrying!', err)
             reset_db_connection()
-            has_document(dec_id, url, retry=False)
+            return find_documents(dec_id, urls, retry=False)
         else:
             logger.error('Database error: %s! No more retries!', err)
+            return {}
 
 
 def extract_text(solr, dec_id, urls):
@@ -474,10 +562,12 @@ def extract_text(solr, dec_id, urls):
     if not uniq_urls:
         logger.info('Decision %s has no files!', dec_id)
 
+    documents = find_documents(dec_id, uniq_urls) if uniq_urls else {}
+
     # gather information about files
     for url in uniq_urls:
         logger.info('Extracting text from %s', url)
-        document = has_document(dec_id, url)
+        document = documents.get(url)
         if document:
             # text exists, grab it from sql
             logger.info('Using existing text.')
@@ -496,11 +586,12 @@ def extract_text(solr, dec_id, urls):
             except Exception:
                 logger.exception('Error extracting file: %s', url)
 
-    for url, text, size, exists in texts:
-        if not exists:
-            create_document(dec_id, url, text, size)
+    missing = [(url, text, size) for url, text, size, exists in texts
+               if not exists]
+    if missing:
+        create_documents(dec_id, missing)
 
-    return ''.join((text or '' for _, text, _, _ in texts))
+    return build_full_text((text for _, text, _, _ in texts), dec_id, logger)
 
 
 def get_node(base_url, per_page, start=0, max_pages=False, treaty_uuid=None):
@@ -557,6 +648,15 @@ def find_solr_id(solr, uuid):
         logger.info('Not found in solr. New entry will be created.')
 
 
+def split_record(record):
+    """ Stored records are either bare decision nodes, or dicts holding the
+        decision node together with its meeting node and treaty.
+    """
+    if 'decision' in record:
+        return record['decision'], record.get('meeting'), record.get('treaty')
+    return record, None, None
+
+
 class CopDecisionImporter(BaseImporter):
 
     id_field = 'decId'
@@ -568,23 +668,28 @@ class CopDecisionImporter(BaseImporter):
         self.per_page = config.get('items_per_page')
         self.max_pages = config.get('max_pages', False)
         self.node_url = config.get('node_url')
+        # no persistent cache unless a directory is configured
+        node_cache_dir = config.get('node_cache_dir')
+        self.node_cache = node_cache_dir and NodeCache(
+            node_cache_dir, config.get('node_cache_ttl', 0))
+        self.treaties_by_uuid = index_treaties(self.treaties)
 
         self.report = Report()
 
         # Set these at class level as they don't change
         Decision.languages = self.languages
         Decision.treaties = self.treaties
+        Decision.treaties_by_uuid = self.treaties_by_uuid
         Decision.keywords = self.keywords
         Decision.informea_keywords = self.informea_keywords
 
-
-        # wrap request_meeting in order to provide a caching dict
+        # wrap request_meeting in order to provide the persistent node cache
         # also pass the base_url, since it's the same at all times
         self.fetch_meeting = functools.partial(
-            request_meeting, self.node_url, {})
+            request_meeting, self.node_url, self.node_cache)
 
         self.fetch_treaty = functools.partial(
-            request_treaty, self.solr, self.treaties, {})
+            request_treaty, self.solr, self.treaties_by_uuid, {})
 
     def harvest_one(self, uuid, solr_id='check', force=True):
         logger.info('Harvesting: %s', uuid)
@@ -605,6 +710,12 @@ class CopDecisionImporter(BaseImporter):
             logger.error('Cannot request URLs for: %s. Skipping!', uuid)
             raise
 
+        self.snapshot_json(uuid, {
+            'decision': json_decision,
+            'meeting': json_meeting,
+            'treaty': json_treaty,
+        })
+
         decision = Decision(json_decision, json_meeting, json_treaty, solr_id)
 
         fields = decision.fields()
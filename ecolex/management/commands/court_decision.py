@@ -16,6 +16,7 @@ from django.template.defaultfilters import slugify
 from ecolex.management.commands.base import BaseImporter
 from ecolex.management.commands.logging import LOG_DICT
 from ecolex.management.definitions import COURT_DECISION
+from ecolex.management.fulltext import build_full_text
 from ecolex.management.utils import (
     get_file_from_url,
     get_dict_from_json,
@@ -281,6 +282,7 @@ class CourtDecision(object):
             'cdCountry_fr': [],
             'cdLinkToFullText': [],
         }
+        texts = []
         for json_field, solr_field in FIELD_MAP.items():
             json_value = self.data.get(json_field, None)
             # print(f"field: {json_field}, value: {json_value}")
@@ -374,7 +376,7 @@ class CourtDecision(object):
                     self.solr.extract(f) or ''
                     for f in files if f
                 ])
-                solr_decision['cdText'] += text
+                texts.append(text)
 
         # cdRegion fallback on field_ecolex_region
         if not solr_decision.get('cdRegion_en'):
@@ -396,8 +398,8 @@ class CourtDecision(object):
         for url in full_text_urls:
             file_obj = get_file_from_url(url)
             if file_obj:
-                text = self.solr.extract(file_obj) or ''
-                solr_decision['cdText'] += '\n' + text
+                texts.append(self.solr.extract(file_obj) or '')
+        solr_decision['cdText'] = build_full_text(texts, informea_id, logger)
 
         # Get Leo URL
         for url_field in SOURCE_URL_FIELDS:
@@ -497,6 +499,7 @@ class CourtDecisionImporter(BaseImporter):
         data = request_json(node['data_url'])
         if type(data) is list:
             data = data[0]
+        self.snapshot_json(node['uuid'], data)
 
         dec = CourtDecision(
             data,
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Remove the expired and the oldest entries over MAX_ENTRIES from '
+            'the caches not culled on writes, see ecolex.caching.FileCache')
+
+    def handle(self, *args, **options):
+        for alias in settings.CACHES:
+            cache = caches[alias]
+            if not hasattr(cache, 'cull'):
+                continue
+            removed = cache.cull()
+            if options['verbosity']:
+                self.stdout.write('Removed {} entries from the {} cache.'.format(
+                    removed, alias))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ecolex.instrumentation import solr_call
+from ecolex.management.utils import EcolexSolr
+from ecolex.models import DocumentId
+
+
+class Command(BaseCommand):
+    help = ('Fill the table of source IDs used by the redirects of old URLs '
+            'from the documents in Solr')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true', default=False,
+                            help='Drop the IDs of documents no longer indexed')
+
+    def handle(self, *args, **options):
+        solr = EcolexSolr()
+        fields = ('type', 'slug') + DocumentId.ID_FIELDS
+        rows = options['rows']
+
+        with transaction.atomic():
+            if options['clear']:
+                DocumentId.objects.all().delete()
+            count = 0
+            start = 0
+            while True:
+                with solr_call() as call:
+                    result = solr.solr.search('*:*', fl=','.join(fields),
+                                              sort='id asc', rows=rows,
+                                              start=start)
+                    call.qtime = result.qtime
+                DocumentId.objects.record(result.docs)
+                count += len(result.docs)
+                if len(result.docs) < rows:
+                    break
+                start += rows
+
+        self.stdout.write('Recorded the IDs of {} documents, {} in total.'.format(
+            count, DocumentId.objects.count()))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from ecolex.fakesolr import FakeSolr, FakeSolrServer, load_fixtures
+
+
+class Command(BaseCommand):
+    help = 'Serve fixture documents through an in-memory fake Solr'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', nargs='*',
+                            help='JSON files with documents to index')
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8983)
+        parser.add_argument('--core', default='solr/ecolex',
+                            help='Path of the core holding the fixtures')
+
+    def handle(self, *args, **options):
+        fake = FakeSolr()
+        index = fake.index(options['core'].strip('/'))
+        for path in options['fixtures']:
+            index.add(load_fixtures(path))
+
+        server = FakeSolrServer((options['host'], options['port']), fake)
+        self.stdout.write('Serving {} documents at {}{}/'.format(
+            len(index.docs), server.url, options['core'].strip('/')))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -7,6 +7,7 @@ import logging
 
 from django.core.management.base import BaseCommand
 
+from ecolex import caching
 from ecolex.management.definitions import OBJ_TYPES
 from ecolex.management.definitions import COURT_DECISION
 from ecolex.management.definitions import TREATY
@@ -54,6 +55,7 @@ class Command(BaseCommand):
         make_option('--start_page', type=int, default=1),
     )
 
+    @caching.index_changes()
     def handle(self, *args, **options):
         parser = argparse.ArgumentParser(description='Import data into Solr.')
         parser.add_argument('import')
@@ -9,6 +9,7 @@ from pysolr import SolrError
 
 from ecolex.management.commands.logging import LOG_DICT
 from ecolex.management.definitions import LEGISLATION
+from ecolex.management.fulltext import build_full_text
 from ecolex.management.utils import EcolexSolr, get_file_from_url, cleanup_copyfields
 
 from ecolex.management.utils import get_content_length_from_url
@@ -27,18 +28,15 @@ class LegislationImporter(object):
 
     def update_full_text(self):
         logger.info('[Legislation] Update full text started.')
-        while True:
-            count = (DocumentText.objects.filter(
-                     status=DocumentText.INDEXED, doc_type=LEGISLATION)
-                     .exclude(url__isnull=True)).count()
-            objs = (DocumentText.objects.filter(
-                    status=DocumentText.INDEXED, doc_type=LEGISLATION)
-                    .exclude(url__isnull=True))[:100]
-            logger.info('%s records remaining' % (count,))
-            if count == 0:
-                break
-            for obj in objs:
-                self.update_full_text_one(obj)
+        queue = (DocumentText.objects.filter(doc_type=LEGISLATION)
+                 .exclude(url__isnull=True))
+        count = queue.filter(status=DocumentText.INDEXED).count()
+        logger.info('%s records remaining' % (count,))
+        objs = queue.iter_queue(DocumentText.INDEXED)
+        for idx, obj in enumerate(objs, start=1):
+            self.update_full_text_one(obj)
+            if idx % 100 == 0:
+                logger.info('%s records remaining' % (max(count - idx, 0),))
 
         logger.info('[Legislation] Update full text finished.')
 
@@ -84,7 +82,7 @@ class LegislationImporter(object):
             logger.error(f"Failed to find legislation {obj.doc_id}")
             return
 
-        legislation["legText"] = text
+        legislation["legText"] = build_full_text([text], obj.doc_id, logger)
         result = self.solr.add(legislation)
         if result:
             logger.info(f"Success download & indexed: {obj.doc_id}")
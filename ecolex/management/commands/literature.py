@@ -14,6 +14,7 @@ from pysolr import SolrError
 from ecolex.management.commands.base import BaseImporter
 from ecolex.management.commands.logging import LOG_DICT
 from ecolex.management.definitions import LITERATURE
+from ecolex.management.fulltext import build_full_text
 from ecolex.management.utils import format_date, valid_date, cleanup_copyfields
 from ecolex.management.utils import (
     get_content_from_url,
@@ -310,6 +311,7 @@ class LiteratureImporter(BaseImporter):
                             logger.error(url)
                         raw_literatures.append(content)
 
+            self.snapshot_pages(raw_literatures, 'id')
             try:
                 literatures = self._parse(raw_literatures)
                 new_literatures = list(filter(bool, [self._get_solr_lit(lit) for
@@ -374,7 +376,7 @@ class LiteratureImporter(BaseImporter):
 
                 for field in TEXT_DATE_FIELDS:
                     if field in data:
-                        data[field], temp_doc_date = clean_text_date(data[field])
+                        data[field], temp_doc_date, _ = clean_text_date(data[field])
                         if temp_doc_date and 'litDate' not in data:
                             data['litDate'] = temp_doc_date
                 # litDateOfText parsing error log
@@ -420,7 +422,7 @@ class LiteratureImporter(BaseImporter):
         for literature in literatures:
             url_list = literature.get(URL_FIELD, [])
             litId = literature['litId']
-            lit_text = ''
+            texts = []
             if not url_list:
                 # Nothing to download
                 doc, _ = DocumentText.objects.get_or_create(
@@ -432,7 +434,7 @@ class LiteratureImporter(BaseImporter):
                 doc, _ = DocumentText.objects.get_or_create(
                     doc_id=litId, doc_type=LITERATURE, url=url)
                 if doc.status == DocumentText.FULL_INDEXED:
-                    lit_text += doc.text
+                    texts.append(doc.text)
                     logger.info('Already indexed %s' % url)
                 else:
                     logger.info('Downloading: %s' % url)
@@ -440,7 +442,7 @@ class LiteratureImporter(BaseImporter):
                     if file_obj:
                         logger.debug('Success downloading: %s' % url)
                         doc.text = self.solr.extract(file_obj) or ''
-                        lit_text += doc.text
+                        texts.append(doc.text)
                         doc.status = DocumentText.FULL_INDEXED
                         doc.doc_size = file_obj.getbuffer().nbytes
                         try:
@@ -457,79 +459,72 @@ class LiteratureImporter(BaseImporter):
                         doc.status = DocumentText.INDEXED
                         doc.save()
 
-            literature['litText'] = lit_text
+            literature['litText'] = build_full_text(texts, litId, logger)
 
     def update_full_text(self):
         logger.info('[Literature] Update full text started.')
-        old_objs = []
-        while True:
-            count = (DocumentText.objects.filter(
-                     status=DocumentText.INDEXED, doc_type=LITERATURE)
-                     .exclude(url__isnull=True)).count()
-            objs = (DocumentText.objects.filter(
-                    status=DocumentText.INDEXED, doc_type=LITERATURE)
-                    .exclude(url__isnull=True))[:100]
-            if count == 0 or list(old_objs) == list(objs):
-                break
-            logger.info('%s records remaining' % (count,))
-            for obj in objs:
-                # Check if already parsed
-                text = None
-                if obj.doc_size and obj.text:
-                    logger.info('Checking content length of %s (%s)' %
-                                (obj.doc_id, obj.url,))
-                    doc_size = get_content_length_from_url(obj.url)
-                    if doc_size == obj.doc_size:
-                        # File not changed, reuse obj.text
-                        logger.debug('Not changed: %s' % (obj.url,))
-                        text = obj.text
-                # Download file
-                if not text:
-                    logger.info('Downloading: %s (%s)' % (obj.doc_id, obj.url,))
-                    file_obj = get_file_from_url(obj.url)
-                    if not file_obj:
-                        logger.error('Failed downloading: %s' % (obj.url,))
-                        continue
-                    doc_size = file_obj.getbuffer().nbytes
-
-                    # Extract text
-                    logger.debug('Indexing: %s' % (obj.url,))
-                    text = self.solr.extract(file_obj)
-                    if not text:
-                        logger.warn('Nothing to index for %s' % (obj.url,))
-                # Load record and store text
-                try:
-                    literature = self.solr.search(LITERATURE, obj.doc_id)
-                    if literature:
-                        literature = cleanup_copyfields(literature)
-                except SolrError as e:
-                    logger.error('Error reading literature %s' % (obj.doc_id,))
-                    if settings.DEBUG:
-                        logging.getLogger('solr').exception(e)
-                    continue
-
-                if not literature:
-                    logger.error('Failed to find literature %s' % (obj.doc_id))
+        queue = (DocumentText.objects.filter(doc_type=LITERATURE)
+                 .exclude(url__isnull=True))
+        count = queue.filter(status=DocumentText.INDEXED).count()
+        logger.info('%s records remaining' % (count,))
+        for obj in queue.iter_queue(DocumentText.INDEXED):
+            # Check if already parsed
+            text = None
+            if obj.doc_size and obj.text:
+                logger.info('Checking content length of %s (%s)' %
+                            (obj.doc_id, obj.url,))
+                doc_size = get_content_length_from_url(obj.url)
+                if doc_size == obj.doc_size:
+                    # File not changed, reuse obj.text
+                    logger.debug('Not changed: %s' % (obj.url,))
+                    text = obj.text
+            # Download file
+            if not text:
+                logger.info('Downloading: %s (%s)' % (obj.doc_id, obj.url,))
+                file_obj = get_file_from_url(obj.url)
+                if not file_obj:
+                    logger.error('Failed downloading: %s' % (obj.url,))
                     continue
+                doc_size = file_obj.getbuffer().nbytes
 
-                literature['legText'] = text
-                result = self.solr.add(literature)
-                if result:
-                    logger.info('Success download & indexed: %s' % (obj.doc_id,))
-                    obj.status = DocumentText.FULL_INDEXED
-                    obj.doc_size = doc_size
-                    obj.text = text
-                    try:
-                        obj.save()
-                    except OperationalError as e:
-                        logger.error("DB insert error %s %s" % (obj.doc_id, e))
-                        obj.status = DocumentText.FULL_INDEX_FAIL
-                        obj.text = None
-                        obj.save()
-                else:
-                    logger.error('Failed doc extract %s %s' % (obj.url,
-                                                               literature['id']))
-            old_objs = objs
+                # Extract text
+                logger.debug('Indexing: %s' % (obj.url,))
+                text = self.solr.extract(file_obj)
+                if not text:
+                    logger.warn('Nothing to index for %s' % (obj.url,))
+            # Load record and store text
+            try:
+                literature = self.solr.search(LITERATURE, obj.doc_id)
+                if literature:
+                    literature = cleanup_copyfields(literature)
+            except SolrError as e:
+                logger.error('Error reading literature %s' % (obj.doc_id,))
+                if settings.DEBUG:
+                    logging.getLogger('solr').exception(e)
+                continue
+
+            if not literature:
+                logger.error('Failed to find literature %s' % (obj.doc_id))
+                continue
+
+            literature['legText'] = build_full_text([text], obj.doc_id,
+                                                    logger)
+            result = self.solr.add(literature)
+            if result:
+                logger.info('Success download & indexed: %s' % (obj.doc_id,))
+                obj.status = DocumentText.FULL_INDEXED
+                obj.doc_size = doc_size
+                obj.text = text
+                try:
+                    obj.save()
+                except OperationalError as e:
+                    logger.error("DB insert error %s %s" % (obj.doc_id, e))
+                    obj.status = DocumentText.FULL_INDEX_FAIL
+                    obj.text = None
+                    obj.save()
+            else:
+                logger.error('Failed doc extract %s %s' % (obj.url,
+                                                           literature['id']))
         logger.info('[Literature] Update full text finished.')
 
     def _get_solr_lit(self, lit_data):
@@ -0,0 +1,379 @@
+"""
+Load test of the public site with a realistic mix of pages.
+
+By default the site is served in-process by a threaded WSGI server, backed by
+ecolex.fakesolr loaded with the given fixtures. With --url, an already running
+site (e.g. gunicorn with EDW_RUN_SOLR_URI pointing to `manage.py fake_solr`) is
+tested instead; the URLs are built from documents sampled from --solr.
+"""
+
+import json
+import random
+import socketserver
+import threading
+import time
+from collections import Counter, OrderedDict
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import pysolr
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.core.wsgi import get_wsgi_application
+from django.http import QueryDict
+from scorched import SolrInterface
+
+from ecolex.fakesolr import load_fixtures, start_server
+from ecolex.management.commands.query_report import percentile
+from ecolex.views import DetailPageRedirectView, OldEcolexRedirectView
+from ecolex.xviews import run_search, search_form
+
+
+# relative weight of each kind of page in the traffic
+ROUTES = OrderedDict([
+    ('homepage', 5),
+    ('search', 25),
+    ('search_page', 10),
+    ('details', 30),
+    ('related', 5),
+    ('api_facets', 10),
+    ('export', 5),
+    ('redirect', 10),
+])
+
+TERMS = ('water', 'forest', 'biodiversity', 'climate', 'fisheries',
+         'wildlife', 'pollution', 'waste')
+
+RELATED_PAGES = ('related_legislation', 'related_decisions',
+                 'related_literatures', 'related_court_decisions',
+                 'treaty-participants')
+
+API_FACETS = ('xcountry', 'xkeywords', 'xsubjects', 'xregion')
+
+SAMPLE_SIZE = 200
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def serve_site(host='127.0.0.1'):
+    server = ThreadingWSGIServer((host, 0), QuietHandler)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://{}:{}'.format(*server.server_address)
+
+
+def sample_documents(solr_uri):
+    """ Slugs and ids of some documents of each type. """
+    solr = pysolr.Solr(solr_uri, timeout=60)
+    documents = {}
+    for doc_type, id_fields in DetailPageRedirectView.doc_type_map.items():
+        fields = ['slug'] + list(id_fields)
+        docs = solr.search('type:{}'.format(doc_type), fl=','.join(fields),
+                           rows=SAMPLE_SIZE)
+        docs = [doc for doc in docs if doc.get('slug')]
+        if docs:
+            documents[doc_type] = docs
+    return documents
+
+
+def sample_facets(solr_uri):
+    """ Values of the common facets, to filter searches with. """
+    response, _ = run_search(search_form(QueryDict('')), settings.LANGUAGE_CODE,
+                             SolrInterface(solr_uri))
+    return {
+        field: [item['text'] for item in response.facets.get(field, [])]
+        for field in API_FACETS if response.facets.get(field)
+    }
+
+
+def identified_documents(documents):
+    """ The (document, source ID) pairs of each type, for the documents
+        having a source ID the redirects can find them by.
+    """
+    identified = {}
+    for doc_type, docs in documents.items():
+        id_fields = DetailPageRedirectView.doc_type_map[doc_type]
+        pairs = []
+        for doc in docs:
+            doc_id = next((doc[f] for f in id_fields if doc.get(f)), None)
+            if doc_id:
+                pairs.append((doc, doc_id))
+        if pairs:
+            identified[doc_type] = pairs
+    return identified
+
+
+class Scenario(object):
+    """ Builds the URL of a random page of each route. """
+
+    def __init__(self, documents, facets, terms=TERMS):
+        self.documents = documents
+        self.identified = identified_documents(documents)
+        self.facets = facets
+        self.terms = terms
+
+    def available(self, route):
+        if route in ('details', 'export'):
+            return bool(self.documents)
+        if route == 'redirect':
+            return bool(self.identified)
+        if route == 'related':
+            return bool(self.documents.get('treaty'))
+        return True
+
+    def url(self, route, rnd):
+        return getattr(self, route)(rnd)
+
+    def homepage(self, rnd):
+        return reverse('homepage')
+
+    def search_params(self, rnd):
+        params = [('q', rnd.choice(self.terms))]
+        if self.documents and rnd.random() < 0.3:
+            params.append(('type', rnd.choice(list(self.documents))))
+        if self.facets and rnd.random() < 0.5:
+            field = rnd.choice(list(self.facets))
+            params.append((field, rnd.choice(self.facets[field])))
+        return params
+
+    def search(self, rnd):
+        return reverse('results') + '?' + urlencode(self.search_params(rnd))
+
+    def search_page(self, rnd):
+        params = self.search_params(rnd) + [('page', rnd.randint(2, 5))]
+        return reverse('results') + '?' + urlencode(params)
+
+    def document(self, rnd, doc_type=None):
+        doc_type = doc_type or rnd.choice(list(self.documents))
+        return doc_type, rnd.choice(self.documents[doc_type])
+
+    def details(self, rnd):
+        doc_type, doc = self.document(rnd)
+        return reverse(doc_type + '_details', kwargs={'slug': doc['slug']})
+
+    def related(self, rnd):
+        _, doc = self.document(rnd, 'treaty')
+        return reverse(rnd.choice(RELATED_PAGES), kwargs={'slug': doc['slug']})
+
+    def api_facets(self, rnd):
+        field = rnd.choice(API_FACETS)
+        url = reverse('api:{}-list'.format(field.replace('_', '-')))
+        return url + '?' + urlencode([('q', rnd.choice(self.terms))])
+
+    def export(self, rnd):
+        doc_type, doc = self.document(rnd)
+        if rnd.random() < 0.5:
+            params = [('slug', doc['slug'])]
+        else:
+            params = [('type', doc_type), ('rows', 50)]
+        return reverse('export') + '?' + urlencode(params)
+
+    def redirect(self, rnd):
+        doc_type = rnd.choice(list(self.identified))
+        _, doc_id = rnd.choice(self.identified[doc_type])
+        old_types = {v: k for k, v in OldEcolexRedirectView.doc_type_map.items()}
+        if doc_type in old_types and rnd.random() < 0.5:
+            params = [('index', old_types[doc_type]), ('id', doc_id)]
+            return reverse('oldecolex_redirect') + '?' + urlencode(params)
+        return reverse('detailpage_redirect',
+                       kwargs={'doc_type': doc_type, 'doc_id': doc_id})
+
+
+class RouteStats(object):
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+
+    def add(self, latency, status):
+        self.latencies.append(latency)
+        self.statuses[status] += 1
+        if status is None or status >= 400:
+            self.errors += 1
+
+    def summary(self, elapsed):
+        return OrderedDict([
+            ('requests', len(self.latencies)),
+            ('errors', self.errors),
+            ('rps', round(len(self.latencies) / elapsed, 2)),
+            ('p50', round(percentile(self.latencies, .5) * 1000, 1)),
+            ('p95', round(percentile(self.latencies, .95) * 1000, 1)),
+            ('p99', round(percentile(self.latencies, .99) * 1000, 1)),
+            ('statuses', {str(k): v for k, v in self.statuses.items()}),
+        ])
+
+
+class LoadRun(object):
+
+    def __init__(self, base_url, scenario, routes, concurrency, duration,
+                 max_requests, seed, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.scenario = scenario
+        self.routes = list(routes)
+        self.weights = list(routes.values())
+        self.concurrency = concurrency
+        self.duration = duration
+        self.max_requests = max_requests
+        self.seed = seed
+        self.timeout = timeout
+        self.stats = OrderedDict((route, RouteStats()) for route in routes)
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    def next_slot(self, deadline):
+        with self.lock:
+            if time.perf_counter() > deadline:
+                return False
+            if self.max_requests and self.sent >= self.max_requests:
+                return False
+            self.sent += 1
+            return True
+
+    def worker(self, index, deadline):
+        rnd = random.Random(self.seed + index)
+        session = requests.Session()
+        while self.next_slot(deadline):
+            route = rnd.choices(self.routes, self.weights)[0]
+            url = self.base_url + self.scenario.url(route, rnd)
+            start = time.perf_counter()
+            try:
+                response = session.get(url, allow_redirects=False,
+                                       timeout=self.timeout)
+                status = response.status_code
+            except requests.RequestException:
+                status = None
+            latency = time.perf_counter() - start
+            with self.lock:
+                self.stats[route].add(latency, status)
+
+    def run(self):
+        start = time.perf_counter()
+        deadline = start + self.duration
+        threads = [
+            threading.Thread(target=self.worker, args=(idx, deadline),
+                             daemon=True)
+            for idx in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = 'Drive the site with a mix of searches, details pages and exports'
+    # the URL checks would load the search schema before the fake Solr runs
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', nargs='*',
+                            help='JSON files with documents for the fake Solr')
+        parser.add_argument('--url', default=None,
+                            help='Test this running site instead')
+        parser.add_argument('--solr', default=None,
+                            help='Solr to sample documents from with --url '
+                                 '(default: SOLR_URI)')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Seconds to run for')
+        parser.add_argument('--requests', type=int, default=0,
+                            help='Stop after this many requests')
+        parser.add_argument('--routes', default=None,
+                            help='Comma separated routes to test, of: ' +
+                                 ', '.join(ROUTES))
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--output', default=None,
+                            help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        servers = []
+        try:
+            base_url, solr_uri = self.setup(options, servers)
+            scenario = Scenario(sample_documents(solr_uri),
+                                sample_facets(solr_uri))
+            routes = self.get_routes(options['routes'], scenario)
+            load = LoadRun(base_url, scenario, routes,
+                           options['concurrency'], options['duration'],
+                           options['requests'], options['seed'],
+                           options['timeout'])
+            elapsed = load.run()
+        finally:
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+
+        results = OrderedDict([
+            ('url', base_url),
+            ('concurrency', options['concurrency']),
+            ('seconds', round(elapsed, 2)),
+            ('routes', OrderedDict(
+                (route, stats.summary(elapsed))
+                for route, stats in load.stats.items() if stats.latencies)),
+        ])
+        total = RouteStats()
+        for stats in load.stats.values():
+            total.latencies += stats.latencies
+            total.statuses.update(stats.statuses)
+            total.errors += stats.errors
+        if total.latencies:
+            results['total'] = total.summary(elapsed)
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+
+    def setup(self, options, servers):
+        if options['url']:
+            return options['url'], options['solr'] or settings.SOLR_URI
+        if not options['fixtures']:
+            raise CommandError('Give fixtures for the fake Solr, or --url')
+
+        documents = []
+        for path in options['fixtures']:
+            documents += load_fixtures(path)
+        solr = start_server(documents=documents)
+        servers.append(solr)
+        settings.SOLR_URI = solr.url + 'solr/ecolex/'
+        site, base_url = serve_site()
+        servers.append(site)
+        return base_url, settings.SOLR_URI
+
+    def get_routes(self, names, scenario):
+        names = names.split(',') if names else list(ROUTES)
+        unknown = set(names) - set(ROUTES)
+        if unknown:
+            raise CommandError('Unknown routes: {}'.format(
+                ', '.join(sorted(unknown))))
+        routes = OrderedDict((name, ROUTES[name]) for name in names
+                             if scenario.available(name))
+        if not routes:
+            raise CommandError('No documents to build the pages from')
+        return routes
+
+    def report(self, results):
+        self.stdout.write('{} with {} clients for {}s'.format(
+            results['url'], results['concurrency'], results['seconds']))
+        self.stdout.write('{:<12} {:>8} {:>7} {:>8} {:>8} {:>8} {:>8}'.format(
+            'route', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+            'p99 ms'))
+        rows = list(results['routes'].items())
+        if 'total' in results:
+            rows.append(('total', results['total']))
+        for route, summary in rows:
+            self.stdout.write(
+                '{:<12} {requests:>8} {errors:>7} {rps:>8.1f} {p50:>8.1f} '
+                '{p95:>8.1f} {p99:>8.1f}'.format(route, **summary))
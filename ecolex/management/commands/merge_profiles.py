@@ -0,0 +1,66 @@
+import os
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from ecolex import profiling
+
+
+class Command(BaseCommand):
+    help = 'Merge the sampled request profiles into one file per URL name'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*',
+                            help='URL names to merge (default all)')
+        parser.add_argument('--directory', default=None,
+                            help='Profiles directory (default PROFILING)')
+        parser.add_argument('--output', default=None,
+                            help='Output directory (default DIRECTORY/merged)')
+        parser.add_argument('--days', type=float, default=None,
+                            help='Only merge profiles of the last DAYS days')
+        parser.add_argument('--delete', action='store_true', default=False,
+                            help='Remove the request profiles once merged')
+
+    def handle(self, *args, **options):
+        directory = (options['directory'] or
+                     profiling.get_profiling_settings()['directory'])
+        output = options['output'] or os.path.join(directory, 'merged')
+        since = (time.time() - options['days'] * 86400
+                 if options['days'] else 0)
+
+        if not os.path.isdir(directory):
+            self.stdout.write('No profiles in {}.'.format(directory))
+            return
+
+        names = options['names'] or sorted(
+            name for name in os.listdir(directory)
+            if os.path.isdir(os.path.join(directory, name)) and
+            os.path.join(directory, name) != output)
+        os.makedirs(output, exist_ok=True)
+
+        for name in names:
+            source = os.path.join(directory, name)
+            paths = [
+                os.path.join(source, file_name)
+                for file_name in sorted(os.listdir(source))
+                if file_name.endswith(profiling.EXTENSION) and
+                os.path.getmtime(os.path.join(source, file_name)) >= since
+            ]
+            if not paths:
+                continue
+
+            stacks = Counter()
+            for path in paths:
+                stacks.update(profiling.read_profile(path))
+
+            target = os.path.join(output, name + profiling.EXTENSION)
+            with open(target, 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write('{} {}\n'.format(stack, count))
+            if options['delete']:
+                for path in paths:
+                    os.remove(path)
+
+            self.stdout.write('{}: {} requests, {} samples -> {}'.format(
+                name, len(paths), sum(stacks.values()), target))
@@ -0,0 +1,131 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from ecolex import querylog
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class QueryStats(object):
+
+    def __init__(self, key):
+        self.key = key
+        self.count = 0
+        self.total_times = []
+        self.qtimes = []
+        self.results = None
+
+    def add(self, entry):
+        self.count += 1
+        if entry.get('total_time') is not None:
+            self.total_times.append(entry['total_time'])
+        if entry.get('qtime') is not None:
+            self.qtimes.append(entry['qtime'])
+        if entry.get('count') is not None:
+            self.results = entry['count']
+
+    @property
+    def median(self):
+        return percentile(self.total_times, 0.5)
+
+    @property
+    def p95(self):
+        return percentile(self.total_times, 0.95)
+
+    @property
+    def median_qtime(self):
+        return percentile(self.qtimes, 0.5)
+
+
+def format_ms(value):
+    return '-' if value is None else '{:.0f}'.format(value)
+
+
+class Command(BaseCommand):
+    help = 'Summarize the recorded searches: most frequent, slowest, facets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20,
+                            help='Number of queries listed in each section')
+        parser.add_argument('--days', type=float, default=None,
+                            help='Only include the last DAYS days')
+        parser.add_argument('--log', default=None,
+                            help='Query log file (default QUERY_LOG_FILE)')
+
+    def handle(self, *args, **options):
+        since = (time.time() - options['days'] * 86400
+                 if options['days'] else 0)
+
+        queries = {}
+        facets = Counter()
+        ranges = Counter()
+        types = Counter()
+        sorts = Counter()
+        pages = Counter()
+        searches = 0
+        for entry in querylog.read_entries(options['log']):
+            if (entry.get('kind') != querylog.SEARCH or
+                    entry.get('ts', 0) < since):
+                continue
+            searches += 1
+            key = entry['key']
+            if key not in queries:
+                queries[key] = QueryStats(key)
+            queries[key].add(entry)
+            facets.update(entry.get('facets', []))
+            ranges.update(entry.get('ranges', []))
+            types.update(entry.get('types') or ['(all)'])
+            sorts[entry.get('sort') or '(relevance)'] += 1
+            pages[entry.get('page', 1)] += 1
+
+        if not searches:
+            self.stdout.write('No searches recorded.')
+            return
+
+        top = options['top']
+        self.stdout.write('{} searches, {} distinct queries.\n'.format(
+            searches, len(queries)))
+
+        self.section('Most frequent queries')
+        self.write_queries(sorted(queries.values(),
+                                  key=lambda stats: -stats.count)[:top])
+
+        self.section('Slowest queries (by median total time)')
+        timed = [stats for stats in queries.values() if stats.total_times]
+        self.write_queries(sorted(timed, key=lambda stats: -stats.median)[:top])
+
+        self.section('Facet usage')
+        self.write_counts(facets, searches)
+        self.section('Range filter usage')
+        self.write_counts(ranges, searches)
+        self.section('Document types')
+        self.write_counts(types, searches)
+        self.section('Sort order')
+        self.write_counts(sorts, searches)
+        self.section('Pages')
+        self.write_counts(pages, searches, limit=10)
+
+    def section(self, title):
+        self.stdout.write('\n{}\n{}'.format(title, '-' * len(title)))
+
+    def write_queries(self, queries):
+        self.stdout.write('{:>7} {:>8} {:>8} {:>8} {:>8}  {}'.format(
+            'count', 'median', 'p95', 'qtime', 'results', 'query'))
+        for stats in queries:
+            self.stdout.write('{:>7} {:>8} {:>8} {:>8} {:>8}  {}'.format(
+                stats.count, format_ms(stats.median), format_ms(stats.p95),
+                format_ms(stats.median_qtime),
+                '-' if stats.results is None else stats.results,
+                stats.key or '(empty)'))
+
+    def write_counts(self, counter, total, limit=None):
+        for name, count in counter.most_common(limit):
+            self.stdout.write('{:>7} {:>5.1f}%  {}'.format(
+                count, count * 100 / total, name))
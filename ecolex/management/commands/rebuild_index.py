@@ -0,0 +1,308 @@
+"""
+Rebuild Solr documents from stored source payloads and extracted texts,
+without contacting ELIS, InforMEA or FAO.
+
+Payloads are the latest snapshots of each document (see
+ecolex.management.snapshots), or the files of `<source>/<obj_type>/`, in
+file name order: XML pages for treaties and literature, FAO XML files for
+legislation and JSON records for COP decisions (see
+cop_decision2.split_record). Full texts are taken from DocumentText, so no
+file is downloaded or extracted again.
+
+With --blue-green the index is built into a new Solr core or collection; the
+types not rebuilt are copied from the live index. Copies only hold stored
+fields, so the types whose full text is not stored in Solr are always
+rebuilt. The new index goes live only if it holds about as many documents of
+each type as the live one.
+"""
+
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ecolex import caching, pagecache
+from ecolex.legislation import load_dictionaries, parse_file
+from ecolex.management.commands import cop_decision2
+from ecolex.management.commands.base import get_importer_config
+from ecolex.management.commands.literature import LiteratureImporter
+from ecolex.management.commands.treaty import TreatyImporter
+from ecolex.management.definitions import (
+    COP_DECISION, LEGISLATION, LITERATURE, OBJ_TYPES, TREATY,
+)
+from ecolex.management.fulltext import build_full_text
+from ecolex.management.snapshots import get_snapshot_store
+from ecolex.management.solr_admin import SolrAdmin, SolrAdminError
+from ecolex.management.utils import EcolexSolr, cleanup_copyfields
+from ecolex.models import DocumentText
+
+logger = logging.getLogger('import')
+
+# full text field and the field holding the urls the text was extracted from;
+# treaties keep a single text per document
+TEXT_FIELDS = {
+    TREATY: ('trText', None),
+    LITERATURE: ('litText', 'litLinkToFullText'),
+    LEGISLATION: ('legText', 'legLinkToFullText'),
+    COP_DECISION: ('decText', 'decFileUrls'),
+}
+
+# types whose full text is indexed but not stored (see solr/schema.xml), so
+# it would be lost by copy_documents
+UNSTORED_TEXT_TYPES = (COP_DECISION, LEGISLATION)
+
+
+def treaty_parser():
+    importer = TreatyImporter(get_importer_config(TREATY))
+
+    def parse(payload):
+        treaties = importer._parse([payload])
+        importer._clean_referred_treaties(treaties)
+        return list(treaties.values())
+    return parse
+
+
+def literature_parser():
+    importer = LiteratureImporter(get_importer_config(LITERATURE))
+    return lambda payload: importer._parse([payload])
+
+
+def legislation_parser():
+    dictionaries = load_dictionaries()
+    return lambda payload: parse_file(payload, dictionaries)[0]
+
+
+def decision_parser():
+    # the importer sets the lookup tables at Decision class level
+    cop_decision2.CopDecisionImporter(get_importer_config(COP_DECISION))
+
+    def parse(payload):
+        records = payload if isinstance(payload, list) else [payload]
+        return [
+            cop_decision2.Decision(
+                *cop_decision2.split_record(record), None).fields()
+            for record in records
+        ]
+    return parse
+
+
+PARSERS = {
+    TREATY: treaty_parser,
+    LITERATURE: literature_parser,
+    LEGISLATION: legislation_parser,
+    COP_DECISION: decision_parser,
+}
+
+JSON_PAYLOADS = (COP_DECISION,)
+
+# set in each worker process by init_worker
+_parse = None
+
+
+def init_worker(obj_type):
+    global _parse
+    _parse = PARSERS[obj_type]()
+
+
+def parse_payload(payload):
+    try:
+        return _parse(payload)
+    except Exception:
+        logger.exception('Error parsing payload')
+        return []
+
+
+def read_snapshots(snapshots, obj_type):
+    for _, data in snapshots.iter_latest(obj_type):
+        if obj_type in JSON_PAYLOADS:
+            yield json.loads(data.decode('utf-8'))
+        else:
+            yield data
+
+
+def read_payloads(source, obj_type):
+    directory = os.path.join(source, obj_type)
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as f:
+            content = f.read()
+        if name.endswith('.json'):
+            yield json.loads(content.decode('utf-8'))
+        else:
+            yield content
+
+
+def attach_texts(obj_type, docs):
+    """ Set the full text of each document from the stored DocumentText. """
+    text_field, url_field = TEXT_FIELDS[obj_type]
+    id_field = EcolexSolr.ID_MAPPING[obj_type]
+
+    texts = defaultdict(dict)
+    rows = (
+        DocumentText.objects
+        .filter(doc_type=obj_type, status=DocumentText.FULL_INDEXED,
+                doc_id__in=[doc[id_field] for doc in docs])
+        .values_list('doc_id', 'url', 'text')
+    )
+    for doc_id, url, text in rows:
+        if text:
+            texts[doc_id][url] = text
+
+    for doc in docs:
+        doc_texts = texts.get(doc[id_field])
+        if not doc_texts:
+            continue
+        urls = doc.get(url_field) if url_field else None
+        if isinstance(urls, str):
+            urls = [urls]
+        if urls:
+            parts = [doc_texts[url] for url in OrderedDict.fromkeys(urls)
+                     if url in doc_texts]
+        else:
+            parts = list(doc_texts.values())
+        doc[text_field] = build_full_text(parts, doc[id_field])
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def copy_documents(source, target, obj_type, rows=500):
+    """ Copy all documents of a type, as stored in `source`. """
+    start = copied = 0
+    while True:
+        docs = source.solr.search('type:{}'.format(obj_type), sort='id asc',
+                                  rows=rows, start=start).docs
+        for doc in docs:
+            doc.pop('_version_', None)
+            cleanup_copyfields(doc)
+        if docs and target.add_bulk(docs):
+            copied += len(docs)
+        if len(docs) < rows:
+            return copied
+        start += rows
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Solr index from stored payloads, without harvesting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('obj_types', nargs='+', choices=sorted(PARSERS))
+        parser.add_argument('--source',
+                            help='Directory holding a folder of payloads '
+                                 'for each type, instead of the snapshots')
+        parser.add_argument('--workers', type=int,
+                            default=multiprocessing.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--blue-green', action='store_true',
+                            help='Build into a new core or collection and '
+                                 'switch to it once validated')
+        parser.add_argument('--keep-old', action='store_true',
+                            help='Keep the previous index after switching '
+                                 '(until the next --blue-green run)')
+
+    @caching.index_changes()
+    def handle(self, *args, **options):
+        if not options['source'] and get_snapshot_store() is None:
+            raise CommandError('Snapshots are disabled, use --source')
+        timeout = get_importer_config(TREATY).get('solr_timeout')
+        live = EcolexSolr(timeout)
+        if not options['blue_green']:
+            for obj_type in options['obj_types']:
+                self.rebuild(live, live, obj_type, options)
+            return
+
+        try:
+            self.blue_green(live, timeout, options)
+        except SolrAdminError as e:
+            raise CommandError(str(e))
+
+    def blue_green(self, live, timeout, options):
+        rebuilt = set(options['obj_types']).union(UNSTORED_TEXT_TYPES)
+        for obj_type in rebuilt.difference(options['obj_types']):
+            logger.info('[%s] Rebuilt too, its full text cannot be copied '
+                        'from the live index.', obj_type)
+            if options['source'] and not os.path.isdir(
+                    os.path.join(options['source'], obj_type)):
+                raise CommandError(
+                    'No {} payloads in {}, its full text cannot be copied '
+                    'from the live index.'.format(obj_type, options['source']))
+
+        admin = SolrAdmin()
+        name = admin.build_name()
+        if admin.exists(name):
+            # left over by a previous run, or kept with --keep-old
+            admin.drop(name)
+        uri = admin.create(name)
+        target = EcolexSolr(timeout, uri)
+
+        for obj_type in OBJ_TYPES:
+            if obj_type in rebuilt:
+                self.rebuild(live, target, obj_type, options)
+            else:
+                count = copy_documents(live, target, obj_type)
+                logger.info('[%s] Copied %s documents from the live index.',
+                            obj_type, count)
+
+        problems = admin.validate(uri)
+        if problems:
+            raise CommandError('{} was not switched to: {}'.format(
+                name, '; '.join(problems)))
+
+        admin.warm(uri)
+        previous = admin.switch(name)
+        logger.info('%s now serves the rebuilt index.', admin.name)
+        # pages rendered from the old index while building the new one
+        pagecache.clear()
+        caching.invalidate_search()
+        if previous and not options['keep_old']:
+            admin.drop(previous)
+
+    def rebuild(self, live, target, obj_type, options):
+        logger.info('[%s] Rebuild started.', obj_type)
+        start = time.perf_counter()
+        id_field = EcolexSolr.ID_MAPPING[obj_type]
+
+        # keep the Solr ids of documents already indexed, so they are
+        # replaced instead of duplicated, and links to them keep working
+        solr_ids = live.get_ids(obj_type)
+        if options['source']:
+            payloads = read_payloads(options['source'], obj_type)
+        else:
+            payloads = read_snapshots(get_snapshot_store(), obj_type)
+
+        # database connections must not be shared with the worker processes
+        connection.close()
+        indexed = failed = 0
+        with multiprocessing.Pool(options['workers'], init_worker,
+                                  (obj_type,)) as pool:
+            docs = itertools.chain.from_iterable(
+                pool.imap(parse_payload, payloads, chunksize=20))
+            for batch in batches(docs, options['batch_size']):
+                attach_texts(obj_type, batch)
+                for doc in batch:
+                    # a document can be found in several payloads; the last
+                    # one wins, since they all get the same id
+                    doc['id'] = solr_ids.setdefault(
+                        doc[id_field], str(uuid.uuid4()))
+                if target.add_bulk(batch):
+                    indexed += len(batch)
+                else:
+                    failed += len(batch)
+                    logger.error('[%s] Failed to index %s documents.',
+                                 obj_type, len(batch))
+                logger.info('[%s] %s documents indexed.', obj_type, indexed)
+
+        logger.info('[%s] Rebuild finished in %.1fs. Indexed %s. Failed %s.',
+                    obj_type, time.perf_counter() - start, indexed, failed)
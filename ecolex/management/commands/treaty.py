@@ -13,6 +13,7 @@ from pysolr import SolrError
 from ecolex.management.commands.base import BaseImporter
 from ecolex.management.commands.logging import LOG_DICT
 from ecolex.management.definitions import TREATY
+from ecolex.management.fulltext import build_full_text, join_texts
 from ecolex.management.utils import format_date, cleanup_copyfields
 from ecolex.management.utils import get_content_from_url, get_file_from_url
 from ecolex.models import DocumentText
@@ -288,6 +289,7 @@ class TreatyImporter(BaseImporter):
                             logger.error(url)
                         raw_treaties.append(content)
 
+            self.snapshot_pages(raw_treaties, REMOTE_ID_FIELD)
             logger.debug('Parsing %d pages' % (len(raw_treaties)))
             treaties = self._parse(raw_treaties)
             logger.debug('Pre-processing %d treaties' % (len(treaties)))
@@ -416,6 +418,7 @@ class TreatyImporter(BaseImporter):
         for treaty in treaties:
             full_index = True
             treaty['trText'] = ''
+            texts = []
 
             for field in URL_FIELDS:
                 urls = treaty.get(FIELD_MAP[field], [])
@@ -425,7 +428,7 @@ class TreatyImporter(BaseImporter):
                     if file_obj:
                         # Download successful
                         try:
-                            treaty['trText'] += self.solr.extract(file_obj) or ''
+                            texts.append(self.solr.extract(file_obj) or '')
                         except:
                             # SOLR error at pdf extraction
                             full_index = False
@@ -437,9 +440,11 @@ class TreatyImporter(BaseImporter):
                         full_index = False
                         self._document_text_pdf_error(treaty, url)
 
+            treaty['trText'] = build_full_text(texts, treaty['trElisId'],
+                                               logger)
             if full_index:
                 logger.info('Success on file download %s' % treaty['trElisId'])
-                self._document_text_pdf_success(treaty)
+                self._document_text_pdf_success(treaty, texts)
 
     def _document_text_pdf_error(self, treaty, url):
         doc, _ = DocumentText.objects.get_or_create(
@@ -449,10 +454,13 @@ class TreatyImporter(BaseImporter):
         doc.status = DocumentText.INDEXED
         doc.save()
 
-    def _document_text_pdf_success(self, treaty):
+    def _document_text_pdf_success(self, treaty, texts):
         doc, _ = DocumentText.objects.get_or_create(
             doc_id=treaty['trElisId'], doc_type=TREATY)
         doc.status = DocumentText.FULL_INDEXED
+        # keep the extracted text, so the treaty can be reindexed without
+        # downloading its files again (see the rebuild_index command)
+        doc.text = join_texts(texts)
         doc.save()
 
     def _get_solr_treaty(self, treaty_data):
@@ -569,6 +577,7 @@ class TreatyImporter(BaseImporter):
         for obj in objs:
             treaty_data = json.loads(obj.parsed_data)
             treaty_data['trText'] = ''
+            texts = []
             full_index = True
 
             for field in URL_FIELDS:
@@ -579,7 +588,7 @@ class TreatyImporter(BaseImporter):
                     if file_obj:
                         # Download successful
                         try:
-                            treaty_data['trText'] += self.solr.extract(file_obj) or ''
+                            texts.append(self.solr.extract(file_obj) or '')
                         except:
                             # SOLR error at pdf extraction
                             full_index = False
@@ -592,6 +601,7 @@ class TreatyImporter(BaseImporter):
                         obj.save()
                         logger.error('Error downloading url from doc %s' %
                                      obj.doc_id)
+            treaty_data['trText'] = build_full_text(texts, obj.doc_id, logger)
             try:
                 treaty = self.solr.search(TREATY, obj.doc_id)
                 if treaty:
@@ -607,6 +617,7 @@ class TreatyImporter(BaseImporter):
                 logger.info('Insert on %s' % (treaty_data['trElisId']))
                 if resp:
                     obj.status = DocumentText.FULL_INDEXED
+                    obj.text = join_texts(texts)
                     obj.parsed_data = ''
                     obj.save()
         logger.info('[Treaty] Update full text finished.')
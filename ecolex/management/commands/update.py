@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from ecolex import caching
 from ecolex.management.definitions import UNLIMITED_ROWS_COUNT
 from ecolex.management.utils import EcolexSolr
 
@@ -8,6 +9,7 @@ from ecolex.management.utils import EcolexSolr
 class Command(BaseCommand):
     """ Management command for manual updates in Solr """
 
+    @caching.index_changes()
     def handle(self, *args, **kwargs):
         if not hasattr(settings, 'SOLR_UPDATE'):
             print('SOLR_UPDATE variable not defined. Please use instructions '
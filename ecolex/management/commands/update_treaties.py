@@ -5,6 +5,7 @@ import collections
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from ecolex import caching
 from ecolex.management.commands.logging import LOG_DICT
 from ecolex.management.utils import EcolexSolr
 from ecolex.management.definitions import TREATY
@@ -37,6 +38,7 @@ class Command(BaseCommand):
 
     """ Updates Solr (adds trInformeaId) based on treaties.json
     """
+    @caching.index_changes()
     def update_solr(self):
         solr = EcolexSolr()
         with open(settings.TREATIES, encoding="utf-8") as f:
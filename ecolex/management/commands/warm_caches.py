@@ -0,0 +1,124 @@
+import logging
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.core.urlresolvers import resolve, reverse
+from django.http import Http404, QueryDict
+from django.test import RequestFactory
+from django.utils import translation
+
+from ecolex import querylog
+from ecolex.xviews import run_search, search_form
+
+
+logger = logging.getLogger(__name__)
+
+
+def top_entries(entries, searches, details):
+    """ The most frequent searches and details pages found in the log. """
+    search_counts = Counter()
+    search_entries = {}
+    details_counts = Counter()
+
+    for entry in entries:
+        if entry.get('kind') == querylog.SEARCH:
+            key = (entry['key'], entry.get('language'), entry.get('page', 1))
+            search_counts[key] += 1
+            search_entries[key] = entry
+        elif entry.get('kind') == querylog.DETAILS and entry.get('type'):
+            key = (entry['type'], entry['slug'], entry.get('language'))
+            details_counts[key] += 1
+
+    return (
+        [search_entries[key] for key, _ in search_counts.most_common(searches)],
+        [key for key, _ in details_counts.most_common(details)],
+    )
+
+
+def to_querydict(params, page=1):
+    querydict = QueryDict(mutable=True)
+    for key, values in params.items():
+        querydict.setlist(key, values)
+    if page and page != 1:
+        querydict['page'] = str(page)
+    return querydict
+
+
+class Command(BaseCommand):
+    help = 'Replay the most frequent searches and details pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--searches', type=int, default=200,
+                            help='Number of distinct searches to replay')
+        parser.add_argument('--details', type=int, default=200,
+                            help='Number of details pages to replay')
+        parser.add_argument('--rate', type=float, default=5,
+                            help='Maximum requests per second')
+        parser.add_argument('--log', default=None,
+                            help='Query log file (default QUERY_LOG_FILE)')
+
+    def handle(self, *args, **options):
+        interval = 1 / options['rate'] if options['rate'] > 0 else 0
+        searches, details = top_entries(
+            querylog.read_entries(options['log']),
+            options['searches'], options['details'])
+
+        # the homepage and the empty search form facets, in every language
+        queue = [('search', (QueryDict(), language))
+                    for language, _ in settings.LANGUAGES]
+        queue += [
+            ('search', (to_querydict(entry['params'], entry.get('page')),
+                        entry.get('language') or settings.LANGUAGE_CODE))
+            for entry in searches
+        ]
+        queue += [
+            ('details', (doc_type, slug, language or settings.LANGUAGE_CODE))
+            for doc_type, slug, language in details
+        ]
+
+        start = time.perf_counter()
+        failed = 0
+        for kind, args in queue:
+            started = time.perf_counter()
+            try:
+                if kind == 'search':
+                    self.warm_search(*args)
+                else:
+                    self.warm_details(*args)
+            except Exception:
+                failed += 1
+                logger.exception('Error warming %s %s', kind, args)
+            elapsed = time.perf_counter() - started
+            if interval > elapsed:
+                time.sleep(interval - elapsed)
+
+        self.stdout.write(
+            'Warmed {} searches and {} details pages in {:.1f}s, {} failed.'
+            .format(len(searches) + len(settings.LANGUAGES), len(details),
+                    time.perf_counter() - start, failed))
+
+    def warm_search(self, querydict, language):
+        with translation.override(language):
+            run_search(search_form(querydict), language)
+
+    def warm_details(self, doc_type, slug, language):
+        # through the view, so the rendered page is cached too (see
+        # ecolex.pagecache)
+        with translation.override(language), querylog.paused():
+            path = reverse('{}_details'.format(doc_type),
+                           kwargs={'slug': slug})
+            request = RequestFactory().get(path)
+            request.user = AnonymousUser()
+            match = resolve(path)
+            try:
+                response = match.func(request, *match.args, **match.kwargs)
+            except Http404:
+                return
+            if hasattr(response, 'render'):
+                response.render()
+            if response.status_code != 200:
+                logger.warning('Details page %s returned %s', path,
+                               response.status_code)
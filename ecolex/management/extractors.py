@@ -0,0 +1,218 @@
+"""
+Text extraction backends for the files attached to documents.
+
+`SolrExtractor` posts files to Solr's /update/extract handler (Tika).
+`LocalExtractor` extracts PDF, DOCX, HTML and plain text files in a pool of
+worker processes on the importer host, with a timeout and a memory limit per
+file, and hands any other format over to Solr, as well as the files it fails
+to extract.
+"""
+
+import logging
+import multiprocessing
+import resource
+import shutil
+import signal
+import subprocess
+import zipfile
+from io import BytesIO
+
+import lxml.etree as ET
+import pysolr
+from bs4 import BeautifulSoup
+from django.conf import settings
+
+from ecolex import metrics
+
+try:
+    from pdfminer.high_level import extract_text as pdfminer_extract_text
+except ImportError:
+    pdfminer_extract_text = None
+
+
+logger = logging.getLogger('import')
+
+PDF = 'pdf'
+DOCX = 'docx'
+HTML = 'html'
+TEXT = 'text'
+
+EXTENSIONS = {
+    'pdf': PDF,
+    'docx': DOCX,
+    'htm': HTML,
+    'html': HTML,
+    'txt': TEXT,
+}
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def get_extraction_settings():
+    defaults = {
+        'backend': 'local',
+        'workers': 2,
+        'timeout': 120,
+        'memory_limit': None,
+    }
+    defaults.update(getattr(settings, 'TEXT_EXTRACTION', {}))
+    return defaults
+
+
+def detect_format(file_obj, data):
+    """ Route a file by content type, magic bytes, then file extension. """
+    content_type = getattr(file_obj, 'content_type', None) or ''
+    if 'html' in content_type:
+        return HTML
+    if data.startswith(b'%PDF'):
+        return PDF
+    name = getattr(file_obj, 'name', '') or ''
+    extension = name.rsplit('?', 1)[0].rsplit('.', 1)[-1].lower()
+    return EXTENSIONS.get(extension)
+
+
+def pdf_to_text(data, timeout):
+    if shutil.which('pdftotext'):
+        process = subprocess.run(
+            ['pdftotext', '-q', '-enc', 'UTF-8', '-', '-'], input=data,
+            stdout=subprocess.PIPE, timeout=timeout, check=True)
+        return process.stdout.decode('utf-8', 'replace')
+    return pdfminer_extract_text(BytesIO(data))
+
+
+def docx_to_text(data, timeout):
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        root = ET.fromstring(archive.read('word/document.xml'))
+    paragraphs = (''.join(p.itertext()) for p in root.iter(WORD_NS + 'p'))
+    return '\n'.join(paragraphs)
+
+
+def html_to_text(data, timeout):
+    bs = BeautifulSoup(data, 'html.parser')
+    for tag in bs(['script', 'style']):
+        tag.decompose()
+    return bs.get_text('\n')
+
+
+def plain_text(data, timeout):
+    return data.decode('utf-8', 'replace')
+
+
+LOCAL_EXTRACTORS = {
+    PDF: pdf_to_text,
+    DOCX: docx_to_text,
+    HTML: html_to_text,
+    TEXT: plain_text,
+}
+
+
+def local_formats():
+    formats = set(LOCAL_EXTRACTORS)
+    if not shutil.which('pdftotext') and pdfminer_extract_text is None:
+        formats.discard(PDF)
+    return formats
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError('Extraction timed out')
+
+
+def _init_worker(memory_limit):
+    # the limit is inherited by pdftotext as well
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    signal.signal(signal.SIGALRM, _raise_timeout)
+
+
+def _extract(fmt, data, timeout):
+    signal.alarm(timeout)
+    try:
+        return LOCAL_EXTRACTORS[fmt](data, timeout)
+    finally:
+        signal.alarm(0)
+
+
+class SolrExtractor(object):
+
+    def __init__(self, solr):
+        self.solr = solr
+
+    def extract(self, file):
+        args = {}
+        if getattr(file, 'content_type', None):
+            args.update({'stream.type': getattr(file, 'content_type', None)})
+        try:
+            response = self.solr.extract(file, **args)
+            # dict_keys(['responseHeader', 'file', 'file_metadata', 'contents', 'metadata'])
+        except pysolr.SolrError as e:
+            metrics.EXTRACTION_FAILURES.labels('solr', 'error').inc()
+            logger.error('Error extracting text from file %s' % (file.name,))
+            if settings.DEBUG:
+                logging.getLogger('solr').exception(e)
+            return ''
+        if response.get('file'):
+            return response['file']
+        return response['contents']
+
+
+class LocalExtractor(object):
+
+    # shared by all instances, created on first use
+    _pool = None
+
+    def __init__(self, fallback, workers, timeout, memory_limit=None):
+        self.fallback = fallback
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.formats = local_formats()
+
+    def _get_pool(self):
+        if LocalExtractor._pool is None:
+            # recycle workers, as parsers may leak memory on odd files
+            LocalExtractor._pool = multiprocessing.Pool(
+                self.workers, _init_worker, (self.memory_limit,),
+                maxtasksperchild=50)
+        return LocalExtractor._pool
+
+    def _reset_pool(self):
+        LocalExtractor._pool.terminate()
+        LocalExtractor._pool = None
+
+    def extract(self, file):
+        data = file.getvalue() if hasattr(file, 'getvalue') else file.read()
+        fmt = detect_format(file, data)
+        if fmt not in self.formats:
+            file.seek(0)
+            return self.fallback.extract(file)
+
+        result = self._get_pool().apply_async(
+            _extract, (fmt, data, self.timeout))
+        try:
+            # the worker enforces the timeout itself, this only guards
+            # against a worker that does not respond at all
+            return result.get(self.timeout + 10) or ''
+        except multiprocessing.TimeoutError:
+            metrics.EXTRACTION_FAILURES.labels('local', 'timeout').inc()
+            logger.error('Extraction timed out, restarting workers: %s',
+                         file.name)
+            self._reset_pool()
+        except Exception as e:
+            reason = 'timeout' if isinstance(e, TimeoutError) else 'error'
+            metrics.EXTRACTION_FAILURES.labels('local', reason).inc()
+            logger.error('Error extracting text from file %s: %r',
+                         file.name, e)
+        # e.g. an encrypted or malformed file, Tika may still read it
+        logger.info('Extracting with Solr instead: %s', file.name)
+        file.seek(0)
+        return self.fallback.extract(file)
+
+
+def get_extractor(solr):
+    """ The configured extractor, `solr` being a pysolr.Solr instance. """
+    options = get_extraction_settings()
+    solr_extractor = SolrExtractor(solr)
+    if options['backend'] == 'local':
+        return LocalExtractor(solr_extractor, options['workers'],
+                              options['timeout'], options['memory_limit'])
+    return solr_extractor
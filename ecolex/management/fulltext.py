@@ -0,0 +1,118 @@
+"""
+Index-time policy for full-text fields (trText, legText, decText, ...).
+
+Texts extracted from all the files of a document are normalized, paragraphs
+already seen in a previous file (e.g. another language version or a repeated
+annex) are dropped, and the result is capped to a maximum length. Page
+numbers are only recognized at the top or bottom of a page, i.e. next to a
+form feed, so numbers in the body (article numbers, table cells) are kept.
+Stored DocumentText values are left untouched.
+"""
+
+import logging
+import re
+import unicodedata
+
+from django.conf import settings
+
+
+logger = logging.getLogger('import')
+
+PAGE_BREAK = '\x0c'
+# control characters except tab, newline, vertical tab and page break
+CONTROL_CHARS = re.compile(r'[\x00-\x08\x0e-\x1f\x7f\u200b\ufeff]')
+HYPHENATED = re.compile(r'(\w)-\n(\w)')
+SPACES = re.compile(r'[ \t\xa0]+')
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+# lines holding only a page number, e.g. "12", "- 12 -", "Page 3 of 10"
+PAGE_NUMBER = re.compile(r'^(page\s*)?[-\s]*\d{1,3}[-\s]*(of\s*\d+)?$',
+                         re.IGNORECASE)
+
+
+def get_fulltext_settings():
+    defaults = {
+        'max_length': 2 * 1024 * 1024,
+        'min_dedup_length': 40,
+    }
+    defaults.update(getattr(settings, 'FULL_TEXT_POLICY', {}))
+    return defaults
+
+
+def normalize(text):
+    """ The normalized text, and the number of page number lines dropped. """
+    text = unicodedata.normalize('NFC', text)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = CONTROL_CHARS.sub('', text.replace('\x0b', '\n'))
+    pages = text.split(PAGE_BREAK)
+
+    lines = []
+    page_numbers = 0
+    for page in pages:
+        page_lines = [SPACES.sub(' ', line).strip()
+                      for line in page.split('\n')]
+        if len(pages) > 1:
+            # the first and last lines of the page
+            filled = [idx for idx, line in enumerate(page_lines) if line]
+            for idx in {filled[0], filled[-1]} if filled else ():
+                if PAGE_NUMBER.match(page_lines[idx]):
+                    page_lines[idx] = None
+                    page_numbers += 1
+        lines.extend(line for line in page_lines if line is not None)
+
+    return HYPHENATED.sub(r'\1\2', '\n'.join(lines)), page_numbers
+
+
+def join_texts(texts):
+    """ The raw texts of several files as a single stored value, keeping a
+        paragraph break between files so `build_full_text` can split them.
+    """
+    return '\n\n'.join(text for text in texts if text)
+
+
+def build_full_text(texts, doc_id, log=logger):
+    """ Join the texts extracted from the files of a document. """
+    options = get_fulltext_settings()
+    max_length = options['max_length']
+
+    seen = set()
+    paragraphs = []
+    length = 0
+    original = duplicates = duplicate_length = truncated = page_numbers = 0
+
+    for text in texts:
+        if not text:
+            continue
+        original += len(text)
+        text, dropped = normalize(text)
+        page_numbers += dropped
+        for paragraph in PARAGRAPH_BREAK.split(text):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if len(paragraph) >= options['min_dedup_length']:
+                key = ' '.join(paragraph.casefold().split())
+                if key in seen:
+                    duplicates += 1
+                    duplicate_length += len(paragraph)
+                    continue
+                seen.add(key)
+            if truncated or length + len(paragraph) > max_length:
+                # keep the text a prefix of the original, cut at a word
+                head = ''
+                if not truncated:
+                    room = max(max_length - length, 0)
+                    head = paragraph[:room].rsplit(' ', 1)[0]
+                    if head:
+                        paragraphs.append(head)
+                truncated += len(paragraph) - len(head)
+                continue
+            paragraphs.append(paragraph)
+            length += len(paragraph) + 2
+
+    full_text = '\n\n'.join(paragraphs)
+    if duplicates or truncated or page_numbers:
+        log.info('Full text of %s: kept %s of %s characters, dropped %s '
+                 'page numbers and %s duplicate paragraphs (%s characters), '
+                 'truncated %s characters.', doc_id, len(full_text), original,
+                 page_numbers, duplicates, duplicate_length, truncated)
+    return full_text
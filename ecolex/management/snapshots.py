@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime
+from urllib.parse import quote, unquote
+
+from django.conf import settings
+import lxml.etree as ET
+
+
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S%fZ'
+
+
+class SnapshotStore(object):
+    """ Append-only archive of the raw payloads fetched by the importers.
+
+        Every payload is gzipped and stored as
+        `<root>/<source>/<shard>/<doc id>/<fetch time>.gz`, so the latest
+        payload of a document is the last file of its folder. A payload equal
+        to the latest one is not stored again.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _doc_path(self, source, doc_id):
+        shard = hashlib.sha1(doc_id.encode('utf-8')).hexdigest()[:2]
+        return os.path.join(self.root, source, shard, quote(doc_id, safe=''))
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return gzip.decompress(f.read())
+
+    def history(self, source, doc_id):
+        """ Fetch times of all the payloads of a document, oldest first. """
+        try:
+            names = os.listdir(self._doc_path(source, doc_id))
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-3] for name in names if name.endswith('.gz'))
+
+    def get(self, source, doc_id, timestamp=None):
+        """ The payload fetched at `timestamp`, by default the latest one. """
+        if timestamp is None:
+            history = self.history(source, doc_id)
+            if not history:
+                return None
+            timestamp = history[-1]
+        path = os.path.join(self._doc_path(source, doc_id), timestamp + '.gz')
+        try:
+            return self._read(path)
+        except FileNotFoundError:
+            return None
+
+    def put(self, source, doc_id, data, fetched=None):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self.get(source, doc_id) == data:
+            return False
+
+        fetched = fetched or datetime.utcnow()
+        directory = self._doc_path(source, doc_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory,
+                            fetched.strftime(TIMESTAMP_FORMAT) + '.gz')
+        # write to a temporary file first, so that readers never see a
+        # partially written payload
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(gzip.compress(data))
+        os.replace(tmp_path, path)
+        return True
+
+    def get_json(self, source, doc_id, timestamp=None):
+        data = self.get(source, doc_id, timestamp)
+        return json.loads(data.decode('utf-8')) if data is not None else None
+
+    def put_json(self, source, doc_id, data, fetched=None):
+        return self.put(source, doc_id, json.dumps(data, sort_keys=True),
+                        fetched)
+
+    def doc_ids(self, source):
+        source_path = os.path.join(self.root, source)
+        if not os.path.isdir(source_path):
+            return
+        for shard in sorted(os.listdir(source_path)):
+            for name in sorted(os.listdir(os.path.join(source_path, shard))):
+                yield unquote(name)
+
+    def iter_latest(self, source):
+        """ Yield the doc id and latest payload of every document. """
+        for doc_id in self.doc_ids(source):
+            data = self.get(source, doc_id)
+            if data is not None:
+                yield doc_id, data
+
+    def put_xml_documents(self, source, content, *id_tags):
+        """ Split an XML export page into one payload per <document>, using
+            the first of `id_tags` found as document ID.
+        """
+        root = ET.fromstring(content, parser=ET.XMLParser(recover=True))
+        if root is None:
+            return
+        fetched = datetime.utcnow()
+        for document in root.iter('document'):
+            doc_id = next(filter(None, map(document.findtext, id_tags)), None)
+            if doc_id:
+                data = ET.tostring(document, encoding='utf-8',
+                                   with_tail=False)
+                self.put(source, doc_id.strip(), data, fetched)
+
+
+def get_snapshot_store():
+    """ The configured store, or None if snapshots are disabled. """
+    snapshot_dir = settings.SOLR_IMPORT['common'].get('snapshot_dir')
+    return SnapshotStore(snapshot_dir) if snapshot_dir else None
@@ -0,0 +1,155 @@
+"""
+Build a fresh Solr core (or SolrCloud collection) next to the live one and
+switch to it atomically.
+
+In 'core' mode the live core keeps its name: the build core is swapped with
+it (CoreAdmin SWAP), and afterwards holds the previous data. In 'cloud' mode
+SOLR_URI names an alias, which is pointed to the new collection
+(Collections API CREATEALIAS).
+"""
+
+import logging
+from datetime import datetime
+
+import pysolr
+import requests
+from django.conf import settings
+
+from ecolex.management.definitions import OBJ_TYPES
+
+
+logger = logging.getLogger('import')
+
+CORE = 'core'
+CLOUD = 'cloud'
+
+
+def get_reindex_settings():
+    defaults = {
+        'mode': CORE,
+        'config_set': None,
+        'num_shards': 1,
+        'min_ratio': 0.99,
+    }
+    defaults.update(getattr(settings, 'SOLR_REINDEX', {}))
+    return defaults
+
+
+def split_solr_uri(solr_uri):
+    """ 'http://solr:8983/solr/ecolex/' -> ('http://solr:8983/solr', 'ecolex') """
+    base_url, name = solr_uri.rstrip('/').rsplit('/', 1)
+    return base_url, name
+
+
+class SolrAdminError(Exception):
+    pass
+
+
+class SolrAdmin(object):
+
+    def __init__(self, solr_uri=None):
+        options = get_reindex_settings()
+        self.mode = options['mode']
+        self.config_set = options['config_set']
+        self.num_shards = options['num_shards']
+        self.min_ratio = options['min_ratio']
+        self.base_url, self.name = split_solr_uri(solr_uri or settings.SOLR_URI)
+
+    def _admin(self, handler, **params):
+        params['wt'] = 'json'
+        response = requests.get('{}/admin/{}'.format(self.base_url, handler),
+                                params=params, timeout=600)
+        data = response.json() if response.content else {}
+        if response.status_code != 200:
+            error = data.get('error', {}).get('msg') or response.text
+            raise SolrAdminError('{} {}: {}'.format(
+                handler, params.get('action'), error))
+        return data
+
+    def uri(self, name):
+        return '{}/{}/'.format(self.base_url, name)
+
+    def build_name(self):
+        if self.mode == CLOUD:
+            return '{}_{:%Y%m%d%H%M%S}'.format(self.name, datetime.utcnow())
+        return '{}_build'.format(self.name)
+
+    def exists(self, name):
+        if self.mode == CLOUD:
+            data = self._admin('collections', action='LIST')
+            return name in data.get('collections', [])
+        data = self._admin('cores', action='STATUS', core=name)
+        return bool(data.get('status', {}).get(name))
+
+    def create(self, name):
+        logger.info('Creating Solr %s %s.', self.mode, name)
+        if self.mode == CLOUD:
+            self._admin('collections', action='CREATE', name=name,
+                        numShards=self.num_shards,
+                        **{'collection.configName': self.config_set})
+        else:
+            self._admin('cores', action='CREATE', name=name,
+                        instanceDir=name, configSet=self.config_set)
+        return self.uri(name)
+
+    def drop(self, name):
+        logger.info('Dropping Solr %s %s.', self.mode, name)
+        if self.mode == CLOUD:
+            self._admin('collections', action='DELETE', name=name)
+        else:
+            self._admin('cores', action='UNLOAD', core=name,
+                        deleteIndex='true', deleteDataDir='true',
+                        deleteInstanceDir='true')
+
+    def live_collection(self):
+        """ The collection the alias points to, in cloud mode. """
+        data = self._admin('collections', action='LISTALIASES')
+        return data.get('aliases', {}).get(self.name)
+
+    def switch(self, name):
+        """ Serve `name` under the live name. Returns the name holding the
+            previous data.
+        """
+        logger.info('Switching %s to %s.', self.name, name)
+        if self.mode == CLOUD:
+            previous = self.live_collection()
+            self._admin('collections', action='CREATEALIAS', name=self.name,
+                        collections=name)
+            return previous
+        self._admin('cores', action='SWAP', core=self.name, other=name)
+        return name
+
+    def count_by_type(self, uri):
+        solr = pysolr.Solr(uri, timeout=600)
+        result = solr.search('*:*', rows=0, facet='true',
+                             **{'facet.field': 'type', 'facet.limit': -1})
+        values = result.facets.get('facet_fields', {}).get('type', [])
+        return dict(zip(values[::2], values[1::2]))
+
+    def validate(self, uri):
+        """ Compare the document count of each type with the live index.
+            Returns a list of problems, empty if the build can be used.
+        """
+        live = self.count_by_type(self.uri(self.name))
+        build = self.count_by_type(uri)
+        problems = []
+        for obj_type in OBJ_TYPES:
+            expected = live.get(obj_type, 0)
+            found = build.get(obj_type, 0)
+            logger.info('%s: %s documents, %s in the live index.',
+                        obj_type, found, expected)
+            if found < expected * self.min_ratio:
+                problems.append('{}: {} documents, expected at least {}'
+                                .format(obj_type, found,
+                                        int(expected * self.min_ratio)))
+        return problems
+
+    def warm(self, uri):
+        """ Run the most common queries, so caches are filled before the
+            index goes live.
+        """
+        solr = pysolr.Solr(uri, timeout=600)
+        for obj_type in OBJ_TYPES:
+            solr.search('*:*', fq='type:{}'.format(obj_type), rows=20,
+                        facet='true', **{'facet.field': 'type'})
+        solr.search('*:*', rows=20)
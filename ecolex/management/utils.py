@@ -14,10 +14,16 @@ from operator import itemgetter
 from itertools import chain
 from logging.config import dictConfig
 
+from django.db import DatabaseError
+
+from ecolex import caching, metrics, pagecache
+from ecolex.instrumentation import instrument_pysolr, solr_call
 from ecolex.management.commands.logging import LOG_DICT
 from ecolex.management.definitions import (
     COP_DECISION, COURT_DECISION, LEGISLATION, LITERATURE, TREATY, COPY_FIELDS,
 )
+from ecolex.management.extractors import get_extractor
+from ecolex.models import DocumentId
 
 SOLR_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 
@@ -58,6 +64,7 @@ def get_file_from_url(url):
         return None
 
     doc_content_bytes = response.content
+    metrics.IMPORT_DOWNLOAD_BYTES.inc(len(doc_content_bytes))
     file_obj = BytesIO()
     file_obj.write(doc_content_bytes)
     setattr(file_obj, 'name', url)
@@ -96,6 +103,7 @@ def get_json_from_url(url, headers={}):
     resp = requests.get(url, headers=headers)
     if not resp.status_code == 200:
         raise RuntimeError('Unexpected request status code')
+    metrics.IMPORT_DOWNLOAD_BYTES.inc(len(resp.content))
 
     try:
         return json.loads(resp.text)
@@ -108,6 +116,7 @@ def get_content_from_url(url):
     resp = requests.get(url)
     if not resp.status_code == 200:
         raise RuntimeError('Unexpected request status code')
+    metrics.IMPORT_DOWNLOAD_BYTES.inc(len(resp.content))
     return resp.content
 
 
@@ -134,15 +143,16 @@ class EcolexSolr(object):
         LEGISLATION: 'legId',
     }
 
-    def __init__(self, timeout=60):
-        solr_uri = os.environ.get('EDW_RUN_SOLR_URI')
+    def __init__(self, timeout=60, solr_uri=None):
+        solr_uri = solr_uri or os.environ.get('EDW_RUN_SOLR_URI')
         if not solr_uri:
             try:
                 solr_uri = settings.SOLR_URI
             except AttributeError:
                 raise RuntimeError('EDW_RUN_SOLR_URI environment variable not set.')
 
-        self.solr = pysolr.Solr(solr_uri, timeout=timeout)
+        self.solr = instrument_pysolr(pysolr.Solr(solr_uri, timeout=timeout))
+        self.extractor = get_extractor(self.solr)
 
     def search(self, obj_type, id_value):
         id_field = self.ID_MAPPING.get(obj_type)
@@ -151,18 +161,47 @@ class EcolexSolr(object):
 
     def search_all(self, key, value='*', **kwargs):
         query = '{}:{}'.format(key, value)
-        result = self.solr.search(query, **kwargs)
+        with solr_call() as call:
+            result = self.solr.search(query, **kwargs)
+            call.qtime = result.qtime
         if result.hits:
             return result.docs
 
+    def get_ids(self, obj_type, rows=5000):
+        """ Map the source ID of every indexed document of a type to its
+            Solr id.
+        """
+        id_field = self.ID_MAPPING.get(obj_type)
+        ids = {}
+        start = 0
+        while True:
+            with solr_call() as call:
+                result = self.solr.search('type:{}'.format(obj_type),
+                                          fl='id,{}'.format(id_field),
+                                          sort='id asc', rows=rows,
+                                          start=start)
+                call.qtime = result.qtime
+            for doc in result.docs:
+                if id_field in doc:
+                    ids[doc[id_field]] = doc['id']
+            if len(result.docs) < rows:
+                break
+            start += rows
+        return ids
+
     def add(self, obj, **kwargs):
         try:
             self.solr.add([obj], **kwargs)
             # self.solr.optimize()
         except pysolr.SolrError as e:
+            metrics.SOLR_ERRORS.labels('import').inc()
             if settings.DEBUG:
                 logging.getLogger('solr').exception(e)
             return False
+        metrics.count_documents([obj])
+        self.record_ids([obj])
+        pagecache.invalidate([obj.get('slug')])
+        caching.invalidate_search()
         return True
 
     def add_bulk(self, bulk_obj):
@@ -170,26 +209,26 @@ class EcolexSolr(object):
             self.solr.add(bulk_obj)
             # self.solr.optimize()
         except pysolr.SolrError as e:
+            metrics.SOLR_ERRORS.labels('import').inc()
             if settings.DEBUG:
                 logging.getLogger('solr').exception(e)
             return False
+        metrics.count_documents(bulk_obj)
+        self.record_ids(bulk_obj)
+        pagecache.invalidate([obj.get('slug') for obj in bulk_obj])
+        caching.invalidate_search()
         return True
 
-    def extract(self, file):
-        args = {}
-        if getattr(file, 'content_type', None):
-            args.update({'stream.type': getattr(file, 'content_type', None)})
+    @staticmethod
+    def record_ids(docs):
+        """ Keep the redirects table (see `DocumentId`) up to date. """
         try:
-            response = self.solr.extract(file, **args)
-            # dict_keys(['responseHeader', 'file', 'file_metadata', 'contents', 'metadata'])
-        except pysolr.SolrError as e:
-            logger.error('Error extracting text from file %s' % (file.name,))
-            if settings.DEBUG:
-                logging.getLogger('solr').exception(e)
-            return ''
-        if response.get('file'):
-            return response['file']
-        return response['contents']
+            DocumentId.objects.record(docs)
+        except DatabaseError:
+            logger.exception('Error recording the IDs of indexed documents')
+
+    def extract(self, file):
+        return self.extractor.extract(file)
 
 
 def keywords_informea_to_ecolex(informea_json, ecolex_json, values):
@@ -0,0 +1,107 @@
+"""
+Prometheus metrics for the web workers and the importers.
+
+prometheus_client runs in multiprocess mode: every process (gunicorn worker,
+cron import) writes its values to files in METRICS['directory'], and the
+metrics view aggregates them. The directory is emptied when the web server
+starts (see docker-entrypoint.sh), and gunicorn_conf.py cleans up after
+exited workers.
+"""
+
+import os
+
+from django.conf import settings
+
+# must be set before prometheus_client is imported
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', settings.METRICS['directory'])
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess,
+)
+
+
+REQUEST_LATENCY = Histogram(
+    'ecolex_request_seconds', 'Time spent serving a page',
+    ['page'],
+    buckets=(.05, .1, .25, .5, .75, 1, 1.5, 2.5, 5, 10, 30),
+)
+SOLR_LATENCY = Histogram(
+    'ecolex_solr_request_seconds', 'Time spent in Solr calls of a page',
+    ['page'],
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+SOLR_ERRORS = Counter(
+    'ecolex_solr_errors_total', 'Failed Solr calls', ['source'],
+)
+SOLR_COALESCED = Counter(
+    'ecolex_solr_coalesced_total',
+    'Solr queries answered by an identical query in flight', ['scope'],
+)
+SOLR_DEGRADED = Counter(
+    'ecolex_solr_degraded_total',
+    'Solr queries answered from the fallback, or not at all', ['result'],
+)
+CACHE_REQUESTS = Counter(
+    'ecolex_cache_requests_total', 'Cache lookups', ['cache', 'result'],
+)
+EXPORT_BYTES = Counter(
+    'ecolex_export_bytes_total', 'Bytes served by the export view',
+    ['format'],
+)
+IMPORT_DOCUMENTS = Counter(
+    'ecolex_import_documents_total', 'Documents sent to Solr by importers',
+    ['type'],
+)
+IMPORT_DOWNLOAD_BYTES = Counter(
+    'ecolex_import_download_bytes_total', 'Bytes downloaded by importers',
+)
+EXTRACTION_FAILURES = Counter(
+    'ecolex_extraction_failures_total', 'Files without extracted text',
+    ['backend', 'reason'],
+)
+
+# page label of the URL names, besides the details and related pages
+PAGE_TYPES = {
+    'results': 'search',
+    'search': 'api',
+    'homepage': 'homepage',
+    'export': 'export',
+    'detailpage_redirect': 'redirect',
+    'oldecolex_redirect': 'redirect',
+}
+
+
+def page_type(request):
+    match = getattr(request, 'resolver_match', None)
+    name = match and match.url_name
+    if not name:
+        return 'other'
+    if name.endswith('_details'):
+        return 'details'
+    if name.startswith('related_'):
+        return 'related'
+    return PAGE_TYPES.get(name, 'other')
+
+
+def observe_request(request, total, solr_time):
+    page = page_type(request)
+    REQUEST_LATENCY.labels(page).observe(total)
+    SOLR_LATENCY.labels(page).observe(solr_time)
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def count_documents(docs):
+    for doc in docs:
+        IMPORT_DOCUMENTS.labels(doc.get('type', 'unknown')).inc()
+
+
+def render():
+    """ The metrics of all processes, in the Prometheus text format. """
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,7 +1,112 @@
+import logging
+import threading
+import time
+
 from django.conf import settings
+from django.views.generic import TemplateView
+
+from ecolex import instrumentation, metrics, profiling, resilience
+
+
+logger = logging.getLogger(__name__)
+
 
 class CacheControlMiddleware(object):
     def process_response(self, request, response):
         if settings.DEBUG:
             response['cache-control'] = 'no-cache, max-age=0'
         return response
+
+
+class ProfilerMiddleware(object):
+    """ Samples the stack of a fraction of the requests, see
+        `ecolex.profiling`.
+    """
+
+    def process_request(self, request):
+        options = profiling.get_profiling_settings()
+        if profiling.should_profile(request, options):
+            sampler = profiling.Sampler(threading.get_ident(),
+                                        options['interval'])
+            sampler.start()
+            request._profiler = sampler
+
+    def process_response(self, request, response):
+        sampler = getattr(request, '_profiler', None)
+        if sampler is None:
+            return response
+
+        stacks = sampler.stop()
+        match = getattr(request, 'resolver_match', None)
+        name = (match and (match.url_name or match.view_name)) or 'unknown'
+        try:
+            profiling.write_profile(
+                profiling.get_profiling_settings()['directory'], name, stacks)
+        except OSError:
+            logger.exception('Could not write the profile of %s',
+                             request.path)
+        return response
+
+
+class ServerTimingMiddleware(object):
+    """ Times the Solr calls and the rendering of each request, see
+        `ecolex.instrumentation`. Keep it first in MIDDLEWARE_CLASSES.
+    """
+
+    def process_request(self, request):
+        instrumentation.start_request()
+
+    def process_template_response(self, request, response):
+        timings = instrumentation.current()
+        if timings is not None:
+            timings.view_end = time.perf_counter()
+        return response
+
+    def process_response(self, request, response):
+        timings = instrumentation.end_request()
+        if timings is None:
+            return response
+
+        now = time.perf_counter()
+        view_end = getattr(timings, 'view_end', None)
+        if view_end is not None:
+            timings.add_section('render', now - view_end)
+        total = now - timings.start
+
+        instrumentation.log_request(request, response, timings, total)
+        metrics.observe_request(
+            request, total, sum(call.duration for call in timings.calls))
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = instrumentation.server_timing(
+                timings, total)
+        return response
+
+
+class SolrResilienceMiddleware(object):
+    """ Starts the Solr time budget of each request, marks responses built
+        from stale data and renders a 503 page when Solr can't answer, see
+        `ecolex.resilience`.
+    """
+
+    def process_request(self, request):
+        resilience.start_request()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        if not getattr(view, 'solr_budget', True):
+            resilience.start_request(limited=False)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, resilience.SolrUnavailable):
+            return None
+        view = TemplateView.as_view(template_name='503.html')
+        response = view(request).render()
+        response.status_code = 503
+        response['Retry-After'] = \
+            resilience.get_resilience_settings()['cooldown']
+        return response
+
+    def process_response(self, request, response):
+        if resilience.end_request():
+            response['Warning'] = '110 - "Response is Stale"'
+        return response
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+import ecolex.lib.storage
+
+
+BATCH_SIZE = 500
+
+
+def compress_documents(apps, schema_editor):
+    # Reading goes through CompressedTextField, which decodes legacy
+    # (uncompressed) values; writing them back stores them compressed.
+    DocumentText = apps.get_model('ecolex', 'DocumentText')
+    last_pk = 0
+    while True:
+        rows = list(
+            DocumentText.objects
+            .filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', 'text', 'parsed_data')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        for pk, text, parsed_data in rows:
+            if text or parsed_data:
+                DocumentText.objects.filter(pk=pk).update(
+                    text=text, parsed_data=parsed_data)
+        last_pk = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecolex', '0010_auto_20201030_0622'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documenttext',
+            name='parsed_data',
+            field=ecolex.lib.storage.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='documenttext',
+            name='text',
+            field=ecolex.lib.storage.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.RunPython(compress_documents, migrations.RunPython.noop),
+    ]
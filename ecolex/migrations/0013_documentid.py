@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 16:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecolex', '0012_indexgeneration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentId',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('id_field', models.CharField(max_length=16)),
+                ('value', models.CharField(max_length=128)),
+                ('doc_type', models.CharField(max_length=16)),
+                ('slug', models.CharField(max_length=255)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='documentid',
+            unique_together=set([('id_field', 'value')]),
+        ),
+    ]
@@ -1,4 +1,76 @@
-from django.db import models
+from itertools import groupby
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from ecolex.lib.storage import CompressedTextField
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class DocumentTextQuerySet(models.QuerySet):
+
+    CHUNK_SIZE = 500
+
+    def lookup_many(self, pairs, doc_type=None):
+        """
+        Fetch the documents matching many (doc_id, url) pairs at once,
+        of any type unless `doc_type` is given.
+        Returns a dict keyed by (doc_id, url); duplicates are ignored.
+        """
+        pairs = set(pairs)
+        doc_ids = sorted({doc_id for doc_id, _ in pairs})
+        queryset = self if doc_type is None else self.filter(doc_type=doc_type)
+        found = {}
+        for ids in chunked(doc_ids, self.CHUNK_SIZE):
+            docs = queryset.filter(doc_id__in=ids).order_by('pk')
+            for doc in docs:
+                key = (doc.doc_id, doc.url)
+                if key in pairs and key not in found:
+                    found[key] = doc
+        return found
+
+    def bulk_upsert(self, docs, fields):
+        """
+        Insert new documents with bulk_create and update `fields` of the
+        existing ones. Rows sharing the same values are updated together,
+        using a single query per chunk.
+        """
+        new_docs = [doc for doc in docs if doc.pk is None]
+        old_docs = [doc for doc in docs if doc.pk is not None]
+
+        with transaction.atomic(using=self.db):
+            for chunk in chunked(new_docs, self.CHUNK_SIZE):
+                self.bulk_create(chunk)
+
+            def values(doc):
+                return tuple(getattr(doc, field) for field in fields)
+
+            old_docs.sort(key=lambda doc: repr(values(doc)))
+            now = timezone.now()
+            for key, group in groupby(old_docs, key=values):
+                pks = [doc.pk for doc in group]
+                updates = dict(zip(fields, key), updated_datetime=now)
+                for chunk in chunked(pks, self.CHUNK_SIZE):
+                    self.filter(pk__in=chunk).update(**updates)
+
+    def iter_queue(self, status, batch_size=100):
+        """
+        Iterate over the documents with `status`, using keyset pagination
+        on the primary key. Each batch is a fresh query, so rows processed
+        meanwhile are skipped and rows left unchanged are not seen twice.
+        """
+        queue = self.filter(status=status)
+        last_pk = 0
+        while True:
+            batch = list(queue.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                break
+            yield from batch
+            last_pk = batch[-1].pk
 
 
 class DocumentText(models.Model):
@@ -18,14 +90,16 @@ class DocumentText(models.Model):
     doc_id = models.CharField(db_index=True, max_length=128, null=False, blank=False)
     doc_type = models.CharField(max_length=16, null=False, blank=False)
     url = models.CharField(max_length=256, null=True, blank=True)
-    text = models.TextField(null=True, blank=True)
-    parsed_data = models.TextField(null=True, blank=True)
+    text = CompressedTextField(null=True, blank=True)
+    parsed_data = CompressedTextField(null=True, blank=True)
     doc_size = models.IntegerField(null=True, blank=True)
     created_datetime = models.DateTimeField(auto_now_add=True, auto_now=False)
     updated_datetime = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=32, choices=STATUS_TYPES,
                               null=False, blank=False)
 
+    objects = DocumentTextQuerySet.as_manager()
+
     def __str__(self):
         return self.doc_id + ' ' + self.status
 
@@ -45,3 +119,117 @@ class StaticContent(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class IndexGeneration(models.Model):
+    """
+    A single row, bumped after every change of the Solr index. The web
+    workers poll it and fold it into their cache keys (see ecolex.caching),
+    so an import on any host invalidates the caches of all of them.
+    """
+
+    PK = 1
+
+    value = models.BigIntegerField(default=0)
+    updated_datetime = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def current(cls):
+        value = (cls.objects.filter(pk=cls.PK)
+                 .values_list('value', flat=True).first())
+        return value or 0
+
+    @classmethod
+    def bump(cls):
+        updated = cls.objects.filter(pk=cls.PK).update(
+            value=models.F('value') + 1, updated_datetime=timezone.now())
+        if not updated:
+            obj, created = cls.objects.get_or_create(
+                pk=cls.PK, defaults={'value': 1})
+            if not created:
+                cls.bump()
+
+    def __str__(self):
+        return str(self.value)
+
+
+class DocumentIdQuerySet(models.QuerySet):
+
+    def record(self, docs):
+        """
+        Store the source IDs of indexed documents. Partial documents (e.g.
+        atomic updates) without a type or slug are ignored.
+        """
+        rows = {}
+        for doc in docs:
+            doc_type, slug = doc.get('type'), doc.get('slug')
+            if not doc_type or not slug:
+                continue
+            for id_field in self.model.ID_FIELDS:
+                values = doc.get(id_field)
+                if not values:
+                    continue
+                if not isinstance(values, (list, tuple)):
+                    values = [values]
+                for value in values:
+                    rows[(id_field, str(value))] = (doc_type, slug)
+        if not rows:
+            return
+
+        with transaction.atomic(using=self.db):
+            for id_field, group in groupby(sorted(rows), key=lambda k: k[0]):
+                values = [value for _, value in group]
+                for chunk in chunked(values, DocumentTextQuerySet.CHUNK_SIZE):
+                    existing = {
+                        obj.value: obj for obj in
+                        self.filter(id_field=id_field, value__in=chunk)
+                    }
+                    new = []
+                    for value in chunk:
+                        doc_type, slug = rows[(id_field, value)]
+                        obj = existing.get(value)
+                        if obj is None:
+                            new.append(self.model(
+                                id_field=id_field, value=value,
+                                doc_type=doc_type, slug=slug))
+                        elif (obj.doc_type, obj.slug) != (doc_type, slug):
+                            self.filter(pk=obj.pk).update(
+                                doc_type=doc_type, slug=slug)
+                    self.bulk_create(new)
+
+    def resolve(self, id_fields, value):
+        """ The (doc_type, slug) of the document with any of `id_fields`
+            equal to `value`, or `None`.
+        """
+        for id_field in id_fields:
+            found = (self.filter(id_field=id_field, value=value)
+                     .values_list('doc_type', 'slug').first())
+            if found:
+                return found
+        return None
+
+
+class DocumentId(models.Model):
+    """
+    The source IDs of the indexed documents, with their type and slug.
+    Filled by EcolexSolr as documents are indexed (or by the document_ids
+    command), so the redirects of old URLs need no Solr query.
+    """
+
+    ID_FIELDS = ('legId', 'trElisId', 'litId', 'cdOriginalId', 'cdLeoId',
+                 'decId')
+
+    id_field = models.CharField(max_length=16)
+    value = models.CharField(max_length=128)
+    doc_type = models.CharField(max_length=16)
+    slug = models.CharField(max_length=255)
+
+    objects = DocumentIdQuerySet.as_manager()
+
+    def __str__(self):
+        return '{}:{} {}'.format(self.id_field, self.value, self.slug)
+
+    class Meta:
+        unique_together = [
+            ("id_field", "value"),
+        ]
@@ -0,0 +1,134 @@
+"""
+Cache of the rendered details pages, for anonymous visitors.
+
+Pages are stored in the `caching.DETAILS` namespace, which is shared by the
+web workers and the importers. Their keys include a version token per slug;
+`invalidate()` drops the token when a document is reindexed, so every cached
+variant of its pages (language, query string, subpage) becomes unreachable
+at once.
+
+Responses carry an ETag and a Last-Modified header derived from the page
+(view, slug, language and query string) and the `updatedDate` of the
+document only, so they survive invalidations and restarts. Conditional
+requests are answered with 304 Not Modified.
+"""
+
+import hashlib
+import logging
+import uuid
+from calendar import timegm
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from ecolex import caching, metrics, resilience
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_page_cache_settings():
+    defaults = {
+        'enabled': True,
+    }
+    defaults.update(getattr(settings, 'DETAILS_CACHE', {}))
+    return defaults
+
+
+def _version_key(slug):
+    return 'details-version:{}'.format(slug)
+
+
+def slug_version(cache, slug):
+    """ The current version token of the pages of `slug`. """
+    key = _version_key(slug)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def _query_string(querydict):
+    return urlencode(sorted(
+        (k, v) for k in querydict for v in querydict.getlist(k)))
+
+
+def page_key(view_name, slug, language, querydict):
+    """ `None` if the page can't be cached. """
+    if not get_page_cache_settings()['enabled']:
+        return None
+    version = slug_version(caching.DETAILS.cache, slug)
+    return caching.DETAILS.key(view_name, slug, version, language,
+                               _query_string(querydict))
+
+
+def page_headers(view_name, slug, language, querydict, updated_at):
+    """ ETag and Last-Modified of a page, from the document's updatedDate. """
+    stamp = updated_at and timegm(updated_at.utctimetuple())
+    page = '\n'.join(map(str, (view_name, slug, language,
+                               _query_string(querydict), stamp)))
+    etag = hashlib.md5(page.encode('utf-8')).hexdigest()
+    return etag, stamp
+
+
+def set_headers(response, etag, last_modified):
+    response['ETag'] = quote_etag(etag)
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """ A 304 response if the client has the current page, else `None`. """
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified)
+    if response is not None:
+        set_headers(response, etag, last_modified)
+    return response
+
+
+def get_page(request, key):
+    """ The cached response for `key`, or `None`. """
+    entry = caching.DETAILS.cache.get(key)
+    metrics.cache_lookup(caching.DETAILS.name, entry is not None)
+    if entry is None:
+        return None
+    response = not_modified(request, entry['etag'], entry['last_modified'])
+    if response is not None:
+        return response
+    response = HttpResponse(entry['content'],
+                            content_type=entry['content_type'])
+    return set_headers(response, entry['etag'], entry['last_modified'])
+
+
+def store_page(key, response, etag, last_modified):
+    """ Post-render callback, caches successful responses. """
+    if response.status_code != 200 or resilience.is_stale():
+        return
+    caching.DETAILS.cache.set(key, {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'etag': etag,
+        'last_modified': last_modified,
+    }, caching.DETAILS.timeout)
+
+
+def invalidate(slugs):
+    """ Forget the cached pages of the given documents. """
+    slugs = [slug for slug in slugs if slug]
+    if not get_page_cache_settings()['enabled'] or not slugs:
+        return
+    try:
+        caching.DETAILS.cache.delete_many([_version_key(s) for s in slugs])
+    except Exception:
+        logger.exception('Error invalidating cached pages')
+
+
+def clear():
+    """ Forget all cached pages, e.g. after switching to a rebuilt index. """
+    if get_page_cache_settings()['enabled']:
+        caching.DETAILS.invalidate()
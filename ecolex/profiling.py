@@ -0,0 +1,99 @@
+"""
+Sampling profiler for live requests.
+
+A `Sampler` thread looks at the stack of the thread serving the request every
+few milliseconds and counts the distinct stacks. Profiles are written in the
+collapsed stack format ("outer;inner;innermost count" per line), one file per
+request under a directory per URL name, which flamegraph.pl and speedscope
+read directly. The merge_profiles command aggregates them.
+"""
+
+import os
+import random
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+EXTENSION = '.collapsed'
+
+
+def get_profiling_settings():
+    defaults = {
+        'rate': 0,
+        'token': None,
+        'interval': 0.005,
+        'directory': os.path.join(settings.BASE_DIR, 'logs', 'profiles'),
+    }
+    defaults.update(getattr(settings, 'PROFILING', {}))
+    return defaults
+
+
+def should_profile(request, options):
+    """ A random fraction of the requests, plus the requests sending the
+        configured token in an X-Profile header.
+    """
+    token = request.META.get(PROFILE_HEADER)
+    if token and options['token'] and token == options['token']:
+        return True
+    return options['rate'] > 0 and random.random() < options['rate']
+
+
+def frame_label(frame):
+    return '{}:{}'.format(frame.f_globals.get('__name__', '?'),
+                          frame.f_code.co_name)
+
+
+def collapse(frame):
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class Sampler(threading.Thread):
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profiler-{}'.format(thread_id), daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.stacks
+
+
+def write_profile(directory, name, stacks):
+    """ Write the sampled stacks of one request, returns the file path. """
+    target = os.path.join(directory, name)
+    os.makedirs(target, exist_ok=True)
+    path = os.path.join(target, '{:%Y%m%d-%H%M%S-%f}-{}{}'.format(
+        datetime.now(), os.getpid(), EXTENSION))
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in stacks.most_common():
+            f.write('{} {}\n'.format(stack, count))
+    return path
+
+
+def read_profile(path):
+    stacks = Counter()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack and count.isdigit():
+                stacks[stack] += int(count)
+    return stacks
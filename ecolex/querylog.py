@@ -0,0 +1,129 @@
+"""
+Record searches and details page visits, one JSON object per line, through
+the `ecolex.querylog` logger (see LOGGING in settings). The log is read back
+by the warm_caches and query_report commands.
+"""
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+from django.conf import settings
+
+from ecolex.xforms import FacetFieldMixin
+
+
+logger = logging.getLogger('ecolex.querylog')
+
+SEARCH = 'search'
+DETAILS = 'details'
+
+
+def query_params(querydict):
+    """ Non-empty parameters of a search, without the page, sorted. """
+    return {
+        key: sorted(value for value in querydict.getlist(key) if value)
+        for key in sorted(querydict.keys())
+        if key != 'page' and any(querydict.getlist(key))
+    }
+
+
+def query_key(params):
+    """ Canonical form of a search, the same for equivalent query strings. """
+    return urlencode([(key, value)
+                      for key, values in sorted(params.items())
+                      for value in values])
+
+
+def _write(entry):
+    if logger.isEnabledFor(logging.INFO):
+        entry['ts'] = round(time.time(), 3)
+        logger.info(json.dumps(entry, sort_keys=True))
+
+
+def used_fields(form):
+    """ Facets and ranges filtered on by a valid search form. """
+    facets, ranges = [], []
+    for name, value in form.cleaned_data.items():
+        if value in (None, '', []):
+            continue
+        field = form.fields[name]
+        if isinstance(field, FacetFieldMixin):
+            facets.append(name)
+        elif name.endswith(('_min', '_max')):
+            ranges.append(name[:-4])
+    return sorted(facets), sorted(set(ranges))
+
+
+def log_search(form, language, page, response=None, total_time=None):
+    """ `form` is a valid SearchForm, `total_time` is in seconds. """
+    params = query_params(form.data)
+    facets, ranges = used_fields(form)
+    entry = {
+        'kind': SEARCH,
+        'key': query_key(params),
+        'params': params,
+        'language': language,
+        'page': page,
+        'types': sorted(form.cleaned_data.get('type') or []),
+        'facets': facets,
+        'ranges': ranges,
+        'sort': form.cleaned_data.get('sortby') or '',
+    }
+    if response is not None:
+        entry['count'] = response.count
+        entry['qtime'] = response.qtime
+    if total_time is not None:
+        entry['total_time'] = round(total_time * 1000, 1)
+    _write(entry)
+
+
+def log_details(doc_type, slug, language):
+    _write({
+        'kind': DETAILS,
+        'type': doc_type,
+        'slug': slug,
+        'language': language,
+    })
+
+
+@contextmanager
+def paused():
+    """ Don't record the requests made meanwhile, e.g. by warm_caches. """
+    disabled = logger.disabled
+    logger.disabled = True
+    try:
+        yield
+    finally:
+        logger.disabled = disabled
+
+
+def log_files(path=None):
+    """ The log file and its rotated backups, oldest first. """
+    path = path or settings.QUERY_LOG_FILE
+    directory, name = os.path.split(path)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    backups = sorted(
+        (int(n[len(name) + 1:]), n) for n in names
+        if n.startswith(name + '.') and n[len(name) + 1:].isdigit()
+    )
+    files = [os.path.join(directory, n) for _, n in reversed(backups)]
+    if name in names:
+        files.append(path)
+    return files
+
+
+def read_entries(path=None):
+    for file_path in log_files(path):
+        with open(file_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
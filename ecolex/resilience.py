@@ -0,0 +1,240 @@
+"""
+Keeps the site responsive while Solr is slow or down.
+
+Every query of `xsearch.Queryer` goes through `call()`:
+
+- a request may spend at most SOLR_RESILIENCE['budget'] seconds waiting for
+  Solr, over all its queries; the timeout of each HTTP request is what is
+  left of it (see `instrumentation.InstrumentedSession`). Views setting
+  `solr_budget = False`, like the FAO feed and the exports, are not limited
+- a circuit breaker per Solr endpoint opens after 'failures' consecutive
+  errors or timeouts; while open, queries fail at once for 'cooldown'
+  seconds, then a single trial query is let through
+- with 'stale' enabled, the last good response of each query is kept in a
+  cache of the process and served instead when Solr fails, with
+  `is_stale()` set for the request. It is written after every query, which
+  a shared file based cache can't afford. Responses over 'stale_max_size'
+  characters, like the unlimited facet lists, are not kept, which bounds
+  the memory it takes with the MAX_ENTRIES of the cache. While the breaker is open, the
+  trial query runs in the background so the visitor is not kept waiting
+
+When there is nothing to fall back on, `SolrUnavailable` is raised and
+`SolrResilienceMiddleware` renders a 503 page.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from scorched.exc import SolrError
+
+from ecolex import metrics
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class SolrUnavailable(Exception):
+    pass
+
+
+def get_resilience_settings():
+    defaults = {
+        'enabled': True,
+        'budget': 10,
+        'failures': 5,
+        'cooldown': 30,
+        'stale': False,
+        'cache': 'default',
+        'stale_timeout': 24 * 3600,
+        'stale_max_size': 100 * 1024,
+    }
+    defaults.update(getattr(settings, 'SOLR_RESILIENCE', {}))
+    return defaults
+
+
+def start_request(limited=True):
+    config = get_resilience_settings()
+    _local.deadline = (time.monotonic() + config['budget']
+                       if config['enabled'] and limited else None)
+    _local.stale = False
+
+
+def end_request():
+    stale = is_stale()
+    _local.deadline = None
+    _local.stale = False
+    return stale
+
+
+def remaining():
+    """ Seconds left to wait for Solr in this request, `None` if unlimited.
+    """
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0)
+
+
+def mark_stale():
+    _local.stale = True
+
+
+def is_stale():
+    """ Whether some data of this request was served from the fallback. """
+    return getattr(_local, 'stale', False)
+
+
+def is_failure(error):
+    """ Errors that tell Solr is unwell, as opposed to e.g. a bad query. """
+    if isinstance(error, requests.RequestException):
+        return True
+    if isinstance(error, SolrError):
+        response = error.args[0] if error.args else None
+        return getattr(response, 'status_code', 500) >= 500
+    return False
+
+
+class CircuitBreaker(object):
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """ Whether a query may be sent now. Past the cooldown, only the
+            first caller gets to try; if its outcome is never reported,
+            another one may try after a further cooldown.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            cooldown = get_resilience_settings()['cooldown']
+            if time.monotonic() - self.opened_at >= cooldown:
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.warning('Solr at %s is back', self.endpoint)
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            threshold = get_resilience_settings()['failures']
+            if self.state == self.HALF_OPEN or self.failures >= threshold:
+                if self.state == self.CLOSED:
+                    logger.error('Solr at %s is failing, stop querying it '
+                                 'for a while', self.endpoint)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(endpoint):
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+
+def _stale_key(parts):
+    return 'stale:' + hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def get_last_good(parts, config):
+    if not config['stale']:
+        return None
+    try:
+        return caches[config['cache']].get(_stale_key(parts))
+    except Exception:
+        logger.exception('Error reading the last good Solr response')
+        return None
+
+
+def set_last_good(parts, raw, config):
+    if not config['stale'] or len(raw) > config['stale_max_size']:
+        return
+    try:
+        caches[config['cache']].set(_stale_key(parts), raw,
+                                    config['stale_timeout'])
+    except Exception:
+        logger.exception('Error storing the last good Solr response')
+
+
+def _query(breaker, parts, fn, config):
+    try:
+        raw = fn()
+    except Exception as e:
+        if is_failure(e):
+            breaker.failure()
+        else:
+            # e.g. a bad query, Solr did answer
+            breaker.success()
+        raise
+    breaker.success()
+    set_last_good(parts, raw, config)
+    return raw
+
+
+def _refresh(breaker, parts, fn, config):
+    try:
+        _query(breaker, parts, fn, config)
+    except Exception:
+        logger.info('Solr at %s is still failing', breaker.endpoint)
+
+
+def _fallback(parts, config, error=None):
+    raw = get_last_good(parts, config)
+    if raw is None:
+        metrics.SOLR_DEGRADED.labels('unavailable').inc()
+        raise SolrUnavailable() from error
+    metrics.SOLR_DEGRADED.labels('stale').inc()
+    return raw, True
+
+
+def call(endpoint, parts, fn):
+    """ `(raw, stale)`: the response of `fn()`, which queries `endpoint`
+        with `parts`, or the last good one if Solr fails.
+    """
+    config = get_resilience_settings()
+    if not config['enabled']:
+        return fn(), False
+
+    breaker = get_breaker(endpoint)
+    if remaining() == 0 or not breaker.allow():
+        return _fallback(parts, config)
+
+    if breaker.state == breaker.HALF_OPEN and \
+            get_last_good(parts, config) is not None:
+        threading.Thread(target=_refresh, args=(breaker, parts, fn, config),
+                         daemon=True).start()
+        return _fallback(parts, config)
+
+    try:
+        return _query(breaker, parts, fn, config), False
+    except Exception as e:
+        if not is_failure(e):
+            raise
+        logger.warning('Solr query failed: %s', e)
+        return _fallback(parts, config, e)
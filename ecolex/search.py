@@ -4,6 +4,7 @@ from django.conf import settings
 from django.utils.translation import get_language
 
 from ecolex.lib.utils import camel_case_to__
+from ecolex.instrumentation import instrument_pysolr, solr_call
 from ecolex import definitions as defs
 from ecolex.forms import SearchForm
 from ecolex.schema import (
@@ -305,7 +306,7 @@ def _search(user_query, filters=None, highlight=True, start=0, rows=PERPAGE,
     if facets_page_size is None:
         facets_page_size = settings.FACETS_PAGE_SIZE
 
-    solr = pysolr.Solr(settings.SOLR_URI, timeout=60)
+    solr = instrument_pysolr(pysolr.Solr(settings.SOLR_URI, timeout=60))
 
     if user_query == '*':
         solr_query = '*:*'
@@ -359,7 +360,7 @@ def _search(user_query, filters=None, highlight=True, start=0, rows=PERPAGE,
             'facet.prefix': only_facet.get('prefix', '')
         })
 
-        return solr.search(solr_query, **params)
+        return _execute(solr, solr_query, params)
 
     else:
         params['facet.field'] = facets or filters.keys()
@@ -382,7 +383,14 @@ def _search(user_query, filters=None, highlight=True, start=0, rows=PERPAGE,
     if settings.DEBUG:
         params['debug'] = True
 
-    return solr.search(solr_query, **params)
+    return _execute(solr, solr_query, params)
+
+
+def _execute(solr, solr_query, params):
+    with solr_call() as call:
+        result = solr.search(solr_query, **params)
+        call.qtime = result.qtime
+    return result
 
 
 def get_documents_by_field(id_name, treaty_ids, rows=None, **kwargs):
@@ -92,6 +92,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'ecolex.middleware.ServerTimingMiddleware',
+    'ecolex.middleware.SolrResilienceMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     #'django.middleware.locale.LocaleMiddleware',
     'solid_i18n.middleware.SolidLocaleMiddleware',
@@ -102,6 +104,7 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.messages.middleware.MessageMiddleware',
     #'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'ecolex.middleware.CacheControlMiddleware',
+    'ecolex.middleware.ProfilerMiddleware',
 )
 
 TEMPLATES = [{
@@ -160,9 +163,102 @@ DATABASES = {
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    # shared by the web workers and the importers, which invalidate entries;
+    # culled from cron by the cull_cache command, not on every write
+    'shared': {
+        'BACKEND': 'ecolex.caching.FileCache',
+        'LOCATION': os.environ.get('EDW_RUN_WEB_CACHE_DIR',
+                                   os.path.join(BASE_DIR, 'cache', 'shared')),
+        'TIMEOUT': 7 * 24 * 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 200000,
+        },
+    },
+    # per-process LRU in front of 'shared', see ecolex.caching
+    'search': {
+        'BACKEND': 'ecolex.caching.TwoTierCache',
+        'LOCATION': 'shared',
+        'TIMEOUT': 7 * 24 * 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+            'LOCAL_TIMEOUT': 30,
+        },
+    },
+    # last good Solr responses of each process, see ecolex.resilience; at
+    # most MAX_ENTRIES * SOLR_RESILIENCE['stale_max_size'] of memory
+    'stale': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'stale',
+        'TIMEOUT': 24 * 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 300,
+        },
+    },
+}
+
+# facets, counts and redirects, see ecolex.caching
+SEARCH_CACHE = {
+    'enabled': not DEBUG and not os.environ.get('EDW_RUN_WEB_NO_CACHE'),
+    'cache': 'search',
+    # seconds between checks of the index generation
+    'generation_poll': int(os.environ.get('EDW_RUN_WEB_GENERATION_POLL', 5)),
+}
+
+# see ecolex.pagecache
+DETAILS_CACHE = {
+    'enabled': not DEBUG and not os.environ.get('EDW_RUN_WEB_NO_CACHE'),
+}
+
+# identical concurrent Solr queries share one request, see ecolex.singleflight
+SOLR_COALESCE = {
+    'enabled': True,
+    # also across the gunicorn workers, through a cache with an atomic and
+    # cheap add(), e.g. memcached; not the file based 'shared' cache, whose
+    # add() is not atomic
+    'shared': False,
+    'cache': 'shared',
+}
+
+# see ecolex.resilience
+SOLR_RESILIENCE = {
+    'enabled': True,
+    # seconds a request may wait for Solr, over all its queries
+    'budget': float(os.environ.get('EDW_RUN_WEB_SOLR_BUDGET', 10)),
+    # consecutive failures opening the circuit, and for how long
+    'failures': 5,
+    'cooldown': 30,
+    # serve the last good response of a query when Solr fails
+    'stale': not DEBUG and not os.environ.get('EDW_RUN_WEB_NO_CACHE'),
+    'cache': 'stale',
+    # characters; larger responses, e.g. with facet.limit=-1, are not kept
+    'stale_max_size': 100 * 1024,
+}
+
+
+# Searches and details page visits, read by the warm_caches command
+QUERY_LOG_FILE = os.path.join(BASE_DIR, 'logs', 'queries.log')
+
+# send per-request Solr timings back in a Server-Timing header
+SERVER_TIMING = DEBUG or bool(os.environ.get('EDW_RUN_WEB_SERVER_TIMING'))
+
+# Prometheus metrics, shared by the web workers and the importers through
+# files in `directory`; served to `allowed_ips` or with the bearer `token`
+METRICS = {
+    'directory': os.environ.get('PROMETHEUS_MULTIPROC_DIR',
+                                os.path.join(BASE_DIR, 'logs', 'metrics')),
+    'token': os.environ.get('EDW_RUN_WEB_METRICS_TOKEN'),
+    'allowed_ips': ('127.0.0.1',),
 }
 
+# sample the stacks of a fraction of the requests, and of requests sending
+# the token in an X-Profile header; see the merge_profiles command
+PROFILING = {
+    'rate': float(os.environ.get('EDW_RUN_WEB_PROFILE_RATE', 0)),
+    'token': os.environ.get('EDW_RUN_WEB_PROFILE_TOKEN'),
+    'interval': 0.005,
+    'directory': os.path.join(BASE_DIR, 'logs', 'profiles'),
+}
 
 LOGGING = {
     'version': 1,
@@ -172,6 +268,9 @@ LOGGING = {
             'format': "[%(asctime)s] %(levelname)s [%(name)s:%(lineno)s] %(message)s",
             'datefmt': "%d/%b/%Y %H:%M:%S"
         },
+        'message': {
+            'format': "%(message)s",
+        },
     },
     'handlers': {
         # TODO dockerize this. use console.
@@ -181,14 +280,38 @@ LOGGING = {
             'formatter': 'verbose',
             'maxBytes': 10485760,
             'backupCount': 10,
-        }
+        },
+        'querylog': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': QUERY_LOG_FILE,
+            'formatter': 'message',
+            'maxBytes': 52428800,
+            'backupCount': 5,
+        },
+        'timing': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs', 'timing.log'),
+            'formatter': 'message',
+            'maxBytes': 52428800,
+            'backupCount': 5,
+        },
     },
     'loggers': {
         'django': {
             'handlers': ['logfile'],
             'level': 'DEBUG' if DEBUG else 'ERROR',
             'propagate': False,
-        }
+        },
+        'ecolex.querylog': {
+            'handlers': ['querylog'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'ecolex.instrumentation': {
+            'handlers': ['timing'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     }
 }
 
@@ -251,9 +374,45 @@ SEARCH_PAGE_SIZE = 20
 STATIC_URL = '/static/'
 STATIC_ROOT = os.environ.get('EDW_RUN_WEB_STATIC_ROOT') or os.path.join(BASE_DIR, 'static')
 
+# DocumentText.text and DocumentText.parsed_data are stored compressed.
+# Values larger than `external_threshold` bytes (after compression) are moved
+# to content-addressed files under `external_dir`, if set.
+DOCUMENT_TEXT_STORAGE = {
+    'codec': os.environ.get('EDW_RUN_WEB_TEXT_CODEC', 'zlib'),  # or zstd
+    'level': 6,
+    'external_dir': os.environ.get('EDW_RUN_WEB_TEXT_STORE_DIR'),
+    'external_threshold': 256 * 1024,
+}
+
+# Text extraction from files attached to documents: 'solr' posts them to
+# Solr's /update/extract (Tika), 'local' extracts PDF, DOCX, HTML and text
+# files on this host, and posts other formats to Solr.
+TEXT_EXTRACTION = {
+    'backend': os.environ.get('EDW_RUN_TEXT_EXTRACTOR', 'local'),
+    'workers': int(os.environ.get('EDW_RUN_TEXT_EXTRACTOR_WORKERS', 2)),
+    'timeout': 120,  # seconds, per file
+    'memory_limit': 2 * 1024 * 1024 * 1024,  # bytes, per worker
+}
+
+# Index-time limits for full-text fields, see ecolex.management.fulltext
+FULL_TEXT_POLICY = {
+    'max_length': 2 * 1024 * 1024,  # characters per document
+    'min_dedup_length': 40,  # shorter paragraphs are never dropped as duplicates
+}
+
 # Solr
 SOLR_URI = os.environ.get('EDW_RUN_SOLR_URI', '')
 
+# Blue/green reindexing (rebuild_index --blue-green), see
+# ecolex.management.solr_admin. In 'cloud' mode SOLR_URI must name an alias.
+SOLR_REINDEX = {
+    'mode': os.environ.get('EDW_RUN_SOLR_MODE', 'core'),  # or cloud
+    'config_set': os.environ.get('EDW_RUN_SOLR_CONFIG_SET', 'ecolex'),
+    'num_shards': 1,
+    # minimum document count of each type, relative to the live index
+    'min_ratio': 0.99,
+}
+
 # For default sorting, set SOLR_SORTING to ''
 SOLR_SORTING = ''
 
@@ -340,6 +499,9 @@ SOLR_IMPORT = {
         'fao_subjects_xml': os.path.join(CONFIG_DIR, 'fao_subjects.xml'),
         'treaties_json': TREATIES,
         'informea_ecolex_json': os.path.join(CONFIG_DIR, 'informea_ecolex.json'),
+        # raw harvested payloads, used by rebuild_index; empty to disable
+        'snapshot_dir': os.environ.get('EDW_RUN_SNAPSHOT_DIR',
+                                       os.path.join(BASE_DIR, 'snapshots')),
     },
     'court_decision': {
         'base_url': 'https://informea.org/ws/court-decisions',
@@ -384,6 +546,9 @@ SOLR_IMPORT = {
         'items_per_page': 50,
         'max_pages': 10,
         'node_url': 'https://www.informea.org/node',
+        # meeting nodes are shared by many decisions and rarely change
+        'node_cache_dir': os.path.join(BASE_DIR, 'cache', 'informea_nodes'),
+        'node_cache_ttl': 7 * 24 * 60 * 60,
     },
     'legislation': {},
 }
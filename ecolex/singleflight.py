@@ -0,0 +1,125 @@
+"""
+Coalescing of identical concurrent Solr queries.
+
+Within a process, callers asking for a query already in flight wait for it
+and share its result. With 'shared' enabled, the processes also coordinate
+through a lock in a shared cache: the first one runs the query and stores
+the raw response for a few seconds, the others poll for it. If the holder
+of the lock fails or takes longer than 'wait' seconds, the waiting processes
+run the query themselves. This costs a few cache writes per query, and the
+lock relies on `add()` being atomic, so it is only worth it with a backend
+like memcached.
+
+Only raw responses are shared, each caller parses its own copy since the
+views modify the parsed responses in place.
+"""
+
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from ecolex import metrics, resilience
+
+
+def get_coalesce_settings():
+    defaults = {
+        'enabled': True,
+        'shared': False,
+        'cache': 'shared',
+        'wait': 10,  # seconds waiting for another process
+        'poll': .05,
+        'lock_timeout': 30,
+        'result_timeout': 5,
+    }
+    defaults.update(getattr(settings, 'SOLR_COALESCE', {}))
+    return defaults
+
+
+class Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group(object):
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """ The result of `fn()`, shared with the concurrent calls of `key`. """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Call()
+
+        if not leader:
+            metrics.SOLR_COALESCED.labels('process').inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+GROUP = Group()
+
+
+def shared_do(key, fn, config):
+    cache = caches[config['cache']]
+    lock_key = 'singleflight:lock:' + key
+    result_key = 'singleflight:result:' + key
+
+    if cache.add(lock_key, 1, config['lock_timeout']):
+        try:
+            result = fn()
+            cache.set(result_key, result, config['result_timeout'])
+            return result
+        finally:
+            cache.delete(lock_key)
+
+    wait = config['wait']
+    budget = resilience.remaining()
+    if budget is not None:
+        wait = min(wait, budget)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(config['poll'])
+        # read the lock first, the result is stored before it's released
+        locked = cache.get(lock_key) is not None
+        result = cache.get(result_key)
+        if result is not None:
+            metrics.SOLR_COALESCED.labels('shared').inc()
+            return result
+        if not locked:
+            break
+    return fn()
+
+
+def do(parts, fn):
+    """ Run `fn()` once for all the concurrent callers with the same `parts`.
+    """
+    config = get_coalesce_settings()
+    if not config['enabled']:
+        return fn()
+    key = hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+    if config['shared']:
+        return GROUP.do(key, lambda: shared_do(key, fn, config))
+    return GROUP.do(key, fn)
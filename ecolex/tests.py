@@ -1,5 +1,25 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.http import HttpResponse, QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils.functional import empty
 from django.core.urlresolvers import reverse
+from scorched import SolrInterface
+from scorched.exc import SolrError
+
+from ecolex import caching, pagecache, resilience, singleflight, xsearch
+from ecolex.fakesolr import start_server
+from ecolex.lib import storage
+from ecolex.models import DocumentId, DocumentText, IndexGeneration
+from ecolex.xsearch import Queryer, Searcher
 
 
 class TheTest(TestCase):
@@ -14,3 +34,478 @@ class TheTest(TestCase):
         assert False # TODO
         # Check the filters
         # Check pagination
+
+
+FAKE_DOCUMENTS = [
+    {
+        'id': 't1', 'type': 'treaty', 'slug': 'polar-bears',
+        'trElisId': 'TRE-000001',
+        'trTitleOfText_en': 'Agreement on Conservation of Polar Bears',
+        'docCountry_en': ['Norway', 'Canada'],
+        'trDateOfText': '1973-11-15T00:00:00Z',
+    },
+    {
+        'id': 't2', 'type': 'treaty', 'slug': 'whaling',
+        'trElisId': 'TRE-000002', 'trInformeaId': 'whaling',
+        'updatedDate': '2020-01-02T03:04:05Z',
+        'trTitleOfText_en': 'Convention for the Regulation of Whaling',
+        'docCountry_en': ['Norway'],
+        'trDateOfText': '1946-12-02T00:00:00Z',
+        'partyCountry_en': ['Norway', 'Japan'],
+        'partyDateOfRatification': ['1948-03-01T00:00:00Z',
+                                    '1951-04-21T00:00:00Z'],
+    },
+    {
+        'id': 'l1', 'type': 'legislation', 'slug': 'polar-bear-act',
+        'legTitle': 'Polar Bear Protection Act',
+        'legCountry_en': 'Canada',
+        'legDate': '2001-01-01T00:00:00Z',
+    },
+]
+
+
+class FakeSolrSearchTest(SimpleTestCase):
+    """ The search layer against ecolex.fakesolr, no Solr server needed. """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_server(documents=FAKE_DOCUMENTS)
+        cls.interface = SolrInterface(cls.server.url + 'solr/ecolex/')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def search(self, data):
+        return Searcher(data, 'en', interface=self.interface).search()
+
+    def test_search(self):
+        response = self.search({'q': 'polar'})
+        self.assertEqual(response.count, 2)
+        self.assertEqual({doc.slug for doc in response},
+                         {'polar-bears', 'polar-bear-act'})
+
+    def test_or_facet_ignores_its_own_filter(self):
+        response = self.search({'q': 'polar', 'xcountry': ['Canada']})
+        self.assertEqual(response.count, 2)
+        countries = {f['text']: f['count'] for f in response.facets['xcountry']}
+        self.assertEqual(countries, {'Canada': 2, 'Norway': 1})
+
+    def get(self, data, **kwargs):
+        """ The document and the parameters sent to Solr. """
+        conn = self.interface.conn
+        with mock.patch.object(conn, 'select', wraps=conn.select) as select:
+            doc = Queryer(data, 'en', interface=self.interface).get(**kwargs)
+        return doc, {
+            name: value.decode('utf-8') if isinstance(value, bytes) else value
+            for name, value in select.call_args[0][0]
+        }
+
+    def test_get(self):
+        queryer = Queryer({}, 'en', interface=self.interface)
+        self.assertEqual(queryer.get(slug='whaling').type, 'treaty')
+
+    def test_get_highlights_the_query(self):
+        doc, params = self.get({'q': 'whaling'}, profile='details',
+                               doc_type='treaty', slug='whaling')
+        self.assertEqual(params['hl.q'], 'whaling')
+        self.assertEqual(params['q'], '*:*')
+        self.assertIn('<em class="hl">Whaling</em>', doc.title_of_text)
+
+    def test_get_without_query_does_not_highlight(self):
+        doc, params = self.get({}, profile='details', doc_type='treaty',
+                               slug='whaling')
+        self.assertEqual(params['hl'], 'false')
+        self.assertNotIn('hl.q', params)
+        self.assertNotIn('<em', doc.title_of_text)
+
+    def test_related_profile(self):
+        doc, _ = self.get({}, profile='related', doc_type='treaty',
+                               slug='whaling')
+        self.assertEqual(doc.document_id, 'TRE-000002')
+        self.assertEqual(doc.informea_id, 'whaling')
+
+    def test_participants_profile(self):
+        doc, _ = self.get({}, profile='participants', doc_type='treaty',
+                               slug='whaling')
+        self.assertEqual(doc.document_id, 'TRE-000002')
+        self.assertEqual([party.country for party in doc.parties],
+                         ['Norway', 'Japan'])
+
+
+class CompressedTextTest(TestCase):
+
+    def create(self, text):
+        return DocumentText.objects.create(
+            doc_id='d1', doc_type='legislation', url='http://example.org/d1',
+            text=text)
+
+    def test_round_trip(self):
+        text = 'Protection des ours polaires – ' * 100
+        doc = self.create(text)
+        stored = DocumentText.objects.filter(pk=doc.pk).values_list(
+            'text', flat=True)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT text FROM ecolex_documenttext WHERE id = %s',
+                           [doc.pk])
+            raw = bytes(cursor.fetchone()[0])
+        self.assertTrue(raw.startswith(storage.ZLIB))
+        self.assertLess(len(raw), len(text.encode('utf-8')))
+        self.assertEqual(list(stored), [text])
+        self.assertEqual(DocumentText.objects.get(pk=doc.pk).text, text)
+
+    def test_empty_and_null(self):
+        self.assertEqual(DocumentText.objects.get(pk=self.create('').pk).text,
+                         '')
+        self.assertIsNone(DocumentText.objects.get(pk=self.create(None).pk).text)
+
+    def test_legacy_rows(self):
+        text = 'Texte non compressé'
+        doc = self.create('')
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE ecolex_documenttext SET text = %s '
+                           'WHERE id = %s', [text.encode('utf-8'), doc.pk])
+        self.assertEqual(DocumentText.objects.get(pk=doc.pk).text, text)
+        self.assertEqual(storage.decode(text), text)
+
+
+LOCMEM_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': alias}
+    for alias in ('default', 'stale')
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES,
+                   SEARCH_CACHE={'cache': 'default', 'generation_poll': 0})
+class SearchCacheTest(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.namespace = caching.Namespace('test', 60)
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def get(self, *parts):
+        return self.namespace.get_or_compute(parts, self.compute)
+
+    def test_cached(self):
+        self.assertEqual(self.get('a'), 1)
+        self.assertEqual(self.get('a'), 1)
+        self.assertEqual(self.get('b'), 2)
+
+    def test_none_is_not_cached(self):
+        self.assertIsNone(self.namespace.get_or_compute(('a',), lambda: None))
+        self.assertEqual(self.get('a'), 1)
+
+    def test_namespace_invalidation(self):
+        other = caching.Namespace('other', 60)
+        other.get_or_compute(('a',), lambda: 'kept')
+        self.get('a')
+        self.namespace.invalidate()
+        self.assertEqual(self.get('a'), 2)
+        self.assertEqual(other.get_or_compute(('a',), lambda: 'new'), 'kept')
+
+    def test_generation_invalidation(self):
+        self.get('a')
+        caching.GENERATION.bump()
+        self.assertEqual(self.get('a'), 2)
+
+    def test_index_changes_invalidate_once(self):
+        generation = IndexGeneration.current()
+        with caching.index_changes():
+            for _ in range(3):
+                caching.invalidate_search()
+            self.assertEqual(IndexGeneration.current(), generation)
+        self.assertEqual(IndexGeneration.current(), generation + 1)
+
+
+class FileCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = caching.FileCache(directory.name, {
+            'OPTIONS': {'MAX_ENTRIES': 2}})
+
+    def test_writes_do_not_cull(self):
+        for key in 'abcd':
+            self.cache.set(key, key)
+        self.assertEqual([self.cache.get(key) for key in 'abcd'],
+                         ['a', 'b', 'c', 'd'])
+
+    def test_cull_expired_then_oldest(self):
+        self.cache.set('expired', 1, 1)
+        for age, key in enumerate('abcd'):
+            self.cache.set(key, key)
+            path = self.cache._key_to_file(key)
+            os.utime(path, (time.time() - age, time.time() - age))
+        with mock.patch('time.time', return_value=time.time() + 2):
+            self.assertEqual(self.cache.cull(), 3)
+        self.assertEqual([self.cache.get(key) for key in 'abcd'],
+                         ['a', 'b', None, None])
+
+
+class CoalesceTest(SimpleTestCase):
+
+    def test_concurrent_callers_share_one_call(self):
+        release = threading.Event()
+        calls = []
+
+        def query():
+            calls.append(1)
+            release.wait(5)
+            return 'response'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                singleflight.do(('select', 'q=polar'), query)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        # wait until they're all waiting on the first call
+        deadline = time.monotonic() + 5
+        while (time.monotonic() < deadline and
+               len(singleflight.GROUP._calls) != 1):
+            time.sleep(.01)
+        time.sleep(.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['response'] * 8)
+
+    def test_errors_are_shared_then_forgotten(self):
+        def fail():
+            raise ValueError('bad query')
+
+        with self.assertRaises(ValueError):
+            singleflight.do(('select', 'q=bad'), fail)
+        self.assertEqual(singleflight.do(('select', 'q=bad'), lambda: 'ok'),
+                         'ok')
+
+
+@override_settings(SOLR_RESILIENCE={'failures': 2, 'cooldown': 30,
+                                    'stale': False})
+class CircuitBreakerTest(SimpleTestCase):
+
+    def setUp(self):
+        self.breaker = resilience.CircuitBreaker('http://solr/')
+
+    def call(self, fn):
+        return resilience._query(self.breaker, ('q',), fn,
+                                 resilience.get_resilience_settings())
+
+    def fail(self):
+        raise requests.ConnectionError()
+
+    def end_cooldown(self):
+        self.breaker.opened_at -= 30
+
+    def open(self):
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                self.call(self.fail)
+
+    def test_closed_open_half_open_closed(self):
+        self.assertTrue(self.breaker.allow())
+        self.open()
+        self.assertEqual(self.breaker.state, self.breaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+        self.end_cooldown()
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, self.breaker.HALF_OPEN)
+        # a single trial query
+        self.assertFalse(self.breaker.allow())
+
+        self.assertEqual(self.call(lambda: 'response'), 'response')
+        self.assertEqual(self.breaker.state, self.breaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_trial_opens_again(self):
+        self.open()
+        self.end_cooldown()
+        self.assertTrue(self.breaker.allow())
+        with self.assertRaises(requests.ConnectionError):
+            self.call(self.fail)
+        self.assertEqual(self.breaker.state, self.breaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_bad_query_closes(self):
+        def bad_query():
+            raise SolrError(mock.Mock(status_code=400), 'bad query')
+
+        self.open()
+        self.end_cooldown()
+        self.assertTrue(self.breaker.allow())
+        with self.assertRaises(SolrError):
+            self.call(bad_query)
+        self.assertEqual(self.breaker.state, self.breaker.CLOSED)
+
+    def test_unreported_trial_expires(self):
+        self.open()
+        self.end_cooldown()
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.end_cooldown()
+        self.assertTrue(self.breaker.allow())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LastGoodTest(SimpleTestCase):
+
+    def setUp(self):
+        self.config = dict(resilience.get_resilience_settings(),
+                           stale=True, stale_max_size=10)
+        caches[self.config['cache']].clear()
+
+    def test_small_responses_are_kept(self):
+        resilience.set_last_good(('q=a',), '{"a": 1}', self.config)
+        self.assertEqual(resilience.get_last_good(('q=a',), self.config),
+                         '{"a": 1}')
+
+    def test_large_responses_are_not_kept(self):
+        resilience.set_last_good(('q=b',), '{"b": [1, 2, 3]}', self.config)
+        self.assertIsNone(resilience.get_last_good(('q=b',), self.config))
+
+
+class FakeSolrSiteTest(TestCase):
+    """ Pages served from ecolex.fakesolr, with `overrides` settings. """
+
+    overrides = {'SEARCH_CACHE': {'enabled': False}}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_server(documents=FAKE_DOCUMENTS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        # loading the urls may have set it up against the fake server
+        xsearch.DEFAULT_INTERFACE._wrapped = empty
+        super().tearDownClass()
+
+    def setUp(self):
+        settings = override_settings(
+            SOLR_URI=self.server.url + 'solr/ecolex/', **self.overrides)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class OldUrlRedirectTest(FakeSolrSiteTest):
+
+    def setUp(self):
+        super().setUp()
+        # partly filled, e.g. by the first import after deploying
+        DocumentId.objects.record([FAKE_DOCUMENTS[0]])
+
+    def redirect(self, doc_id):
+        return self.client.get(reverse('detailpage_redirect', kwargs={
+            'doc_type': 'treaty', 'doc_id': doc_id}))
+
+    def test_from_table(self):
+        response = self.redirect('TRE-000001')
+        self.assertRedirects(response, reverse(
+            'treaty_details', kwargs={'slug': 'polar-bears'}),
+            fetch_redirect_response=False)
+
+    def test_missing_from_table(self):
+        response = self.redirect('TRE-000002')
+        self.assertRedirects(response, reverse(
+            'treaty_details', kwargs={'slug': 'whaling'}),
+            fetch_redirect_response=False)
+        self.assertEqual(
+            DocumentId.objects.resolve(['trElisId'], 'TRE-000002'),
+            ('treaty', 'whaling'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PageCacheTest(FakeSolrSiteTest):
+
+    overrides = {
+        'SEARCH_CACHE': {'cache': 'default', 'generation_poll': 0},
+        'DETAILS_CACHE': {'enabled': True},
+    }
+
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.url = reverse('treaty_details', kwargs={'slug': 'whaling'})
+        patcher = mock.patch.object(Queryer, 'get', autospec=True,
+                                    side_effect=Queryer.get)
+        self.queries = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, **headers)
+        self.assertIn(response.status_code, (200, 304))
+        return response
+
+    def test_key_varies_by_language_and_query(self):
+        keys = {
+            pagecache.page_key('TreatyDetails', 'whaling', language,
+                               QueryDict(query))
+            for language in ('en', 'fr') for query in ('', 'q=whale')
+        }
+        self.assertEqual(len(keys), 4)
+
+    def test_anonymous_hit(self):
+        first = self.get()
+        second = self.get()
+        self.assertEqual(self.queries.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.get(self.url + '?q=whale')
+        self.assertEqual(self.queries.call_count, 2)
+
+    def test_authenticated_bypass(self):
+        user = User.objects.create_user('editor', password='secret')
+        self.client.force_login(user)
+        response = self.get()
+        self.get()
+        self.assertEqual(self.queries.call_count, 2)
+        self.assertNotIn('ETag', response)
+
+    def test_not_modified(self):
+        response = self.get()
+        for headers in ({'HTTP_IF_NONE_MATCH': response['ETag']},
+                        {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}):
+            # a hit
+            self.assertEqual(self.get(**headers).status_code, 304)
+            # and a miss, with the same validators
+            caches['default'].clear()
+            self.assertEqual(self.get(**headers).status_code, 304)
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_etag_survives_invalidation(self):
+        etag = self.get()['ETag']
+        caching.invalidate_search()
+        pagecache.invalidate(['whaling'])
+        self.assertEqual(self.get()['ETag'], etag)
+
+    def test_stale_and_errors_not_stored(self):
+        key = pagecache.page_key('TreatyDetails', 'whaling', 'en', QueryDict())
+        pagecache.store_page(key, HttpResponse(status=404), 'etag', None)
+        self.assertIsNone(caching.DETAILS.cache.get(key))
+
+        resilience.start_request()
+        self.addCleanup(resilience.end_request)
+        resilience.mark_stale()
+        pagecache.store_page(key, HttpResponse('stale'), 'etag', None)
+        self.assertIsNone(caching.DETAILS.cache.get(key))
+
+    def test_invalidate(self):
+        self.get()
+        pagecache.invalidate(['whaling'])
+        self.get()
+        self.assertEqual(self.queries.call_count, 2)
@@ -8,7 +8,7 @@ from solid_i18n.urls import solid_i18n_patterns as i18n_patterns
 from .views import (
     DesignPlayground, FaoFeedView, Homepage,
     DetailPageRedirectView, OldEcolexRedirectView,
-    PageView, debug, ExportView
+    PageView, debug, ExportView, metrics_view
 )
 from . import xviews as views
 from .api import urls as api_urls
@@ -20,6 +20,7 @@ urlpatterns = [
     url(r'^fao/$', FaoFeedView.as_view(), name='fao_feeder'),
     url(r'^i18n/', include('django.conf.urls.i18n')),
     url(r'^export/$', ExportView.as_view(), name='export'),
+    url(r'^metrics/$', metrics_view, name='metrics'),
     url(r'^sitemap.xml', include('static_sitemaps.urls')),
 ]
 
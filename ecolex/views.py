@@ -2,6 +2,7 @@ import logging
 from urllib.parse import urlencode
 from django.conf import settings
 from django.core.urlresolvers import reverse
+from django.db import DatabaseError
 from django.http import Http404, HttpResponseForbidden, HttpResponseServerError
 from django.http import JsonResponse, HttpResponse, HttpResponseRedirect
 from django.shortcuts import render, get_object_or_404
@@ -13,10 +14,11 @@ from django.views.generic.base import RedirectView
 
 from datetime import datetime
 
+from ecolex import caching, metrics
 from ecolex.definitions import FIELD_TO_FACET_MAPPING, SELECT_FACETS, STATIC_PAGES
 from ecolex.export import get_exporter
 from ecolex.legislation import harvest_file
-from ecolex.models import StaticContent
+from ecolex.models import DocumentId, StaticContent
 from ecolex.mixins import ExportValidatorMixin
 from ecolex.search import SearchMixin, get_documents_by_field
 from ecolex.management.utils import EcolexSolr
@@ -178,6 +180,8 @@ class PageView(SearchView):
 
 
 class FaoFeedView(View):
+    # indexes many documents in one request
+    solr_budget = False
 
     @method_decorator(csrf_exempt)
     def dispatch(self, request, *args, **kwargs):
@@ -227,10 +231,45 @@ def debug(request):
     return JsonResponse(data)
 
 
+def metrics_view(request):
+    options = settings.METRICS
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not (request.META.get('REMOTE_ADDR') in options['allowed_ips'] or
+            options['token'] and
+            authorization == 'Bearer {}'.format(options['token'])):
+        return HttpResponseForbidden('Forbidden')
+    data, content_type = metrics.render()
+    return HttpResponse(data, content_type=content_type)
+
+
 class DesignPlayground(TemplateView):
     template_name = 'playground.html'
 
 
+def find_slug(doc_type, id_fields, doc_id):
+    """ The slug of a document from its source ID. Solr is searched for the
+        IDs missing from the `DocumentId` table, which are then added to it.
+    """
+    found = DocumentId.objects.resolve(id_fields, doc_id)
+    if found:
+        return found[1] if found[0] == doc_type else None
+    for id_field in id_fields:
+        results = get_documents_by_field(id_field, [doc_id], rows=1)
+        if results:
+            document = [x for x in results][0]
+            try:
+                DocumentId.objects.record([{
+                    'type': document.type,
+                    'slug': document.slug,
+                    id_field: doc_id,
+                }])
+            except DatabaseError:
+                logger.exception('Error recording the ID of %s',
+                                 document.slug)
+            return document.slug
+    return None
+
+
 class DetailPageRedirectView(RedirectView):
 
     doc_type_map = {
@@ -246,16 +285,19 @@ class DetailPageRedirectView(RedirectView):
         doc_type = kwargs.pop('doc_type', None)
         if not doc_id or not doc_type:
             return None
+        return caching.REDIRECTS.get_or_compute(
+            ('details', doc_type, doc_id, get_language()),
+            lambda: self.find_url(doc_type, doc_id))
+
+    def find_url(self, doc_type, doc_id):
         search_fields = self.doc_type_map.get(doc_type)
-        for f in search_fields:
-            results = get_documents_by_field(f, [doc_id], rows=1)
-            if results:
-                break
-        if not results:
+        if not search_fields:
+            return None
+        slug = find_slug(doc_type, search_fields, doc_id)
+        if not slug:
             return None
-        doc = [x for x in results][0]
         doc_details = doc_type + '_details'
-        return reverse(doc_details, kwargs={'slug': doc.slug})
+        return reverse(doc_details, kwargs={'slug': slug})
 
     def get(self, request, *args, **kwargs):
         url = self.get_redirect_url(*args, **kwargs)
@@ -285,12 +327,16 @@ class OldEcolexRedirectView(RedirectView):
         search_field = self.doc_id_map.get(doc_type)
         if not doc_type or not search_field:
             return reverse('results')
-        results = get_documents_by_field(search_field, [doc_id], rows=1)
-        if not results:
+        return caching.REDIRECTS.get_or_compute(
+            ('oldecolex', doc_type, doc_id, get_language()),
+            lambda: self.find_url(doc_type, search_field, doc_id))
+
+    def find_url(self, doc_type, search_field, doc_id):
+        slug = find_slug(doc_type, [search_field], doc_id)
+        if not slug:
             return reverse('results')
-        doc = [x for x in results][0]
         doc_details = doc_type + '_details'
-        return reverse(doc_details, kwargs={'slug': doc.slug})
+        return reverse(doc_details, kwargs={'slug': slug})
 
     def get(self, request, *args, **kwargs):
         doc_id = request.GET.get('id')
@@ -304,6 +350,8 @@ class OldEcolexRedirectView(RedirectView):
 
 
 class ExportView(View, ExportValidatorMixin):
+    # exports can be long
+    solr_budget = False
 
     def clean_fields(self, fields):
         if not get_exporter(fields['format']):
@@ -367,17 +415,29 @@ class ExportView(View, ExportValidatorMixin):
             exporter = get_exporter(fields['format'])(self.errors)
             return exporter.get_response(fields['download'], status=400)
 
-        resp = self.search_solr(fields)
+        if fields['count'] == 'yes':
+            def get_count():
+                # None when nothing is found, which is not cached
+                docs = self.search_solr(fields)
+                return len(docs) if docs else None
+
+            count = caching.COUNTS.get_or_compute(
+                ('export', fields['type'], fields['slug'],
+                 fields['updated_after'], fields['start'], fields['rows']),
+                get_count)
+            resp = {'count': count} if count else None
+        else:
+            resp = self.search_solr(fields)
 
         if not resp:
             resp = []
             exporter = get_exporter(fields['format'])(resp)
             return exporter.get_response(fields['download'], status=404)
 
-        if fields['count'] == 'yes':
-            resp = {'count': len(resp)}
-
         exporter = get_exporter(fields['format'])(resp)
         if fields['type'] and not fields['count']:
             exporter.attach_urls(request)
-        return exporter.get_response(fields['download'])
+        response = exporter.get_response(fields['download'])
+        metrics.EXPORT_BYTES.labels(fields['format']).inc(
+            len(response.content))
+        return response
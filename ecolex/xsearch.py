@@ -7,6 +7,7 @@ from operator import and_, or_, itemgetter
 from marshmallow.exceptions import ValidationError
 from scorched import SolrInterface
 from scorched.response import SolrResponse
+from scorched.search import params_from_dict
 from scorched.strings import DismaxString
 from unidecode import unidecode
 from django.conf import settings
@@ -14,8 +15,9 @@ from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
 from django.utils.functional import LazyObject
 from django.utils.html import strip_tags
 
+from . import caching, instrumentation, resilience, singleflight
 from .schema import (
-    SCHEMA_MAP, FIELD_MAP,
+    SCHEMA_MAP, FIELD_MAP, FIELD_PROPERTIES,
     FILTER_FIELDS, FACET_FIELDS, STATS_FIELDS,
     FETCH_FIELDS, BOOST_FIELDS, HIGHLIGHT_FIELDS,
     SORT_FIELD, SORT_FIELD_FALLBACK,
@@ -29,12 +31,63 @@ logger = logging.getLogger(__name__)
 class __DefaultInterface(LazyObject):
     # this exists with the sole purpose to defer reading settings
     def _setup(self):
-        self._wrapped = SolrInterface(settings.SOLR_URI)
+        interface = SolrInterface(settings.SOLR_URI)
+        # the upper bound, requests may have less time left
+        interface.conn.search_timeout = \
+            resilience.get_resilience_settings()['budget']
+        self._wrapped = instrumentation.instrument_scorched(interface)
 
 
 DEFAULT_INTERFACE = __DefaultInterface()
 
 
+# Solr fields read by the schemas' pre_load hooks, by the field they fill
+PRELOAD_FIELDS = {
+    'parties': ('party*',),
+    'title_translations': ('trTitleOfText_*', 'litLongTitle_*',
+                           'litPaperTitleOfText_*'),
+    'link_translations': ('trLinkToFullText_*',),
+}
+
+# fields needed by the views fetching a single document, besides the ones
+# fetched for search results; `None` means all the fields of the schema
+FIELD_PROFILES = {
+    'details': None,
+    'summary': (),
+    'related': ('informea_id',),
+    'participants': ('parties',),
+}
+
+
+def _source_patterns(prop):
+    if prop.name in PRELOAD_FIELDS:
+        return PRELOAD_FIELDS[prop.name]
+    if prop.multilingual:
+        # the plain field is the fallback of the translated ones
+        return (prop.load_from, prop.load_from + '_*')
+    return (prop.load_from,)
+
+
+def _profile_types(doc_type):
+    if doc_type:
+        return ('_', doc_type)
+    return tuple(FIELD_PROPERTIES)
+
+
+def get_profile_fields(profile, doc_type=None):
+    """ The Solr fields (or patterns) to fetch for a fields profile, for
+        documents of `doc_type`, or of any type.
+    """
+    extra = FIELD_PROFILES[profile]
+    return tuple(sorted({
+        pattern
+        for typ in _profile_types(doc_type)
+        for prop in FIELD_PROPERTIES[typ].values()
+        if extra is None or prop.solr_fetch or prop.name in extra
+        for pattern in _source_patterns(prop)
+    }))
+
+
 class Queryer(object):
     SEARCH_OPTIONS = {
         'hl': True,
@@ -59,12 +112,23 @@ class Queryer(object):
     def _execute(self, search, options=None):
         # set search options last or they'll get overwritten
         self.set_search_options(search, options)
-        response = search.execute()
+        params = params_from_dict(**search.options())
+        conn = self.interface.conn
+        endpoint = getattr(conn, 'url', None)
+        parts = (endpoint, params)
+        with instrumentation.solr_call() as call:
+            # identical concurrent queries share one Solr request
+            raw, stale = singleflight.do(parts, lambda: resilience.call(
+                endpoint, parts, lambda: conn.select(list(params))))
+            if stale:
+                resilience.mark_stale()
+            response = SolrResponse.from_json(raw, self.interface._datefields)
+            call.qtime = response.QTime
         return response
 
     def set_search_options(self, search, options=None):
         # hack search.options() to set our custom preferences
-        extra_options = self.SEARCH_OPTIONS
+        extra_options = dict(self.SEARCH_OPTIONS)
         if options:
             extra_options.update(options)
 
@@ -121,30 +185,37 @@ class Queryer(object):
             "(%s)" % reduce(op, (Q(item) for item in data))
         )
 
-    def get(self, **kwargs):
+    def get(self, profile='details', doc_type=None, **kwargs):
+        """ The single document matching the filters in `kwargs`, with the
+            fields of `profile` (see FIELD_PROFILES). `doc_type` is the
+            expected type, documents of other types get the common fields.
+
+            The user's query only highlights the document, it doesn't
+            select it, so a single request is needed.
+        """
         search = (
-            self.interface.query(*self.qargs)
+            self.interface.query()
             .filter(**{
                 k: self.to_query(v)
                 for k, v in kwargs.items()
             })
-            .highlight(self.get_highlight_fields())
+            .field_limit(get_profile_fields(profile, doc_type))
             .paginate(start=0, rows=1)  # fetch a single row
         )
-        response = self._execute(search)
+        if self.qargs:
+            search = search.highlight(tuple(
+                field
+                for typ in _profile_types(doc_type)
+                for f in HIGHLIGHT_FIELDS.values() if f.type == typ
+                for field in f.get_source_fields()
+            ))
+            options = {'hl.q': self.qargs[0]}
+        else:
+            options = {'hl': False}
+
+        response = self._execute(search, options=options)
         if response.result.numFound > 1:
             raise MultipleObjectsReturned()
-        elif response.result.numFound == 0:
-            search = (
-                self.interface.query()
-                .filter(**{
-                    k: self.to_query(v)
-                    for k, v in kwargs.items()
-                })
-                .highlight(self.get_highlight_fields())
-                .paginate(start=0, rows=1)  # fetch a single row
-            )
-            response = self._execute(search)
 
         try:
             result = response.result.docs[0]
@@ -152,7 +223,8 @@ class Queryer(object):
             raise ObjectDoesNotExist()
 
         self._handle_highlight(response)
-        return to_object(result, self.language)
+        with instrumentation.timed('schema'):
+            return to_object(result, self.language)
 
     def _paginate(self, search, page=1, page_size=None):
         if page_size is None:
@@ -464,17 +536,18 @@ class Searcher(Queryer):
 
         return search
 
-    def _execute(self, search):
+    def _execute(self, search, options=None):
         # TODO: this is the place to cache some facets
         do_facets = True
 
         if do_facets:
             search = search.facet_by(self.get_facet_fields())
 
-        response = super()._execute(search)
+        response = super()._execute(search, options=options)
 
         if do_facets:
-            self._handle_facets(response)
+            with instrumentation.timed('facets'):
+                self._handle_facets(response)
 
         return response
 
@@ -542,8 +615,10 @@ class Searcher(Queryer):
         search = self._sort(search, date_sort=date_sort)
 
         response = self._execute(search)
-        self._handle_stats(response)
-        self._handle_highlight(response)
+        with instrumentation.timed('stats'):
+            self._handle_stats(response)
+        with instrumentation.timed('highlight'):
+            self._handle_highlight(response)
         self._handle_suggestions(response)
 
         return SearchResponse(response, language=self.language)
@@ -559,13 +634,21 @@ class Searcher(Queryer):
                 # TODO: overwriting these is not pretty
                 self.facet_fields = facets
 
-        search = (
-            self._search()
-            .paginate(rows=0)
-        )
+        def compute():
+            search = (
+                self._search()
+                .paginate(rows=0)
+            )
+            response = self._execute(search)
+            return SearchResponse(response, language=self.language).facets
 
-        response = self._execute(search)
-        return SearchResponse(response, language=self.language).facets
+        return caching.FACETS.get_or_compute((
+            self.language,
+            self.qargs,
+            sorted(self.get_filters().items()),
+            sorted(self.get_range_filters().items()),
+            self.get_facet_fields(),
+        ), compute)
 
 
 _empty_response = SolrResponse.from_json(repr({
@@ -585,10 +668,13 @@ class QueryResponse(object):
 
         self.count = response.result.numFound
         self.start = response.result.start
-        self.results = [
-            to_object(item, language)
-            for item in response.result.docs
-        ]
+        # time spent in Solr, in milliseconds
+        self.qtime = response.QTime
+        with instrumentation.timed('schema'):
+            self.results = [
+                to_object(item, language)
+                for item in response.result.docs
+            ]
 
     @staticmethod
     def to_object(data, language):
@@ -1,5 +1,7 @@
 import math
+import time
 from collections import OrderedDict
+from functools import partial
 from urllib.parse import urlencode
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
@@ -14,7 +16,9 @@ from django.utils.translation import get_language
 
 from .xforms import SearchForm
 from .xsearch import Queryer, Searcher, SearchResponse, DEFAULT_INTERFACE as si
+from ecolex import caching, instrumentation, pagecache, querylog
 from ecolex.management import definitions
+from ecolex.models import DocumentId
 
 
 class HomepageView(TemplateView):
@@ -24,15 +28,42 @@ class HomepageView(TemplateView):
 homepage_view = HomepageView.as_view()
 
 
+def search_form(querydict):
+    data = querydict.copy()
+    for k in list(data.keys()):
+        if k.endswith('[]'):
+            v = data.pop(k)
+            data.setlist(k[:-2], v)
+    return SearchForm(data)
+
+
+def run_search(form, language, interface=si):
+    """ Returns the search response and the page number for a bound form. """
+    if not form.is_valid():
+        return SearchResponse(), 1
+
+    data = form.cleaned_data.copy()
+
+    page = data.pop('page')
+    sortby = data.pop('sortby')
+
+    date_sort = {
+        form.SORT_DEFAULT: None,
+        form.SORT_ASC: True,
+        form.SORT_DESC: False,
+    }[sortby]
+
+    with instrumentation.timed('prepare'):
+        searcher = Searcher(data, language=language, interface=interface)
+    return searcher.search(page=page, date_sort=date_sort), page
+
+
 class SearchViewMixin(object):
+    interface = si
+
     @cached_property
     def form(self):
-        data = self.request.GET.copy()
-        for k in data.keys():
-            if k.endswith('[]'):
-                v = data.pop(k)
-                data.setlist(k[:-2], v)
-        return SearchForm(data)
+        return search_form(self.request.GET)
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -97,24 +128,11 @@ class SearchResults(SearchViewMixin, PagedViewMixin, TemplateView):
         ctx = super().get_context_data(**kwargs)
 
         form = self.form
-
-        if not form.is_valid():
-            response = SearchResponse()
-            page = 1
-        else:
-            data = form.cleaned_data.copy()
-
-            page = data.pop('page')
-            sortby = data.pop('sortby')
-
-            date_sort = {
-                form.SORT_DEFAULT: None,
-                form.SORT_ASC: True,
-                form.SORT_DESC: False,
-            }[sortby]
-
-            searcher = Searcher(data, language=get_language())
-            response = searcher.search(page=page, date_sort=date_sort)
+        start = time.perf_counter()
+        response, page = run_search(form, get_language(), self.interface)
+        if form.is_valid():
+            querylog.log_search(form, get_language(), page, response,
+                                time.perf_counter() - start)
 
         form.set_facet_data(response.facets)
 
@@ -137,6 +155,18 @@ class SearchResults(SearchViewMixin, PagedViewMixin, TemplateView):
 
 
 class DetailsView(SearchViewMixin, TemplateView):
+    # cache the rendered page for anonymous visitors, see ecolex.pagecache
+    page_cache = False
+    # the fields of the document needed by the template, see
+    # xsearch.FIELD_PROFILES
+    fields_profile = 'details'
+
+    def get_page_key(self, slug):
+        if not self.page_cache or self.request.user.is_authenticated():
+            return None
+        return pagecache.page_key(type(self).__name__, slug, get_language(),
+                                  self.request.GET)
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         slug = kwargs['slug']
@@ -150,34 +180,60 @@ class DetailsView(SearchViewMixin, TemplateView):
         queryer = Queryer(data, language=get_language())
 
         try:
-            result = queryer.get(slug=slug)
+            result = queryer.get(profile=self.fields_profile,
+                                 doc_type=getattr(self, 'doc_type', None),
+                                 slug=slug)
         except ObjectDoesNotExist:
             raise Http404()
         except MultipleObjectsReturned:
             # TODO. this is either data or code error.
             raise
 
+        querylog.log_details(result.type, slug, get_language())
         ctx['document'] = result
         return ctx
 
     def get(self, request, *args, **kwargs):
+        key = self.get_page_key(kwargs['slug'])
+        if key:
+            response = pagecache.get_page(request, key)
+            if response is not None:
+                querylog.log_details(self.doc_type, kwargs['slug'],
+                                     get_language())
+                return response
+
         context = self.get_context_data(**kwargs)
         document = context['document']
         if hasattr(self, 'doc_type') and document.type != self.doc_type:
             url = reverse('{}_details'.format(document.type),
                           kwargs={'slug': document.slug})
             return HttpResponseRedirect(url)
-        return super().get(request, *args, **kwargs)
+        if not key:
+            return self.render_to_response(context)
+
+        etag, last_modified = pagecache.page_headers(
+            type(self).__name__, kwargs['slug'], get_language(),
+            request.GET, getattr(document, 'updated_at', None))
+        response = pagecache.not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        response = self.render_to_response(context)
+        pagecache.set_headers(response, etag, last_modified)
+        response.add_post_render_callback(partial(
+            pagecache.store_page, key, etag=etag, last_modified=last_modified))
+        return response
 
 
 class DecisionDetails(DetailsView):
     template_name = 'details/decision.html'
     doc_type = definitions.COP_DECISION
+    page_cache = True
 
 
 class TreatyDetails(DetailsView):
     template_name = 'details/treaty.html'
     doc_type = definitions.TREATY
+    page_cache = True
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -193,28 +249,32 @@ class TreatyDetails(DetailsView):
 class LiteratureDetails(DetailsView):
     template_name = 'details/literature.html'
     doc_type = definitions.LITERATURE
+    page_cache = True
 
 
 class CourtDecisionDetails(DetailsView):
     template_name = 'details/court_decision.html'
     doc_type = definitions.COURT_DECISION
+    page_cache = True
 
 
 class LegislationDetails(DetailsView):
     template_name = 'details/legislation.html'
     doc_type = definitions.LEGISLATION
+    page_cache = True
 
 
-# TODO: it's wasteful to fetch all treaty details for this view
 class TreatyParticipants(TreatyDetails):
     template_name = 'details_participants.html'
+    fields_profile = 'participants'
 
 
-# this extends DetailsView just because we need access to the parent object,
-# which is wasteful. TODO: write a view that fetches only the needed fields.
+# this extends DetailsView for access to the parent object, of which only
+# the fields needed to find the related ones are fetched.
 class RelatedObjectsView(PagedViewMixin, DetailsView):
     # this is looked up in the object's OTHER_REFERENCES
     related_type = None
+    fields_profile = 'related'
 
     @cached_property
     def __query_dict(self):
@@ -272,6 +332,7 @@ class RelatedObjectsView(PagedViewMixin, DetailsView):
 class RelatedLegislation(DetailsView):
     related_type = 'legislation'
     template_name = 'details_legislations.html'
+    fields_profile = 'related'
 
     def fetch_results(self, lookups):
         queryer = Queryer({}, language=get_language())
@@ -344,7 +405,7 @@ class DocumentDeleteSearch(SearchViewMixin, TemplateView):
                 data = {'type': ''}
                 queryer = Queryer(data, language=get_language())
                 try:
-                    record = queryer.get(slug=slug)
+                    record = queryer.get(profile='summary', slug=slug)
                 except ObjectDoesNotExist:
                     record = None
 
@@ -358,6 +419,9 @@ class DocumentDeleteSearch(SearchViewMixin, TemplateView):
         if slug:
             si.delete_by_query(query=si.Q(slug=slug))
             si.commit()
+            DocumentId.objects.filter(slug=slug).delete()
+            pagecache.invalidate([slug])
+            caching.invalidate_search()
             ctx['message_level'] = 'success'
             ctx['message'] = 'Successfully deleted record!'
         else:
@@ -378,6 +442,9 @@ class DocumentDelete(View):
         if slug:
             si.delete_by_query(query=si.Q(slug=slug))
             si.commit()
+            DocumentId.objects.filter(slug=slug).delete()
+            pagecache.invalidate([slug])
+            caching.invalidate_search()
             messages.success(request, 'Record deleted successfully!')
         else:
             messages.error(request, "Record slug couldn't be found!")